@@ -64,7 +64,10 @@ class ReactionFactory(factory.DjangoModelFactory):
         article = kwargs.pop('article', None)
         if article:
             article.last_reaction = reaction
-            article.save()
+            article.last_reaction_position = max(
+                article.last_reaction_position, reaction.position)
+            article.save(
+                update_fields=['last_reaction', 'last_reaction_position'])
         return reaction
 
 
@@ -1,21 +1,23 @@
 # coding: utf-8
 
-from django.contrib.syndication.views import Feed
-
 from django.utils.feedgenerator import Atom1Feed
 
-from .models import Article
+from zds.utils.feeds import CachedFeed
+from zds.utils.models import PublishedContent
 
 
-class LastArticlesFeedRSS(Feed):
+class LastArticlesFeedRSS(CachedFeed):
     title = "Articles sur Zeste de Savoir"
     link = "/articles/"
     description = "Les derniers articles parus sur Zeste de Savoir."
 
+    cache_group = 'article'
+
     def items(self):
-        return Article.objects\
-            .filter(sha_public__isnull=False)\
-            .order_by('-pubdate')[:5]
+        return PublishedContent.objects\
+            .filter(article__isnull=False)\
+            .order_by('-pubdate')\
+            .prefetch_related('authors')[:5]
 
     def item_title(self, item):
         return item.title
@@ -35,7 +37,7 @@ class LastArticlesFeedRSS(Feed):
         return authors
 
     def item_link(self, item):
-        return item.get_absolute_url()
+        return item.get_absolute_url_online()
 
 
 class LastArticlesFeedATOM(LastArticlesFeedRSS):
@@ -4,8 +4,8 @@ from cStringIO import StringIO
 from django.conf import settings
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.db import models
+from django.dispatch import receiver
 from math import ceil
-from git import Repo
 import os
 import string
 import uuid
@@ -24,10 +24,14 @@ import json as json_writer
 from django.contrib.auth.models import User
 from django.utils import timezone
 
-from zds.utils import get_current_user
+from zds.utils import get_current_user, next_position, exclude_counters
 from zds.utils import slugify
-from zds.utils.articles import export_article, get_blob
-from zds.utils.models import SubCategory, Comment, Licence
+from zds.utils.articles import export_article
+from zds.utils.feeds import invalidate_feeds
+from zds.utils.manifests import get_manifest
+from zds.utils.models import SubCategory, Comment, Licence, publish_content, \
+    PublishedContent, update_published_lists
+from zds.utils.read_markers import buffer_read, get_buffered_reads
 from django.core.urlresolvers import reverse
 
 
@@ -83,6 +87,8 @@ class Article(models.Model):
     last_reaction = models.ForeignKey('Reaction', blank=True, null=True,
                                       related_name='last_reaction',
                                       verbose_name='Derniere réaction')
+    last_reaction_position = models.IntegerField(
+        'Position de la dernière réaction', default=0)
     is_locked = models.BooleanField('Est verrouillé', default=False)
 
     licence = models.ForeignKey(Licence,
@@ -139,11 +145,22 @@ class Article(models.Model):
             return None
 
     def load_json_for_public(self):
-        repo = Repo(self.get_path())
-        manarticle = get_blob(repo.commit(self.sha_public).tree, 'manifest.json')
-        data = json_reader.loads(manarticle)
-
-        return data
+        return get_manifest(self.get_path(), self.sha_public)
+
+    def update_published_content(self):
+        """Write the listing of the public version of the article."""
+        article_version = self.load_json_for_public()
+        html_path = os.path.join(self.get_path(),
+                                 article_version['text'] + '.html')
+        text = u''
+        if os.path.isfile(html_path):
+            with open(html_path, 'r') as html_file:
+                text = html_file.read().decode('utf-8')
+        return publish_content(self,
+                               article_version['title'],
+                               article_version.get('description',
+                                                   self.description),
+                               text)
 
     def load_dic(self, article_version):
         article_version['pk'] = self.pk
@@ -194,12 +211,18 @@ class Article(models.Model):
                 name = os.path.join(root, old.name)
                 os.remove(name)
 
+        # the position counter is only written by next_reaction_position()
+        kwargs = exclude_counters(self, ['last_reaction_position'], kwargs)
         super(Article, self).save(*args, **kwargs)
 
     def get_reaction_count(self):
         """Return the number of reactions in the article."""
         return Reaction.objects.filter(article__pk=self.pk).count()
 
+    def next_reaction_position(self):
+        """Allocate the position of a new reaction on the article."""
+        return next_position(self, 'last_reaction_position')
+
     def get_last_reaction(self):
         """Gets the last answer in the thread, if any."""
         try:
@@ -218,8 +241,22 @@ class Article(models.Model):
             .order_by('pubdate')\
             .first()
 
+    def buffered_read_reaction(self):
+        """Return the last reaction read by the user if its marker is still in
+        the write-behind buffer, None otherwise."""
+        user = get_current_user()
+        if user is None:
+            return None
+        pk = get_buffered_reads('article', user.pk).get(self.pk)
+        if pk is None:
+            return None
+        return Reaction.objects.filter(pk=pk).first()
+
     def last_read_reaction(self):
         """Return the last post the user has read."""
+        buffered = self.buffered_read_reaction()
+        if buffered is not None:
+            return buffered
         try:
             return ArticleRead.objects\
                 .select_related()\
@@ -231,9 +268,11 @@ class Article(models.Model):
     def first_unread_reaction(self):
         """Return the first reaction the user has unread."""
         try:
-            last_reaction = ArticleRead.objects\
-                .filter(article=self, user=get_current_user())\
-                .latest('reaction__pubdate').reaction
+            last_reaction = self.buffered_read_reaction()
+            if last_reaction is None:
+                last_reaction = ArticleRead.objects\
+                    .filter(article=self, user=get_current_user())\
+                    .latest('reaction__pubdate').reaction
 
             next_reaction = Reaction.objects.filter(
                 article__pk=self.pk,
@@ -290,9 +329,9 @@ def get_old_field_value(instance, field, manager):
 
 
 def get_last_articles():
-    return Article.objects.all()\
-        .exclude(sha_public__isnull=True)\
-        .exclude(sha_public__exact='')\
+    return PublishedContent.objects\
+        .filter(article__isnull=False)\
+        .select_related('article')\
         .order_by('-pubdate')[:5]
 
 
@@ -365,6 +404,10 @@ def never_read(article, user=None):
     if user is None:
         user = get_current_user()
 
+    buffered = get_buffered_reads('article', user.pk).get(article.pk)
+    if buffered is not None:
+        return buffered != article.last_reaction_id
+
     return ArticleRead.objects\
         .filter(reaction=article.last_reaction, article=article, user=user)\
         .count() == 0
@@ -373,6 +416,9 @@ def never_read(article, user=None):
 def mark_read(article):
     """Mark a article as read for the user."""
     if article.last_reaction is not None:
+        if buffer_read('article', get_current_user().pk, article.pk,
+                       article.last_reaction_id):
+            return
         ArticleRead.objects.filter(
             article=article,
             user=get_current_user()).delete()
@@ -425,3 +471,18 @@ class Validation(models.Model):
 
     def is_reject(self):
         return self.status == 'REJECTED'
+
+
+@receiver(models.signals.post_save, sender=Article)
+@receiver(models.signals.post_delete, sender=Article)
+def article_changed(sender, **kwargs):
+    """Forget the cached feeds of the articles."""
+    invalidate_feeds('article')
+
+
+@receiver(models.signals.m2m_changed, sender=Article.authors.through)
+@receiver(models.signals.m2m_changed, sender=Article.subcategory.through)
+def article_lists_changed(sender, **kwargs):
+    """Keep the authors and the subcategories of the listing of a published
+    article up to date."""
+    update_published_lists(**kwargs)
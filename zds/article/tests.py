@@ -375,6 +375,22 @@ class ArticleTests(TestCase):
             follow=True)
         self.assertEqual(result.status_code, 200)
 
+    def test_manifest_cache(self):
+        """Test the public manifest, read from the repository only once."""
+        article = Article.objects.get(pk=self.article.pk)
+        data = article.load_json_for_public()
+        self.assertEqual(data['title'], article.title)
+        data['title'] = u'Modifié'
+
+        # the repository isn't needed anymore for this version
+        moved_path = article.get_path() + '-moved'
+        shutil.move(article.get_path(), moved_path)
+        try:
+            data = article.load_json_for_public()
+        finally:
+            shutil.move(moved_path, article.get_path())
+        self.assertEqual(data['title'], article.title)
+
     def test_workflow_licence(self):
         '''Ensure the behavior of licence on articles'''
 
@@ -13,7 +13,6 @@ except:
 import json as json_writer
 import os
 import shutil
-import zipfile
 
 from django.conf import settings
 from django.contrib import messages
@@ -34,11 +33,14 @@ from zds.member.decorator import can_write_and_read_now
 from zds.member.views import get_client_ip
 from zds.utils import render_template
 from zds.utils import slugify
+from zds.utils.manifests import get_manifest
+from zds.utils.archives import zip_response
+from zds.utils.repositories import get_repo, release_repo
 from zds.utils.articles import *
 from zds.utils.mps import send_mp
-from zds.utils.models import SubCategory, Category, CommentLike, \
-    CommentDislike, Alert, Licence
-from zds.utils.paginator import paginator_range
+from zds.utils.models import SubCategory, Category, Alert, Licence, \
+    load_votes, PublishedContent, unpublish_content
+from zds.utils.paginator import paginator_range, PositionPaginator
 from zds.utils.templatetags.emarkdown import emarkdown
 
 from .forms import ArticleForm, ReactionForm
@@ -55,28 +57,33 @@ def index(request):
     except (KeyError, Http404):
         tag = None
 
-    if tag is None:
-        articles = Article.objects\
-            .filter(sha_public__isnull=False).exclude(sha_public="")\
-            .order_by('-pubdate')\
-            .all()
-    else:
+    articles = PublishedContent.objects\
+        .filter(article__isnull=False)\
+        .select_related('article')\
+        .order_by('-pubdate')
+    if tag is not None:
         # The tag isn't None and exist in the system. We can use it to retrieve
         # all articles in the subcategory specified.
-        articles = Article.objects\
-            .filter(sha_public__isnull=False, subcategory__in=[tag])\
-            .exclude(sha_public="").order_by('-pubdate')\
-            .all()
-    
-    article_versions = []
-    for article in articles:
-        article_version = article.load_json_for_public()
-        article_version = article.load_dic(article_version)
-        article_versions.append(article_version) 
+        articles = articles.filter(subcategory__in=[tag])
+
+    # Paginator
+    paginator = Paginator(articles, settings.ARTICLES_PER_PAGE)
+    page = request.GET.get('page')
+    try:
+        shown_articles = paginator.page(page)
+        page = int(page)
+    except PageNotAnInteger:
+        shown_articles = paginator.page(1)
+        page = 1
+    except EmptyPage:
+        shown_articles = paginator.page(paginator.num_pages)
+        page = paginator.num_pages
 
     return render_template('article/index.html', {
-        'articles': article_versions,
+        'articles': shown_articles,
         'tag': tag,
+        'pages': paginator_range(page, paginator.num_pages),
+        'nb': page,
     })
 
 
@@ -98,16 +105,15 @@ def view(request, article_pk, article_slug):
         sha = article.sha_draft
 
     # Find the good manifest file
-    repo = Repo(article.get_path())
+    repo = get_repo(article.get_path())
 
     # Load the article.
     try:
-        manifest = get_blob(repo.commit(sha).tree, 'manifest.json')
+        article_version = get_manifest(article.get_path(), sha)
     except:
         sha = article.sha_draft
-        manifest = get_blob(repo.commit(sha).tree, 'manifest.json')
+        article_version = get_manifest(article.get_path(), sha)
 
-    article_version = json_reader.loads(manifest)
     article_version['txt'] = get_blob(repo.commit(sha).tree, article_version['text'])
     article_version = article.load_dic(article_version)
 
@@ -148,40 +154,33 @@ def view_online(request, article_pk, article_slug):
 
     # Find all reactions of the article.
     reactions = Reaction.objects\
-        .filter(article__pk=article.pk)\
-        .order_by('position')\
-        .all()
+        .filter(article__pk=article.pk)
 
     # Retrieve pk of the last reaction. If there aren't reactions
     # for the article, we initialize this last reaction at 0.
     last_reaction_pk = 0
+    last_reaction_position = 0
     if article.last_reaction:
         last_reaction_pk = article.last_reaction.pk
+        last_reaction_position = article.last_reaction.position
 
     # Handle pagination.
-    paginator = Paginator(reactions, settings.POSTS_PER_PAGE)
+    paginator = PositionPaginator(reactions, settings.POSTS_PER_PAGE,
+                                  last_reaction_position)
 
     try:
         page_nbr = int(request.GET['page'])
     except KeyError:
         page_nbr = 1
 
+    # Show the last reaction of the previous page too.
     try:
-        reactions = paginator.page(page_nbr)
+        res = paginator.page(page_nbr)
     except PageNotAnInteger:
-        reactions = paginator.page(1)
+        res = paginator.page(1)
     except EmptyPage:
         raise Http404
-
-    res = []
-    if page_nbr != 1:
-        # Show the last reaction of the previous page
-        last_page = paginator.page(page_nbr - 1).object_list
-        last_reaction = (last_page)[len(last_page) - 1]
-        res.append(last_reaction)
-
-    for reaction in reactions:
-        res.append(reaction)
+    load_votes(res, request.user)
 
     # Build form to send a reaction for the current article.
     form = ReactionForm(article, request.user)
@@ -380,20 +379,13 @@ def edit(request):
 def find_article(request, pk_user):
     """Find an article from his author."""
     user = get_object_or_404(User, pk=pk_user)
-    articles = Article.objects\
-        .filter(authors__in=[user], sha_public__isnull=False).exclude(sha_public="")\
-        .order_by('-pubdate')\
-        .all()
-    
-    article_versions = []
-    for article in articles:
-        article_version = article.load_json_for_public()
-        article_version = article.load_dic(article_version)
-        article_versions.append(article_version) 
+    articles = PublishedContent.objects\
+        .filter(article__isnull=False, authors__in=[user])\
+        .select_related('article')\
+        .order_by('-pubdate')
 
-    # Paginator
     return render_template('article/find.html', {
-        'articles': article_versions, 'usr': user,
+        'articles': articles, 'usr': user,
     })
 
 
@@ -406,10 +398,12 @@ def maj_repo_article(
         action=None):
 
     if action == 'del':
+        release_repo(old_slug_path)
         shutil.rmtree(old_slug_path)
     else:
         if action == 'maj':
             if old_slug_path != new_slug_path:
+                release_repo(old_slug_path)
                 shutil.move(old_slug_path, new_slug_path)
                 repo = Repo(new_slug_path)
             msg = 'Modification de l\'article'
@@ -441,33 +435,15 @@ def maj_repo_article(
         article.sha_draft = com.hexsha
         article.save()
 
-def insert_into_zip(zip_file, git_tree):
-    """recursively add files from a git_tree to a zip archive"""
-    for blob in git_tree.blobs: # first, add files :
-        zip_file.writestr(blob.path, blob.data_stream.read())
-    if len(git_tree.trees) is not 0: # then, recursively add dirs :
-        for subtree in git_tree.trees:
-            insert_into_zip(zip_file, subtree)
-
-
 def download(request):
     """Download a tutorial."""
     article = get_object_or_404(Article, pk=request.GET["article"])
     repo_path = os.path.join(settings.REPO_ARTICLE_PATH, article.get_phy_slug())
-    repo = Repo(repo_path)
-    sha = article.sha_draft
+    repo = get_repo(repo_path)
     if 'online' in request.GET and article.sha_public is not None:
-        sha = article.sha_public
-    zip_path = os.path.join('/tmp/',article.slug+'.zip')
-    zip_file = zipfile.ZipFile(zip_path, 'w')
-    insert_into_zip(zip_file, repo.commit(sha).tree)
-    zip_file.close()
-    response = HttpResponse(open(zip_path , "rb").read(),
-                            content_type="application/zip")
-    response["Content-Disposition"] = \
-        "attachment; filename={0}.zip".format(article.slug)
-    os.remove(zip_path) # TODO: caching (at least for the public version?)
-    return response
+        return zip_response(request, repo, article.sha_public,
+                            article.slug, public=True)
+    return zip_response(request, repo, article.sha_draft, article.slug)
 
 # Validation
 
@@ -561,6 +537,7 @@ def modify(request):
             article.sha_validation = validation.version
             article.pubdate = None
             article.save()
+            unpublish_content(article)
 
             return redirect(
                 article.get_absolute_url() +
@@ -590,6 +567,7 @@ def modify(request):
                 article.sha_public = validation.version
                 article.sha_validation = None
                 article.save()
+                article.update_published_content()
 
                 # send feedback
                 for author in article.authors.all():
@@ -875,7 +853,7 @@ def history(request, article_pk, article_slug):
     if not article_slug == slugify(article.title):
         return redirect(article.get_absolute_url())
 
-    repo = Repo(article.get_path())
+    repo = get_repo(article.get_path())
 
     logs = repo.head.reference.log()
     logs = sorted(logs, key=attrgetter('time'), reverse=True)
@@ -889,7 +867,7 @@ def history(request, article_pk, article_slug):
 
 def MEP(article, sha):
     # convert markdown file to html file
-    repo = Repo(article.get_path())
+    repo = get_repo(article.get_path())
     manifest = get_blob(repo.commit(sha).tree, 'manifest.json')
 
     article_version = json_reader.loads(manifest)
@@ -907,6 +885,7 @@ def MEP(article, sha):
 
 @can_write_and_read_now
 @login_required
+@transaction.atomic
 def answer(request):
     """Adds an answer from a user to an article."""
     try:
@@ -933,9 +912,10 @@ def answer(request):
         last_reaction_pk = 0
     
     # Retrieve lasts reactions of the current topic.
-    reactions = Reaction.objects.filter(article=article) \
-    .prefetch_related() \
-    .order_by("-pubdate")[:settings.POSTS_PER_PAGE]
+    reactions = list(Reaction.objects.filter(article=article)
+                     .prefetch_related()
+                     .order_by("-pubdate")[:settings.POSTS_PER_PAGE])
+    load_votes(reactions, request.user)
 
 
     # User would like preview his post or post a new reaction on the article.
@@ -968,7 +948,7 @@ def answer(request):
                 reaction.text = data['text']
                 reaction.text_html = emarkdown(data['text'])
                 reaction.pubdate = datetime.now()
-                reaction.position = article.get_reaction_count() + 1
+                reaction.position = article.next_reaction_position()
                 reaction.ip_address = get_client_ip(request)
                 reaction.save()
 
@@ -1167,29 +1147,7 @@ def like_reaction(request):
     user = request.user
 
     if reaction.author.pk != request.user.pk:
-        # Making sure the user is allowed to do that
-        if CommentLike.objects.filter(user__pk=user.pk,
-                                      comments__pk=reaction_pk).count() == 0:
-            like = CommentLike()
-            like.user = user
-            like.comments = reaction
-            reaction.like = reaction.like + 1
-            reaction.save()
-            like.save()
-            if CommentDislike.objects.filter(user__pk=user.pk,
-                                             comments__pk=reaction_pk) \
-                    .count() > 0:
-                CommentDislike.objects.filter(
-                    user__pk=user.pk,
-                    comments__pk=reaction_pk).all().delete()
-                reaction.dislike = reaction.dislike - 1
-                reaction.save()
-        else:
-            CommentLike.objects.filter(
-                user__pk=user.pk,
-                comments__pk=reaction_pk).all().delete()
-            reaction.like = reaction.like - 1
-            reaction.save()
+        reaction.toggle_like(user)
 
     resp['upvotes'] = reaction.like
     resp['downvotes'] = reaction.dislike
@@ -1214,30 +1172,7 @@ def dislike_reaction(request):
     user = request.user
 
     if reaction.author.pk != request.user.pk:
-        # Making sure the user is allowed to do that
-        if CommentDislike.objects.filter(user__pk=user.pk,
-                                         comments__pk=reaction_pk) \
-                .count() == 0:
-            dislike = CommentDislike()
-            dislike.user = user
-            dislike.comments = reaction
-            reaction.dislike = reaction.dislike + 1
-            reaction.save()
-            dislike.save()
-            if CommentLike.objects.filter(user__pk=user.pk,
-                                          comments__pk=reaction_pk) \
-                    .count() > 0:
-                CommentLike.objects.filter(
-                    user__pk=user.pk,
-                    comments__pk=reaction_pk).all().delete()
-                reaction.like = reaction.like - 1
-                reaction.save()
-        else:
-            CommentDislike.objects.filter(
-                user__pk=user.pk,
-                comments__pk=reaction_pk).all().delete()
-            reaction.dislike = reaction.dislike - 1
-            reaction.save()
+        reaction.toggle_dislike(user)
 
     resp['upvotes'] = reaction.like
     resp['downvotes'] = reaction.dislike
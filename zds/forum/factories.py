@@ -45,5 +45,6 @@ class PostFactory(factory.DjangoModelFactory):
         topic = kwargs.pop('topic', None)
         if topic:
             topic.last_message = post
-            topic.save()
+            topic.last_position = max(topic.last_position, post.position)
+            topic.save(update_fields=['last_message', 'last_position'])
         return post
@@ -1,20 +1,20 @@
 # coding: utf-8
 
-from django.contrib.syndication.views import Feed
-
 from django.utils.feedgenerator import Atom1Feed
 from django.conf import settings
 
-from zds.utils.templatetags.emarkdown import emarkdown
+from zds.utils.feeds import CachedFeed
 
-from .models import Post, Topic
+from .models import Post, Topic, get_readable_forums
 
 
-class LastPostsFeedRSS(Feed):
+class LastPostsFeedRSS(CachedFeed):
     title = u'Derniers messages sur Zeste de Savoir'
     link = '/forums/'
     description = (u'Les derniers messages '
         u'parus sur le forum de Zeste de Savoir.')
+    cache_group = 'forum'
+    cache_parameters = ('forum', 'tag')
     
     def get_object(self, request):
         obj = {}
@@ -26,23 +26,23 @@ class LastPostsFeedRSS(Feed):
 
     def items(self, obj):
         if "forum" in obj and "tag" in obj:
-            posts = Post.objects.filter(topic__forum__group__isnull=True,
+            posts = Post.objects.filter(topic__forum__in=get_readable_forums(),
                                         topic__forum__pk=obj['forum'],
                                         topic__tags__pk__in=[obj['tag']])\
             .order_by('-pubdate')
         elif "forum" in obj and "tag" not in obj:
-            posts = Post.objects.filter(topic__forum__group__isnull=True,
+            posts = Post.objects.filter(topic__forum__in=get_readable_forums(),
                                         topic__forum__pk=obj['forum'])\
             .order_by('-pubdate')
         elif "forum" not in obj and "tag" in obj:
-            posts = Post.objects.filter(topic__forum__group__isnull=True,
+            posts = Post.objects.filter(topic__forum__in=get_readable_forums(),
                                         topic__tags__pk__in=[obj['tag']])\
             .order_by('-pubdate')
         if "forum" not in obj and "tag" not in obj:
-            posts = Post.objects.filter(topic__forum__group__isnull=True)\
+            posts = Post.objects.filter(topic__forum__in=get_readable_forums())\
                 .order_by('-pubdate')
 
-        return posts[:settings.POSTS_PER_PAGE]
+        return posts.select_related('topic', 'author')[:settings.POSTS_PER_PAGE]
 
     def item_title(self, item):
         return u'{}, message #{}'.format(item.topic.title, item.pk)
@@ -51,8 +51,7 @@ class LastPostsFeedRSS(Feed):
         return item.pubdate
 
     def item_description(self, item):
-        # TODO: Use cached Markdown when implemented
-        return emarkdown(item.text)
+        return item.text_html
 
     def item_author_name(self, item):
         return item.author.username
@@ -69,10 +68,12 @@ class LastPostsFeedATOM(LastPostsFeedRSS):
     subtitle = LastPostsFeedRSS.description
 
 
-class LastTopicsFeedRSS(Feed):
+class LastTopicsFeedRSS(CachedFeed):
     title = u'Derniers sujets sur Zeste de Savoir'
     link = '/forums/'
     description = u'Les derniers sujets créés sur le forum de Zeste de Savoir.'
+    cache_group = 'forum'
+    cache_parameters = ('forum', 'tag')
     
     def get_object(self, request):
         obj = {}
@@ -84,23 +85,23 @@ class LastTopicsFeedRSS(Feed):
 
     def items(self, obj):
         if "forum" in obj and "tag" in obj:
-            topics = Topic.objects.filter(forum__group__isnull=True,
+            topics = Topic.objects.filter(forum__in=get_readable_forums(),
                                           forum__pk=obj['forum'],
                                           tags__pk__in=[obj['tag']])\
             .order_by('-pubdate')
         elif "forum" in obj and "tag" not in obj:
-            topics = Topic.objects.filter(forum__group__isnull=True,
+            topics = Topic.objects.filter(forum__in=get_readable_forums(),
                                           forum__pk=obj['forum'])\
             .order_by('-pubdate')
         elif "forum" not in obj and "tag" in obj:
-            topics = Topic.objects.filter(forum__group__isnull=True,
+            topics = Topic.objects.filter(forum__in=get_readable_forums(),
                                           tags__pk__in=[obj['tag']])\
             .order_by('-pubdate')
         if "forum" not in obj and "tag" not in obj:
-            topics = Topic.objects.filter(forum__group__isnull=True)\
+            topics = Topic.objects.filter(forum__in=get_readable_forums())\
                 .order_by('-pubdate')
 
-        return topics[:settings.POSTS_PER_PAGE]
+        return topics.select_related('forum', 'author')[:settings.POSTS_PER_PAGE]
     def item_pubdate(self, item):
         return item.pubdate
 
@@ -0,0 +1,36 @@
+# coding: utf-8
+
+from django.core.management.base import NoArgsCommand
+from django.db import transaction
+from django.db.models import Count, Max
+
+from zds.forum.models import Forum, Topic, TagStats
+
+
+class Command(NoArgsCommand):
+    help = u"Computes again the topic, post and position counters of every forum and topic, and the tag statistics."
+
+    @transaction.atomic
+    def handle_noargs(self, **options):
+        topics = Topic.objects \
+            .annotate(nb_posts=Count('post'), last=Max('post__position')) \
+            .values('pk', 'nb_posts', 'last')
+        for topic in topics:
+            Topic.objects.filter(pk=topic['pk']).update(
+                post_count=topic['nb_posts'],
+                last_position=topic['last'] or 0)
+
+        for forum in Forum.objects.all():
+            forum.update_counters()
+            self.stdout.write(u"{0} : {1} sujet(s), {2} message(s)".format(
+                forum.title, forum.topic_count, forum.post_count))
+
+        TagStats.objects.all().delete()
+        stats = Topic.objects \
+            .filter(tags__isnull=False) \
+            .values('forum', 'tags') \
+            .annotate(nb_topics=Count('pk'))
+        TagStats.objects.bulk_create([
+            TagStats(forum_id=stat['forum'], tag_id=stat['tags'],
+                     topic_count=stat['nb_topics'])
+            for stat in stats])
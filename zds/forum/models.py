@@ -1,20 +1,30 @@
 # coding: utf-8
 
+from collections import namedtuple
+
 from django.conf import settings
 from django.db import models
+from django.db.models import F, Q, Sum
+from django.dispatch import receiver
 from zds.utils import slugify
 from math import ceil
+import hashlib
+import operator
 import os
 import string
+import threading
 import uuid
 
 from django.contrib.auth.models import Group, User
+from django.core.cache import cache
 from django.utils import timezone
 from django.core.urlresolvers import reverse
 from django.utils.encoding import smart_text
 
-from zds.utils import get_current_user
+from zds.utils import get_current_user, next_position, exclude_counters
+from zds.utils.feeds import invalidate_feeds
 from zds.utils.models import Comment, Tag
+from zds.utils.read_markers import buffer_read, get_buffered_reads
 
 
 def sub_tag(g):
@@ -23,6 +33,10 @@ def sub_tag(g):
     return u"{0}".format(start + end)
 
 
+READABLE_FORUMS_VERSION_KEY = 'readable_forums_version'
+FORUM_MENU_VERSION_KEY = 'forum_menu_version'
+
+
 def image_path_forum(instance, filename):
     """Return path to an image."""
     ext = filename.split('.')[-1]
@@ -82,10 +96,25 @@ class Forum(models.Model):
 
     slug = models.SlugField(max_length=80, unique=True)
 
+    # Denormalized counters, kept up to date by the signals at the end of
+    # this module and rebuilt by the `rebuild_forum_counters` command.
+    topic_count = models.IntegerField('Nombre de sujets', default=0)
+    post_count = models.IntegerField('Nombre de messages', default=0)
+    last_post = models.ForeignKey('Post', null=True, blank=True,
+                                  related_name='last_post_forum',
+                                  on_delete=models.SET_NULL,
+                                  verbose_name='Dernier message')
+
     def __unicode__(self):
         """Textual form of a forum."""
         return self.title
 
+    def save(self, *args, **kwargs):
+        # the counters are only written by the signals and update_counters()
+        kwargs = exclude_counters(
+            self, ['topic_count', 'post_count', 'last_post'], kwargs)
+        super(Forum, self).save(*args, **kwargs)
+
     def get_absolute_url(self):
         return reverse('zds.forum.views.details',
                        kwargs={'cat_slug': self.category.slug,
@@ -93,41 +122,51 @@ class Forum(models.Model):
 
     def get_topic_count(self):
         """Gets the number of threads in the forum."""
-        return Topic.objects.all().filter(forum__pk=self.pk).count()
+        return self.topic_count
 
     def get_post_count(self):
         """Gets the number of posts for a forum."""
-        return Post.objects.filter(topic__forum=self).count()
+        return self.post_count
 
     def get_last_message(self):
         """Gets the last message on the forum, if there are any."""
-        try:
-            return Post.objects.all().filter(
-                topic__forum__pk=self.pk).order_by('-pubdate')[0]
-        except IndexError:
-            return None
+        return self.last_post
+
+    def update_counters(self):
+        """Computes again the denormalized counters from the topics and
+        posts of the forum."""
+        self.topic_count = Topic.objects.filter(forum__pk=self.pk).count()
+        self.post_count = Post.objects.filter(topic__forum__pk=self.pk).count()
+        self.last_post = Post.objects\
+            .filter(topic__forum__pk=self.pk)\
+            .order_by('-pubdate')\
+            .first()
+        self.save(update_fields=['topic_count', 'post_count', 'last_post'])
 
     def can_read(self, user):
         """Checks if the forum can be read by the user."""
-        # TODO These prints is used to debug this method. Remove them later.
+        return self.pk in get_readable_forums(user)
 
-        if self.group.count() == 0:
-            return True
-        else:
-            if user.is_authenticated():
-                groups = Group.objects.filter(user=user).all()
-                return Forum.objects.filter(
-                    group__in=groups,
-                    pk=self.pk).exists()
-            else:
-                return False
-
-    def is_read(self):
+    def is_read(self, user=None):
         """Checks if there are topics never read in the forum."""
-        for current_topic in Topic.objects.filter(forum=self).all():
-            if never_read(current_topic):
-                return False
-        return True
+        if user is None:
+            user = get_current_user()
+
+        read_topics = set(TopicRead.objects
+                          .filter(topic__forum=self,
+                                  user=user,
+                                  post=F('topic__last_message'))
+                          .values_list('topic', flat=True))
+        buffered = get_buffered_reads('topic', user.pk)
+        if buffered:
+            for pk, last_message in Topic.objects\
+                    .filter(forum=self, pk__in=buffered.keys())\
+                    .values_list('pk', 'last_message'):
+                if buffered[pk] == last_message:
+                    read_topics.add(pk)
+                else:
+                    read_topics.discard(pk)
+        return len(read_topics) >= self.topic_count
 
 class Topic(models.Model):
 
@@ -160,10 +199,21 @@ class Topic(models.Model):
     
     key = models.IntegerField('cle', null=True, blank=True)
 
+    post_count = models.IntegerField('Nombre de messages', default=0)
+    last_position = models.IntegerField('Position du dernier message',
+                                        default=0)
+
     def __unicode__(self):
         """Textual form of a thread."""
         return self.title
 
+    def save(self, *args, **kwargs):
+        # the counters are only written by the signals, update_counters()
+        # and next_post_position()
+        kwargs = exclude_counters(self, ['post_count', 'last_position'],
+                                  kwargs)
+        super(Topic, self).save(*args, **kwargs)
+
     def get_absolute_url(self):
         return reverse(
             'zds.forum.views.topic',
@@ -172,7 +222,29 @@ class Topic(models.Model):
 
     def get_post_count(self):
         """Return the number of posts in the topic."""
-        return Post.objects.filter(topic__pk=self.pk).count()
+        return self.post_count
+
+    def update_counters(self):
+        """Computes again the denormalized post counter of the topic."""
+        self.post_count = Post.objects.filter(topic__pk=self.pk).count()
+        self.save(update_fields=['post_count'])
+
+    def next_post_position(self):
+        """Allocate the position of a new post in the topic."""
+        return next_position(self, 'last_position')
+
+    def move_to(self, forum):
+        """Move the topic to another forum and update the counters of both
+        forums."""
+        old_forum = self.forum
+        self.forum = forum
+        self.save()
+        if old_forum.pk != forum.pk:
+            old_forum.update_counters()
+            forum.update_counters()
+            tags = list(self.tags.values_list('pk', flat=True))
+            update_tag_stats(old_forum.pk, tags, -1)
+            update_tag_stats(forum.pk, tags, 1)
 
     def get_last_post(self):
         """Gets the last post in the thread."""
@@ -210,31 +282,33 @@ class Topic(models.Model):
         """Return set on followers by email"""
         return TopicFollowed.objects.filter(topic=self, email=True).select_related("user")
 
+    def get_read_state(self, user=None):
+        """Return the read state loaded by `load_read_state()` for the user,
+        or None if it wasn't loaded."""
+        if user is None:
+            user = get_current_user()
+        state = getattr(self, '_read_state', None)
+        if state is not None and user is not None and state[0] == user.pk:
+            return state[1]
+        return None
+
     def last_read_post(self):
         """Return the last post the user has read."""
-        try:
-            return TopicRead.objects\
-                .select_related()\
-                .filter(topic=self, user=get_current_user())\
-                .latest('post__pubdate').post
-        except:
-            return self.first_post()
+        state = self.get_read_state()
+        if state is None:
+            state = load_read_state([self]).get(self.pk)
+        if state is not None:
+            return state.last_read_post
+        return self.first_post()
 
     def first_unread_post(self):
         """Return the first post the user has unread."""
-        try:
-            last_post = TopicRead.objects\
-                .filter(topic=self, user=get_current_user())\
-                .latest('post__pubdate').post
-
-            next_post = Post.objects.filter(
-                topic__pk=self.pk,
-                pubdate__gt=last_post.pubdate)\
-                .select_related("author").first()
-
-            return next_post
-        except:
-            return self.first_post()
+        state = self.get_read_state()
+        if state is None:
+            state = load_read_state([self]).get(self.pk)
+        if state is not None:
+            return state.first_unread_post
+        return self.first_post()
 
     def is_followed(self, user=None):
         """Check if the topic is currently followed by the user.
@@ -357,12 +431,131 @@ class TopicFollowed(models.Model):
                                                      self.user.username)
 
 
+class TagStats(models.Model):
+
+    """Number of topics of a forum with a given tag, maintained when the
+    topics are tagged, moved or deleted."""
+    class Meta:
+        verbose_name = 'Statistique de tag'
+        verbose_name_plural = 'Statistiques de tags'
+        unique_together = ('tag', 'forum')
+
+    tag = models.ForeignKey(Tag, verbose_name='Tag', db_index=True)
+    forum = models.ForeignKey(Forum, verbose_name='Forum', db_index=True)
+    topic_count = models.IntegerField('Nombre de sujets', default=0)
+
+    def __unicode__(self):
+        return u'<Tag "{0}" : {1} sujet(s) dans {2}>'.format(
+            self.tag.title, self.topic_count, self.forum.title)
+
+
+def update_tag_stats(forum_pk, tag_pks, delta):
+    """Add `delta` to the number of topics of the forum with the given
+    tags."""
+    for tag_pk in tag_pks:
+        updated = TagStats.objects\
+            .filter(forum__pk=forum_pk, tag__pk=tag_pk)\
+            .update(topic_count=F('topic_count') + delta)
+        if not updated and delta > 0:
+            TagStats.objects.create(forum_id=forum_pk, tag_id=tag_pk,
+                                    topic_count=delta)
+
+
+def get_top_tags(forum_pks):
+    """Return the `TOP_TAG_MAX` tags used by the most topics of the given
+    forums."""
+    stats = TagStats.objects\
+        .filter(forum__in=forum_pks, topic_count__gt=0)\
+        .values('tag')\
+        .annotate(nb_topics=Sum('topic_count'))\
+        .order_by('-nb_topics', '-tag')[:settings.TOP_TAG_MAX]
+    tag_pks = [stat['tag'] for stat in stats]
+    tags = Tag.objects.in_bulk(tag_pks)
+    return [tags[pk] for pk in tag_pks if pk in tags]
+
+
+ReadState = namedtuple('ReadState',
+                       ['is_read', 'last_read_post', 'first_unread_post'])
+
+
+def load_read_state(topics, user=None):
+    """Resolve the read state of a list of topics for an user.
+
+    Instead of several queries per topic, one query fetches the last post
+    read in each topic and another one fetches the first unread posts. The
+    result is attached to each topic, so `never_read()`,
+    `Topic.last_read_post()` and `Topic.first_unread_post()` don't hit the
+    database anymore for these topics. A dictionary mapping the pk of each
+    topic to its `ReadState` is also returned.
+
+    """
+    if user is None:
+        user = get_current_user()
+    topics = list(topics)
+    if not topics or user is None or not user.is_authenticated():
+        return {}
+
+    last_reads = {}
+    for read in TopicRead.objects\
+            .filter(topic__in=topics, user=user)\
+            .select_related("post")\
+            .order_by("post__pubdate"):
+        last_reads[read.topic_id] = read.post
+
+    # The markers still in the write-behind buffer are newer
+    buffered = get_buffered_reads('topic', user.pk)
+    buffered_pks = [buffered[topic.pk] for topic in topics
+                    if topic.pk in buffered]
+    if buffered_pks:
+        for post in Post.objects.filter(pk__in=buffered_pks):
+            last_reads[post.topic_id] = post
+
+    # Positions are dense in a topic: the first unread post directly
+    # follows the last read one, or is the first post of the topic.
+    wanted = []
+    for topic in topics:
+        last_read = last_reads.get(topic.pk)
+        position = last_read.position + 1 if last_read is not None else 1
+        wanted.append(Q(topic=topic, position=position))
+    next_posts = {}
+    for post in Post.objects\
+            .filter(reduce(operator.or_, wanted))\
+            .select_related("author"):
+        next_posts[(post.topic_id, post.position)] = post
+
+    states = {}
+    for topic in topics:
+        last_read = last_reads.get(topic.pk)
+        if last_read is None:
+            first_unread = next_posts.get((topic.pk, 1))
+            state = ReadState(False, first_unread, first_unread)
+        else:
+            first_unread = next_posts.get((topic.pk, last_read.position + 1))
+            state = ReadState(last_read.pk == topic.last_message_id,
+                              last_read,
+                              first_unread)
+        for post in (state.last_read_post, state.first_unread_post):
+            if post is not None:
+                post.topic = topic
+        topic._read_state = (user.pk, state)
+        states[topic.pk] = state
+    return states
+
+
 def never_read(topic, user=None):
     """Check if a topic has been read by an user since it last post was
     added."""
     if user is None:
         user = get_current_user()
 
+    state = topic.get_read_state(user)
+    if state is not None:
+        return not state.is_read
+
+    buffered = get_buffered_reads('topic', user.pk).get(topic.pk)
+    if buffered is not None:
+        return buffered != topic.last_message_id
+
     return not TopicRead.objects\
         .filter(post=topic.last_message, topic=topic, user=user).exists()
 
@@ -370,6 +563,8 @@ def never_read(topic, user=None):
 def mark_read(topic):
     """Mark a topic as read for the user."""
     u = get_current_user()
+    if buffer_read('topic', u.pk, topic.pk, topic.last_message_id):
+        return
     t = TopicRead.objects.filter(topic=topic, user=u).first()
     if t is None:
         t = TopicRead(post=topic.last_message, topic=topic, user=u)
@@ -433,19 +628,78 @@ def follow_by_email(topic, user=None):
     return ret
 
 
+def get_readable_forums(user=None):
+    """Return the set of the pk of the forums the user can read.
+
+    The set is computed once per user and kept in cache until the groups
+    of the user or of a forum change. It's also kept on the user instance,
+    so that it's computed at most once per request. Without user, the set
+    of public forums is returned.
+
+    """
+    if user and hasattr(user, '_readable_forums'):
+        return user._readable_forums
+
+    authenticated = bool(user) and user.is_authenticated()
+    key = _readable_forums_key(user.pk if authenticated else None)
+    forums = cache.get(key)
+    if forums is None:
+        forums = set(Forum.objects
+                     .filter(group__isnull=True)
+                     .values_list('pk', flat=True))
+        if authenticated:
+            forums |= set(Forum.objects
+                          .filter(group__in=user.groups.all())
+                          .values_list('pk', flat=True))
+        cache.set(key, forums)
+
+    if user:
+        user._readable_forums = forums
+    return forums
+
+
+def _readable_forums_key(user_pk):
+    """Cache key of the readable forums of an user (None for anonymous
+    users). It includes a version which changes with the groups of the
+    forums."""
+    version = cache.get(READABLE_FORUMS_VERSION_KEY, 0)
+    return u'readable_forums_{0}_{1}'.format(version, user_pk or 'anonymous')
+
+
+def invalidate_readable_forums(user_pk=None):
+    """Forget the readable forums of an user, or of everybody when no user
+    is given."""
+    if user_pk is not None:
+        cache.delete(_readable_forums_key(user_pk))
+    else:
+        try:
+            cache.incr(READABLE_FORUMS_VERSION_KEY)
+        except ValueError:
+            cache.set(READABLE_FORUMS_VERSION_KEY, 1, None)
+
+
+def get_forum_menu_key(user=None):
+    """Key of the cached forum menu of an user: the users who can read the
+    same forums share the same menu."""
+    forums = u','.join(str(pk) for pk in sorted(get_readable_forums(user)))
+    return u'{0}_{1}'.format(cache.get(FORUM_MENU_VERSION_KEY, 0),
+                             hashlib.md5(forums).hexdigest())
+
+
+def invalidate_forum_menu():
+    """Forget the cached forum menus of everybody."""
+    try:
+        cache.incr(FORUM_MENU_VERSION_KEY)
+    except ValueError:
+        cache.set(FORUM_MENU_VERSION_KEY, 1, None)
+
+
 def get_last_topics(user):
     """Returns the 5 very last topics."""
-    topics = Topic.objects.all().order_by('-last_message__pubdate')
-
-    tops = []
-    cpt = 1
-    for topic in topics:
-        if topic.forum.can_read(user):
-            tops.append(topic)
-            cpt += 1
-        if cpt > 5:
-            break
-    return tops
+    return Topic.objects\
+        .filter(forum__in=get_readable_forums(user))\
+        .order_by('-last_message__pubdate')\
+        .select_related('forum')[:5]
 
 def get_topics(forum_pk, is_sticky, is_solved=None):
     """ Get topics according to parameters """
@@ -465,3 +719,144 @@ def get_topics(forum_pk, is_sticky, is_solved=None):
                     "author",
                     "last_message",
                     "tags").all()
+
+
+@receiver(models.signals.post_save, sender=Topic)
+def increment_topic_count(sender, instance, created, raw=False, **kwargs):
+    """Count a new topic in its forum."""
+    if created and not raw:
+        Forum.objects.filter(pk=instance.forum_id)\
+            .update(topic_count=F('topic_count') + 1)
+
+
+# Topics being deleted by this thread: their posts are deleted with them,
+# and the counters are computed again once, after the topic.
+_deleted_topics = threading.local()
+
+
+def _get_deleted_topics():
+    topics = getattr(_deleted_topics, 'pks', None)
+    if topics is None:
+        topics = _deleted_topics.pks = set()
+    return topics
+
+
+@receiver(models.signals.pre_delete, sender=Topic)
+def start_topic_deletion(sender, instance, **kwargs):
+    """Remember a topic being deleted, until its posts are deleted."""
+    _get_deleted_topics().add(instance.pk)
+
+
+@receiver(models.signals.post_delete, sender=Topic)
+def decrement_topic_count(sender, instance, **kwargs):
+    """Computes again the counters of the forum of a deleted topic."""
+    _get_deleted_topics().discard(instance.pk)
+    forum = Forum.objects.filter(pk=instance.forum_id).first()
+    if forum is not None:
+        forum.update_counters()
+
+
+@receiver(models.signals.post_save, sender=Post)
+def increment_post_count(sender, instance, created, raw=False, **kwargs):
+    """Count a new post in its topic and forum, and keep it as the last
+    message of the forum."""
+    if created and not raw:
+        topic = instance.topic
+        Topic.objects.filter(pk=topic.pk)\
+            .update(post_count=F('post_count') + 1)
+        # keep the counter of the instance of the caller up to date
+        topic.post_count += 1
+        Forum.objects.filter(pk=topic.forum_id)\
+            .update(post_count=F('post_count') + 1, last_post=instance)
+
+
+@receiver(models.signals.pre_delete, sender=Topic)
+def remove_topic_tag_stats(sender, instance, **kwargs):
+    """Stop counting a deleted topic in the statistics of its tags."""
+    update_tag_stats(instance.forum_id,
+                     instance.tags.values_list('pk', flat=True), -1)
+
+
+@receiver(models.signals.m2m_changed, sender=Topic.tags.through)
+def topic_tags_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """Update the statistics of the tags added to or removed from topics."""
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    delta = 1 if action == 'post_add' else -1
+    if not reverse:
+        if action == 'pre_clear':
+            pk_set = instance.tags.values_list('pk', flat=True)
+        update_tag_stats(instance.forum_id, pk_set, delta)
+    else:
+        if action == 'pre_clear':
+            topics = instance.topic_set.all()
+        else:
+            topics = Topic.objects.filter(pk__in=pk_set)
+        for forum_pk in topics.values_list('forum', flat=True):
+            update_tag_stats(forum_pk, [instance.pk], delta)
+
+
+@receiver(models.signals.post_delete, sender=Post)
+def decrement_post_count(sender, instance, **kwargs):
+    """Computes again the counters of the topic and forum of a deleted
+    post."""
+    if instance.topic_id in _get_deleted_topics():
+        # the forum is counted again after its topic
+        return
+    topic = Topic.objects.filter(pk=instance.topic_id).first()
+    if topic is not None:
+        topic.update_counters()
+        topic.forum.update_counters()
+
+
+@receiver(models.signals.post_save, sender=Topic)
+@receiver(models.signals.post_delete, sender=Topic)
+@receiver(models.signals.post_save, sender=Post)
+@receiver(models.signals.post_delete, sender=Post)
+def messages_changed(sender, **kwargs):
+    """Forget the cached feeds of the forums."""
+    invalidate_feeds('forum')
+
+
+@receiver(models.signals.post_save, sender=Forum)
+@receiver(models.signals.post_delete, sender=Forum)
+@receiver(models.signals.post_delete, sender=Group)
+def forums_changed(sender, **kwargs):
+    """Forget the readable forums of everybody when a forum or a group is
+    added or removed."""
+    if kwargs.get('created', True):
+        invalidate_readable_forums()
+    invalidate_forum_menu()
+    invalidate_feeds('forum')
+
+
+@receiver(models.signals.post_save, sender=Category)
+@receiver(models.signals.post_delete, sender=Category)
+def categories_changed(sender, **kwargs):
+    """Forget the forum menus when a category changes."""
+    invalidate_forum_menu()
+
+
+@receiver(models.signals.m2m_changed, sender=Forum.group.through)
+def forum_groups_changed(sender, action, **kwargs):
+    """Forget the readable forums of everybody when the groups of a forum
+    change."""
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        invalidate_readable_forums()
+        invalidate_feeds('forum')
+
+
+@receiver(models.signals.m2m_changed, sender=User.groups.through)
+def user_groups_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """Forget the readable forums of the users whose groups change."""
+    if action not in ('post_add', 'post_remove', 'pre_clear', 'post_clear'):
+        return
+    if not reverse:
+        invalidate_readable_forums(instance.pk)
+        instance.__dict__.pop('_readable_forums', None)
+    elif pk_set is not None:
+        for user_pk in pk_set:
+            invalidate_readable_forums(user_pk)
+    elif action == 'pre_clear':
+        for user_pk in instance.user_set.values_list('pk', flat=True):
+            invalidate_readable_forums(user_pk)
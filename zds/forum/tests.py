@@ -1,20 +1,38 @@
 # coding: utf-8
 
+from datetime import timedelta
+from StringIO import StringIO
+import threading
+
 from django.conf import settings
+from django.contrib.auth.models import Group
 from django.test import TestCase
 
+from django.core.cache import get_cache
 from django.core.urlresolvers import reverse
+from django.utils import timezone
 from zds.utils import slugify
 
 from zds.forum.factories import CategoryFactory, ForumFactory, \
     TopicFactory, PostFactory, TagFactory
 from zds.member.factories import ProfileFactory, StaffProfileFactory
-from zds.utils.models import CommentLike, CommentDislike, Alert, Tag
+from zds.utils.models import CommentLike, CommentDislike, Alert, Tag, OutgoingEmail, \
+    load_votes
+from zds.utils import read_markers
+from zds.utils.mails import queue_email, send_queued_emails
+from zds.utils.read_markers import buffer_read, discard_buffered_read, \
+    flush_read_markers, get_buffered_reads
+from zds.utils.templatetags.emarkdown import emarkdown, \
+    get_markdown_instance, new_markdown_instance
+from zds.utils.templatetags.profile import liked, disliked
 from django.core import mail
+from django.core.management import call_command
 
 from .models import Post, Topic, TopicFollowed, TopicRead
 from zds.forum.views import get_tag_by_title
-from zds.forum.models import get_topics, Forum
+from zds.forum.models import get_topics, Forum, load_read_state, never_read, \
+    get_readable_forums, get_last_topics, get_top_tags, get_forum_menu_key, \
+    TagStats
 
 class ForumMemberTests(TestCase):
 
@@ -174,7 +192,15 @@ class ForumMemberTests(TestCase):
             follow=False)
 
         self.assertEqual(result.status_code, 302)
+        # notifications are queued, then sent by the worker
+        self.assertEquals(len(mail.outbox), 0)
+        self.assertEqual(OutgoingEmail.objects.count(), 2)
+        call_command('send_emails')
         self.assertEquals(len(mail.outbox), 2)
+        self.assertEqual(
+            sorted(m.to[0] for m in mail.outbox),
+            sorted([user1.email, user2.email]))
+        self.assertEqual(OutgoingEmail.objects.count(), 0)
 
         # check topic's number
         self.assertEqual(Topic.objects.all().count(), 1)
@@ -393,6 +419,129 @@ class ForumMemberTests(TestCase):
                 comments__pk=post3.pk).all().count(),
             0)
 
+    def test_votes(self):
+        """Test the vote counters and the votes loaded for a page."""
+        user1 = ProfileFactory().user
+        topic1 = TopicFactory(forum=self.forum11, author=user1)
+        post1 = PostFactory(topic=topic1, author=user1, position=1)
+        post2 = PostFactory(topic=topic1, author=user1, position=2)
+
+        post1.toggle_like(self.user)
+        post2.toggle_dislike(self.user)
+        self.assertEqual((post1.like, post1.dislike), (1, 0))
+
+        # the dislike replaces the like, then is removed
+        post1.toggle_dislike(self.user)
+        self.assertEqual((post1.like, post1.dislike), (0, 1))
+        post1.toggle_dislike(self.user)
+        self.assertEqual((post1.like, post1.dislike), (0, 0))
+        post1.toggle_like(self.user)
+        post1 = Post.objects.get(pk=post1.pk)
+        self.assertEqual((post1.like, post1.dislike), (1, 0))
+        self.assertEqual(post1.get_like_count(), 1)
+
+        posts = list(Post.objects.filter(topic=topic1).order_by('position'))
+        with self.assertNumQueries(2):
+            load_votes(posts, self.user)
+        with self.assertNumQueries(0):
+            self.assertTrue(liked(self.user, posts[0]))
+            self.assertFalse(disliked(self.user, posts[0]))
+            self.assertFalse(liked(self.user, posts[1]))
+            self.assertTrue(disliked(self.user, posts[1]))
+        # without loaded votes, the filters query the database
+        self.assertTrue(liked(self.user, post1.pk))
+        self.assertFalse(liked(user1, posts[0]))
+
+    def test_read_markers(self):
+        """Test the read markers, buffered or written at once."""
+        user1 = ProfileFactory().user
+        topic1 = TopicFactory(forum=self.forum11, author=user1)
+        PostFactory(topic=topic1, author=user1, position=1)
+        post2 = PostFactory(topic=topic1, author=user1, position=2)
+        self.assertTrue(never_read(topic1, self.user))
+
+        result = self.client.get(topic1.get_absolute_url())
+        self.assertEqual(result.status_code, 200)
+        topic1 = Topic.objects.get(pk=topic1.pk)
+        self.assertFalse(never_read(topic1, self.user))
+        self.assertEqual(load_read_state([topic1], self.user)[topic1.pk]
+                         .last_read_post, post2)
+
+        # the flush writes the buffered markers, if any
+        call_command('flush_read_markers')
+        self.assertEqual(TopicRead.objects.get(topic=topic1,
+                                               user=self.user).post,
+                         post2)
+        self.assertFalse(never_read(topic1, self.user))
+
+    def test_read_markers_flush(self):
+        """Test the flush of the buffered markers, while others are
+        buffered."""
+        topics = []
+        for i in range(3):
+            topic = TopicFactory(forum=self.forum11, author=self.user)
+            posts = [PostFactory(topic=topic, author=self.user,
+                                 position=position)
+                     for position in (1, 2)]
+            topics.append((topic, posts))
+        (topic1, posts1), (topic2, posts2), (topic3, posts3) = topics
+
+        def read_post(topic):
+            return TopicRead.objects.get(topic=topic, user=self.user).post
+
+        old_cache, old_write = read_markers.cache, read_markers._write
+        read_markers.cache = get_cache(
+            'django.core.cache.backends.locmem.LocMemCache')
+        try:
+            cache = read_markers.cache
+            self.assertTrue(buffer_read('topic', self.user.pk, topic1.pk,
+                                        posts1[0].pk))
+            # the number of the second slot is taken, it isn't written yet
+            cache.incr(read_markers._count_key('topic'))
+            buffer_read('topic', self.user.pk, topic2.pk, posts2[1].pk)
+
+            # the flush stops before the missing slot
+            self.assertEqual(flush_read_markers('topic'), 1)
+            self.assertEqual(read_post(topic1), posts1[0])
+            self.assertEqual(get_buffered_reads('topic', self.user.pk),
+                             {topic2.pk: posts2[1].pk})
+
+            # a marker buffered during the flush is kept for the next one
+            cache.set(read_markers._slot_key('topic', 2),
+                      (self.user.pk, topic3.pk, posts3[0].pk))
+
+            def write(kind, latest):
+                buffer_read('topic', self.user.pk, topic3.pk, posts3[1].pk)
+                return old_write(kind, latest)
+            read_markers._write = write
+            self.assertEqual(flush_read_markers('topic'), 2)
+            read_markers._write = old_write
+            self.assertEqual(read_post(topic2), posts2[1])
+            self.assertEqual(read_post(topic3), posts3[0])
+            self.assertEqual(get_buffered_reads('topic', self.user.pk),
+                             {topic3.pk: posts3[1].pk})
+            self.assertEqual(flush_read_markers('topic'), 1)
+            self.assertEqual(read_post(topic3), posts3[1])
+            self.assertEqual(get_buffered_reads('topic', self.user.pk), {})
+
+            # a discarded marker isn't written
+            buffer_read('topic', self.user.pk, topic1.pk, posts1[1].pk)
+            discard_buffered_read('topic', self.user.pk, topic1.pk)
+            self.assertEqual(flush_read_markers('topic'), 0)
+            self.assertEqual(read_post(topic1), posts1[0])
+
+            # a slot still missing after a while was lost
+            number = cache.incr(read_markers._count_key('topic'))
+            flush_read_markers('topic')
+            self.assertEqual(cache.get(read_markers._flushed_key('topic')),
+                             number - 1)
+            cache.set(read_markers._missing_key('topic'), {number: 0})
+            flush_read_markers('topic')
+            self.assertEqual(cache.get(read_markers._flushed_key('topic')),
+                             number)
+        finally:
+            read_markers.cache, read_markers._write = old_cache, old_write
+
     def test_dislike_post(self):
         """Test when a member dislike any post."""
         user1 = ProfileFactory().user
@@ -561,6 +710,273 @@ class ForumMemberTests(TestCase):
                 pk=topic1.pk).forum.pk,
             self.forum12.pk)
 
+        # check counters of both forums
+        forum11 = Forum.objects.get(pk=self.forum11.pk)
+        forum12 = Forum.objects.get(pk=self.forum12.pk)
+        self.assertEqual(forum11.get_topic_count(), 0)
+        self.assertEqual(forum11.get_post_count(), 0)
+        self.assertEqual(forum11.get_last_message(), None)
+        self.assertEqual(forum12.get_topic_count(), 1)
+        self.assertEqual(forum12.get_post_count(), 3)
+        self.assertEqual(forum12.get_last_message(), topic1.last_message)
+
+    def test_counters(self):
+        """Test the denormalized counters of forums and topics."""
+        user1 = ProfileFactory().user
+        topic1 = TopicFactory(forum=self.forum11, author=self.user)
+        PostFactory(topic=topic1, author=self.user, position=1)
+        PostFactory(topic=topic1, author=user1, position=2)
+
+        result = self.client.post(
+            reverse('zds.forum.views.answer') + '?sujet={0}'.format(topic1.pk),
+            {
+                'last_post': topic1.last_message.pk,
+                'text': u'Mon troisième message'
+            },
+            follow=False)
+        self.assertEqual(result.status_code, 302)
+
+        topic1 = Topic.objects.get(pk=topic1.pk)
+        forum11 = Forum.objects.get(pk=self.forum11.pk)
+        self.assertEqual(topic1.get_post_count(), 3)
+        self.assertEqual(forum11.get_topic_count(), 1)
+        self.assertEqual(forum11.get_post_count(), 3)
+        self.assertEqual(forum11.get_last_message(), topic1.last_message)
+
+        # hiding a post doesn't change the counters
+        post = topic1.last_message
+        post.is_visible = False
+        post.save()
+        self.assertEqual(Topic.objects.get(pk=topic1.pk).get_post_count(), 3)
+
+        # the management command gives the same result
+        Forum.objects.update(topic_count=0, post_count=0, last_post=None)
+        Topic.objects.update(post_count=0)
+        call_command('rebuild_forum_counters')
+        forum11 = Forum.objects.get(pk=self.forum11.pk)
+        self.assertEqual(Topic.objects.get(pk=topic1.pk).get_post_count(), 3)
+        self.assertEqual(forum11.get_topic_count(), 1)
+        self.assertEqual(forum11.get_post_count(), 3)
+        self.assertEqual(forum11.get_last_message(), topic1.last_message)
+
+        # a full save of instances loaded earlier keeps the counters
+        topic1.post_count = 0
+        topic1.save()
+        forum11.post_count = 0
+        forum11.save()
+        self.assertEqual(Topic.objects.get(pk=topic1.pk).get_post_count(), 3)
+        self.assertEqual(
+            Forum.objects.get(pk=self.forum11.pk).get_post_count(), 3)
+
+        # the posts are deleted with their topic
+        topic1.delete()
+        forum11 = Forum.objects.get(pk=self.forum11.pk)
+        self.assertEqual(forum11.get_topic_count(), 0)
+        self.assertEqual(forum11.get_post_count(), 0)
+        self.assertIsNone(forum11.get_last_message())
+
+    def test_post_position(self):
+        """Test the allocation of the positions of the posts of a topic."""
+        topic1 = TopicFactory(forum=self.forum11, author=self.user)
+        PostFactory(topic=topic1, author=self.user, position=1)
+        PostFactory(topic=topic1, author=self.user, position=2)
+
+        # the counter is incremented in database, even from a stale instance
+        stale = Topic.objects.get(pk=topic1.pk)
+        self.assertEqual(topic1.next_post_position(), 3)
+        self.assertEqual(stale.next_post_position(), 4)
+        self.assertEqual(Topic.objects.get(pk=topic1.pk).last_position, 4)
+
+        result = self.client.post(
+            reverse('zds.forum.views.answer') + '?sujet={0}'.format(topic1.pk),
+            {
+                'last_post': topic1.last_message.pk,
+                'text': u'Mon message'
+            },
+            follow=False)
+        self.assertEqual(result.status_code, 302)
+        topic1 = Topic.objects.get(pk=topic1.pk)
+        self.assertEqual(topic1.last_message.position, 5)
+        self.assertEqual(topic1.last_position, 5)
+
+        # a full save of a topic loaded earlier keeps the counter
+        stale = Topic.objects.get(pk=topic1.pk)
+        self.assertEqual(topic1.next_post_position(), 6)
+        stale.title = u"Nouveau titre"
+        stale.save()
+        self.assertEqual(Topic.objects.get(pk=topic1.pk).last_position, 6)
+
+        # the management command starts again from the last post
+        Topic.objects.update(last_position=0)
+        call_command('rebuild_forum_counters')
+        self.assertEqual(Topic.objects.get(pk=topic1.pk).last_position, 5)
+
+    def test_tag_stats(self):
+        """Test the statistics of the tags used in the forums."""
+        topic1 = TopicFactory(forum=self.forum11, author=self.user)
+        topic2 = TopicFactory(forum=self.forum11, author=self.user)
+        topic3 = TopicFactory(forum=self.forum12, author=self.user)
+        topic1.add_tags([u"python", u"django"])
+        topic2.add_tags([u"python"])
+        topic3.add_tags([u"django", u"python"])
+        python = Tag.objects.get(title=u"python")
+        django = Tag.objects.get(title=u"django")
+
+        def count(forum, tag):
+            return TagStats.objects.get(forum=forum, tag=tag).topic_count
+
+        self.assertEqual(count(self.forum11, python), 2)
+        self.assertEqual(count(self.forum11, django), 1)
+        self.assertEqual(get_top_tags([self.forum11.pk, self.forum12.pk]),
+                         [python, django])
+
+        # moved topics are counted in their new forum
+        topic2.move_to(self.forum12)
+        self.assertEqual(count(self.forum11, python), 1)
+        self.assertEqual(count(self.forum12, python), 2)
+
+        # removed tags and deleted topics are not counted anymore
+        topic3.tags.clear()
+        self.assertEqual(count(self.forum12, python), 1)
+        self.assertEqual(count(self.forum12, django), 0)
+        topic1.delete()
+        self.assertEqual(count(self.forum11, python), 0)
+        self.assertEqual(get_top_tags([self.forum11.pk, self.forum12.pk]),
+                         [python])
+
+        # the management command gives the same result
+        TagStats.objects.all().delete()
+        call_command('rebuild_forum_counters')
+        self.assertEqual(count(self.forum12, python), 1)
+        self.assertFalse(TagStats.objects.filter(tag=django).exists())
+
+    def test_forum_menu_key(self):
+        """Test the key of the cached forum menu."""
+        group = Group.objects.create(name="Staff")
+        self.forum22.group.add(group)
+        key = get_forum_menu_key(self.user)
+        self.assertEqual(key, get_forum_menu_key(self.user2))
+        self.assertEqual(key, get_forum_menu_key())
+
+        # the menu changes when the user can read other forums
+        self.user.groups.add(group)
+        self.assertNotEqual(key, get_forum_menu_key(self.user))
+        self.assertEqual(key, get_forum_menu_key(self.user2))
+
+    def test_load_read_state(self):
+        """Test the read state of a list of topics, resolved at once."""
+        user1 = ProfileFactory().user
+        topic1 = TopicFactory(forum=self.forum11, author=user1)
+        post11 = PostFactory(topic=topic1, author=user1, position=1)
+        post12 = PostFactory(topic=topic1, author=user1, position=2)
+        topic2 = TopicFactory(forum=self.forum11, author=user1)
+        post21 = PostFactory(topic=topic2, author=user1, position=1)
+        topic3 = TopicFactory(forum=self.forum11, author=user1)
+        post31 = PostFactory(topic=topic3, author=user1, position=1)
+        TopicRead(topic=topic1, user=self.user, post=post11).save()
+        TopicRead(topic=topic2, user=self.user, post=post21).save()
+
+        topics = list(Topic.objects.filter(forum=self.forum11).order_by("pk"))
+        states = load_read_state(topics, self.user)
+
+        # partially read topic
+        self.assertFalse(states[topic1.pk].is_read)
+        self.assertEqual(states[topic1.pk].last_read_post, post11)
+        self.assertEqual(states[topic1.pk].first_unread_post, post12)
+        # read topic
+        self.assertTrue(states[topic2.pk].is_read)
+        self.assertEqual(states[topic2.pk].last_read_post, post21)
+        self.assertEqual(states[topic2.pk].first_unread_post, None)
+        # never read topic
+        self.assertFalse(states[topic3.pk].is_read)
+        self.assertEqual(states[topic3.pk].last_read_post, post31)
+        self.assertEqual(states[topic3.pk].first_unread_post, post31)
+
+        # the state is used without any other query
+        with self.assertNumQueries(0):
+            self.assertTrue(never_read(topics[0], self.user))
+            self.assertFalse(never_read(topics[1], self.user))
+            self.assertTrue(never_read(topics[2], self.user))
+
+        # same result without the preloaded state
+        self.assertEqual(never_read(topic1, self.user), True)
+        self.assertEqual(never_read(topic2, self.user), False)
+        self.assertEqual(never_read(topic3, self.user), True)
+
+        # the forum isn't fully read
+        self.assertFalse(Forum.objects.get(pk=self.forum11.pk).is_read(self.user))
+
+    def test_readable_forums(self):
+        """Test the set of forums an user can read."""
+        group = Group.objects.create(name="Staff")
+        self.forum22.group.add(group)
+        topic1 = TopicFactory(forum=self.forum11, author=self.user)
+        PostFactory(topic=topic1, author=self.user, position=1)
+        topic2 = TopicFactory(forum=self.forum22, author=self.user)
+        PostFactory(topic=topic2, author=self.user, position=1)
+
+        self.assertNotIn(self.forum22.pk, get_readable_forums())
+        self.assertNotIn(self.forum22.pk, get_readable_forums(self.user))
+        self.assertFalse(self.forum22.can_read(self.user))
+        self.assertEqual(list(get_last_topics(self.user)), [topic1])
+
+        # adding the user to the group gives access to the forum
+        self.user.groups.add(group)
+        self.assertIn(self.forum22.pk, get_readable_forums(self.user))
+        self.assertTrue(self.forum22.can_read(self.user))
+        self.assertEqual(list(get_last_topics(self.user)), [topic2, topic1])
+
+        # removing the group from the forum makes it public
+        self.forum22.group.remove(group)
+        self.assertIn(self.forum22.pk, get_readable_forums())
+
+    def test_feed_conditional_get(self):
+        """Test the validators sent with the feeds."""
+        topic1 = TopicFactory(forum=self.forum11, author=self.user)
+        PostFactory(topic=topic1, author=self.user, position=1)
+
+        response = self.client.get(reverse('post-feed-rss'))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, topic1.title)
+        etag = response['ETag']
+        last_modified = response['Last-Modified']
+
+        response = self.client.get(reverse('post-feed-rss'),
+                                   HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        response = self.client.get(reverse('post-feed-rss'),
+                                   HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 304)
+
+        # a new post changes the feed
+        post = PostFactory(topic=topic1, author=self.user, position=2)
+        Post.objects.filter(pk=post.pk)\
+            .update(pubdate=post.pubdate + timedelta(minutes=1))
+        response = self.client.get(reverse('post-feed-rss'),
+                                   HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_topic_pagination(self):
+        """Test the pages of a topic, built from the position of the posts."""
+        topic1 = TopicFactory(forum=self.forum11, author=self.user)
+        posts = []
+        for position in range(1, settings.POSTS_PER_PAGE + 3):
+            posts.append(PostFactory(topic=topic1, author=self.user, position=position))
+
+        response = self.client.get(topic1.get_absolute_url())
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['posts'], posts[:settings.POSTS_PER_PAGE])
+        self.assertEqual(response.context['pages'], [1, 2])
+
+        # the last post of the previous page is shown on top of the second one
+        response = self.client.get(topic1.get_absolute_url() + '?page=2')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['posts'], posts[settings.POSTS_PER_PAGE - 1:])
+
+        response = self.client.get(topic1.get_absolute_url() + '?page=3')
+        self.assertEqual(response.status_code, 404)
+
     def test_answer_empty(self):
         """Test behaviour on empty answer."""
         # Topic and 1st post by another user, to avoid antispam limitation
@@ -666,6 +1082,76 @@ class ForumMemberTests(TestCase):
             follow=True)
         self.assertEqual(result.status_code, 200)
 
+    def test_markdown_engines(self):
+        """Test the markdown engines kept by each thread."""
+        md = get_markdown_instance()
+        self.assertIs(get_markdown_instance(), md)
+        self.assertIsNot(get_markdown_instance(Inline=True), md)
+
+        # a reused engine forgets the previous text: its references, its
+        # notes and its abbreviations
+        texts = [u"Un [lien][1] :)\n\n[1]: http://zestedesavoir.com",
+                 u"Un autre [lien][1] *sans* adresse",
+                 u"Une note[^1]\n\n[^1]: Le texte de la note",
+                 u"Une autre note[^1] sans texte",
+                 u"Du HTML\n\n*[HTML]: HyperText Markup Language",
+                 u"Encore du HTML"]
+        for text in texts * 2:
+            self.assertEqual(
+                emarkdown(text),
+                new_markdown_instance().convert(text).encode('utf-8'))
+        self.assertIn("<abbr", emarkdown(texts[4]))
+        self.assertNotIn("<abbr", emarkdown(texts[5]))
+        self.assertNotIn("Le texte de la note", emarkdown(texts[3]))
+        self.assertEqual(len(get_markdown_instance().inlinePatterns),
+                         len(new_markdown_instance().inlinePatterns))
+
+        # each thread has its own engine
+        engines = []
+        thread = threading.Thread(
+            target=lambda: engines.append(get_markdown_instance()))
+        thread.start()
+        thread.join()
+        self.assertIsNot(engines[0], md)
+
+        out = StringIO()
+        call_command('bench_markdown', count=2, stdout=out)
+        self.assertIn(u"gain par message", out.getvalue())
+
+    def test_email_queue(self):
+        """Test the emails of the outbox claimed by a worker, and the failed
+        ones tried again later."""
+        context = {"username": self.user.username, "url": settings.SITE_URL}
+        queue_email(self.user.email, u"Envoyé", "email/register/confirm",
+                    context)
+        queue_email(self.user.email, u"Gabarit absent", "email/absent",
+                    context)
+        queue_email(self.user.email, u"Réservé", "email/register/confirm",
+                    context)
+
+        # an email claimed by another worker isn't sent twice
+        claimed = OutgoingEmail.objects.get(subject=u"Réservé")
+        stale = OutgoingEmail.objects.get(pk=claimed.pk)
+        self.assertTrue(claimed.claim(timezone.now() + timedelta(hours=1)))
+        self.assertFalse(stale.claim(timezone.now()))
+
+        self.assertEqual(send_queued_emails(), 1)
+        self.assertEqual([m.subject for m in mail.outbox], [u"Envoyé"])
+        failed = OutgoingEmail.objects.get(subject=u"Gabarit absent")
+        self.assertEqual(failed.attempts, 1)
+        self.assertGreater(failed.next_attempt, timezone.now())
+
+        # the failed email waits for its next attempt
+        send_queued_emails()
+        self.assertEqual(OutgoingEmail.objects.get(pk=failed.pk).attempts, 1)
+        OutgoingEmail.objects.filter(pk=failed.pk)\
+            .update(next_attempt=timezone.now())
+        send_queued_emails()
+        failed = OutgoingEmail.objects.get(pk=failed.pk)
+        self.assertEqual(failed.attempts, 2)
+        self.assertGreater(failed.next_attempt - timezone.now(),
+                           timedelta(seconds=settings.MAIL_QUEUE_RETRY_DELAY))
+
 
 class ForumGuestTests(TestCase):
 
@@ -5,19 +5,15 @@ import json
 import re
 
 from django.conf import settings
-from django.db.models import Q
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.models import User
 from django.core.exceptions import PermissionDenied
-from django.core.mail import EmailMultiAlternatives
 from django.core.paginator import Paginator, PageNotAnInteger, EmptyPage
 from django.core.urlresolvers import reverse
 from django.db import transaction
 from django.http import Http404, HttpResponse
 from django.shortcuts import redirect, get_object_or_404
-from django.template import Context
-from django.template.loader import get_template
 from django.views.decorators.http import require_POST
 from django.utils.encoding import smart_text
 
@@ -26,14 +22,17 @@ from haystack.query import SearchQuerySet
 
 from forms import TopicForm, PostForm, MoveTopicForm
 from models import Category, Forum, Topic, Post, follow, follow_by_email, never_read, \
-    mark_read, TopicFollowed, sub_tag, get_topics
+    mark_read, TopicFollowed, sub_tag, get_topics, load_read_state, get_readable_forums
 from zds.forum.models import TopicRead
 from zds.member.decorator import can_write_and_read_now
 from zds.member.views import get_client_ip
 from zds.utils import render_template, slugify
-from zds.utils.models import Alert, CommentLike, CommentDislike, Tag
+from zds.utils.mails import queue_emails
+from zds.utils.models import Alert, Tag, load_votes
 from zds.utils.mps import send_mp
-from zds.utils.paginator import paginator_range
+from zds.utils.paginator import paginator_range, PositionPaginator
+from zds.utils.read_markers import discard_buffered_read, \
+    get_buffered_reads_many
 from zds.utils.templatetags.emarkdown import emarkdown
 from zds.utils.templatetags.topbar import top_categories
 
@@ -80,6 +79,7 @@ def details(request, cat_slug, forum_slug):
     except EmptyPage:
         shown_topics = paginator.page(paginator.num_pages)
         page = paginator.num_pages
+    load_read_state(list(sticky_topics) + list(shown_topics), request.user)
 
     return render_template("forum/category/forum.html", {
         "forum": forum,
@@ -97,19 +97,10 @@ def cat_details(request, cat_slug):
     
     category = get_object_or_404(Category, slug=cat_slug)
     
-    forums_pub = Forum.objects\
-                    .filter(group__isnull=True, category__pk=category.pk)\
-                    .select_related("category").all()
-    if request.user.is_authenticated():
-        forums_prv = Forum.objects\
-                    .filter(group__isnull=False, \
-                            group__in=request.user.groups.all(), \
-                            category__pk=category.pk)\
-                    .select_related("category")\
-                    .all()
-        forums = forums_pub|forums_prv
-    else :
-        forums = forums_pub
+    forums = Forum.objects\
+        .filter(pk__in=get_readable_forums(request.user), category__pk=category.pk)\
+        .select_related("category", "last_post__topic")\
+        .order_by("position_in_category")
 
     return render_template("forum/category/index.html", {"category": category,
                                                          "forums": forums})
@@ -139,14 +130,13 @@ def topic(request, topic_pk, topic_slug):
 
     posts = \
         Post.objects.filter(topic__pk=topic.pk) \
-        .select_related() \
-        .order_by("position"
-                  ).all()
+        .select_related()
     last_post_pk = topic.last_message.pk
 
     # Handle pagination
 
-    paginator = Paginator(posts, settings.POSTS_PER_PAGE)
+    paginator = PositionPaginator(posts, settings.POSTS_PER_PAGE,
+                                  topic.last_message.position)
 
     # The category list is needed to move threads
 
@@ -159,22 +149,16 @@ def topic(request, topic_pk, topic_slug):
             raise Http404
     else:
         page_nbr = 1
+
+    # The last post of the previous page is shown too
+
     try:
-        posts = paginator.page(page_nbr)
+        res = paginator.page(page_nbr)
     except PageNotAnInteger:
-        posts = paginator.page(1)
+        res = paginator.page(1)
     except EmptyPage:
         raise Http404
-    res = []
-    if page_nbr != 1:
-
-        # Show the last post of the previous page
-
-        last_page = paginator.page(page_nbr - 1).object_list
-        last_post = last_page[len(last_page) - 1]
-        res.append(last_post)
-    for post in posts:
-        res.append(post)
+    load_votes(res, request.user)
 
     # Build form to send a post for the current topic.
 
@@ -283,7 +267,7 @@ def new(request):
             post.text = data["text"]
             post.text_html = emarkdown(request.POST["text"])
             post.pubdate = datetime.now()
-            post.position = 1
+            post.position = n_topic.next_post_position()
             post.ip_address = get_client_ip(request)
             post.save()
             n_topic.last_message = post
@@ -356,8 +340,7 @@ def move_topic(request):
     if not forum.can_read(request.user):
         raise PermissionDenied
     topic = get_object_or_404(Topic, pk=topic_pk)
-    topic.forum = forum
-    topic.save()
+    topic.move_to(forum)
 
     # unfollow user auth
 
@@ -425,7 +408,7 @@ def edit(request):
                 # problem in variable format
                 raise Http404
             forum = get_object_or_404(Forum, pk=forum_pk)
-            g_topic.forum = forum
+            g_topic.move_to(forum)
     g_topic.save()
     if request.is_ajax():
         return HttpResponse(json.dumps(resp))
@@ -467,9 +450,10 @@ def answer(request):
     last_post_pk = g_topic.last_message.pk
 
     # Retrieve last posts of the current topic.
-    posts = Post.objects.filter(topic=g_topic) \
-    .prefetch_related() \
-    .order_by("-pubdate")[:settings.POSTS_PER_PAGE]
+    posts = list(Post.objects.filter(topic=g_topic)
+                 .prefetch_related()
+                 .order_by("-pubdate")[:settings.POSTS_PER_PAGE])
+    load_votes(posts, request.user)
 
     # User would like preview his post or post a new post on the topic.
 
@@ -504,47 +488,38 @@ def answer(request):
                 post.text = data["text"]
                 post.text_html = emarkdown(data["text"])
                 post.pubdate = datetime.now()
-                post.position = g_topic.get_post_count() + 1
+                post.position = g_topic.next_post_position()
                 post.ip_address = get_client_ip(request)
                 post.save()
                 g_topic.last_message = post
                 g_topic.save()
-                #Send mail
-                subject = "ZDS - Notification : " + g_topic.title
-                from_email = "Zeste de Savoir <{0}>".format(settings.MAIL_NOREPLY)
-                followers = g_topic.get_followers_by_email()
-                for follower in followers:
-                    receiver = follower.user
-                    if receiver == request.user:
+                # Notify the followers who had read the previous message
+                followers = [follower.user for follower in g_topic.get_followers_by_email()
+                             if follower.user != request.user]
+                readers = TopicRead.objects.filter(
+                    topic=g_topic,
+                    post__position=post.position - 1,
+                    user__in=followers).values_list("user", flat=True)
+                readers = set(readers)
+                # The markers not flushed yet are newer than the database
+                buffered = get_buffered_reads_many(
+                    'topic', [follower.pk for follower in followers])
+                for user_pk, marks in buffered.items():
+                    if g_topic.pk not in marks:
                         continue
-                    pos = post.position - 1
-                    last_read = TopicRead.objects.filter(
-                        topic=g_topic,
-                        post__position=pos,
-                        user=receiver).count()
-                    if last_read > 0:
-                        message_html = get_template('email/notification/new.html') \
-                            .render(
-                                Context({
-                                    'username': receiver.username,
-                                    'title':g_topic.title,
-                                    'url': settings.SITE_URL + post.get_absolute_url(),
-                                    'author': request.user.username
-                                })
-                        )
-                        message_txt = get_template('email/notification/new.txt').render(
-                            Context({
-                                'username': receiver.username,
-                                'title':g_topic.title,
-                                'url': settings.SITE_URL + post.get_absolute_url(),
-                                'author': request.user.username
-                            })
-                        )
-                        msg = EmailMultiAlternatives(
-                            subject, message_txt, from_email, [
-                                receiver.email])
-                        msg.attach_alternative(message_html, "text/html")
-                        msg.send()
+                    if marks[g_topic.pk] == last_post_pk:
+                        readers.add(user_pk)
+                    else:
+                        readers.discard(user_pk)
+                queue_emails(
+                    u"ZDS - Notification : " + g_topic.title,
+                    "email/notification/new",
+                    dict((receiver.email, {
+                        'username': receiver.username,
+                        'title': g_topic.title,
+                        'url': settings.SITE_URL + post.get_absolute_url(),
+                        'author': request.user.username
+                    }) for receiver in followers if receiver.pk in readers))
 
                 # Follow topic on answering
                 if not g_topic.is_followed(user=request.user):
@@ -763,6 +738,7 @@ def unread_post(request):
     if not post.topic.forum.can_read(request.user):
         raise PermissionDenied
 
+    discard_buffered_read('topic', request.user.pk, post.topic.pk)
     t = TopicRead.objects.filter(topic=post.topic, user=request.user).first()
     if t is None:
         if post.position > 1:
@@ -797,29 +773,7 @@ def like_post(request):
     if not post.topic.forum.can_read(request.user):
         raise PermissionDenied
     if post.author.pk != request.user.pk:
-
-        # Making sure the user is allowed to do that
-
-        if CommentLike.objects.filter(user__pk=user.pk,
-                                      comments__pk=post_pk).count() == 0:
-            like = CommentLike()
-            like.user = user
-            like.comments = post
-            post.like = post.like + 1
-            post.save()
-            like.save()
-            if CommentDislike.objects.filter(user__pk=user.pk,
-                                             comments__pk=post_pk).count() > 0:
-                CommentDislike.objects.filter(
-                    user__pk=user.pk,
-                    comments__pk=post_pk).all().delete()
-                post.dislike = post.dislike - 1
-                post.save()
-        else:
-            CommentLike.objects.filter(user__pk=user.pk,
-                                       comments__pk=post_pk).all().delete()
-            post.like = post.like - 1
-            post.save()
+        post.toggle_like(user)
     resp["upvotes"] = post.like
     resp["downvotes"] = post.dislike
     if request.is_ajax():
@@ -845,28 +799,7 @@ def dislike_post(request):
     if not post.topic.forum.can_read(request.user):
         raise PermissionDenied
     if post.author.pk != request.user.pk:
-
-        # Making sure the user is allowed to do that
-
-        if CommentDislike.objects.filter(user__pk=user.pk,
-                                         comments__pk=post_pk).count() == 0:
-            dislike = CommentDislike()
-            dislike.user = user
-            dislike.comments = post
-            post.dislike = post.dislike + 1
-            post.save()
-            dislike.save()
-            if CommentLike.objects.filter(user__pk=user.pk,
-                                          comments__pk=post_pk).count() > 0:
-                CommentLike.objects.filter(user__pk=user.pk,
-                                           comments__pk=post_pk).all().delete()
-                post.like = post.like - 1
-                post.save()
-        else:
-            CommentDislike.objects.filter(user__pk=user.pk,
-                                          comments__pk=post_pk).all().delete()
-            post.dislike = post.dislike - 1
-            post.save()
+        post.toggle_dislike(user)
     resp["upvotes"] = post.like
     resp["downvotes"] = post.dislike
     if request.is_ajax():
@@ -892,7 +825,7 @@ def find_topic_by_tag(request, tag_pk, tag_slug):
                 "author",
                 "last_message",
                 "tags")\
-                .exclude(Q(forum__group__isnull=False) & ~Q(forum__group__in=u.groups.all()))\
+                .filter(forum__in=get_readable_forums(u))\
                 .all()
         else:
             topics = Topic.objects.filter(
@@ -901,12 +834,12 @@ def find_topic_by_tag(request, tag_pk, tag_slug):
                 "author",
                 "last_message",
                 "tags")\
-                .exclude(Q(forum__group__isnull=False) & ~Q(forum__group__in=u.groups.all()))\
+                .filter(forum__in=get_readable_forums(u))\
                 .all()
     else:
         filter = None
         topics = Topic.objects.filter(tags__in=[tag]).order_by("-last_message__pubdate")\
-            .exclude(Q(forum__group__isnull=False) & ~Q(forum__group__in=u.groups.all()))\
+            .filter(forum__in=get_readable_forums(u))\
             .prefetch_related("author", "last_message", "tags").all()
     # Paginator
 
@@ -921,6 +854,8 @@ def find_topic_by_tag(request, tag_pk, tag_slug):
     except EmptyPage:
         shown_topics = paginator.page(paginator.num_pages)
         page = paginator.num_pages
+    load_read_state(shown_topics, request.user)
+
     return render_template("forum/find/topic_by_tag.html", {
         "topics": shown_topics,
         "tag": tag,
@@ -938,7 +873,7 @@ def find_topic(request, user_pk):
     topics = \
         Topic.objects\
         .filter(author=displayed_user)\
-        .exclude(Q(forum__group__isnull=False) & ~Q(forum__group__in=request.user.groups.all()))\
+        .filter(forum__in=get_readable_forums(request.user))\
         .prefetch_related("author")\
         .order_by("-pubdate").all()
 
@@ -954,6 +889,7 @@ def find_topic(request, user_pk):
     except EmptyPage:
         shown_topics = paginator.page(paginator.num_pages)
         page = paginator.num_pages
+    load_read_state(shown_topics, request.user)
 
     return render_template("forum/find/topic.html", {
         "topics": shown_topics,
@@ -972,14 +908,14 @@ def find_post(request, user_pk):
     if user.has_perm("forum.change_post"):
         posts = \
             Post.objects.filter(author=displayed_user)\
-            .exclude(Q(topic__forum__group__isnull=False) & ~Q(topic__forum__group__in=user.groups.all()))\
+            .filter(topic__forum__in=get_readable_forums(user))\
             .prefetch_related("author")\
             .order_by("-pubdate").all()
     else:
         posts = \
             Post.objects.filter(author=displayed_user)\
             .filter(is_visible=True)\
-            .exclude(Q(topic__forum__group__isnull=False) & ~Q(topic__forum__group__in=user.groups.all()))\
+            .filter(topic__forum__in=get_readable_forums(user))\
             .prefetch_related("author").order_by("-pubdate").all()
 
     # Paginator
@@ -1020,6 +956,8 @@ def followed_topics(request):
     except EmptyPage:
         shown_topics = paginator.page(paginator.num_pages)
         page = paginator.num_pages
+    load_read_state(shown_topics, request.user)
+
     return render_template("forum/topic/followed.html",
                            {"followed_topics": shown_topics,
                             "pages": paginator_range(page,
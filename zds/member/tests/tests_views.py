@@ -1,18 +1,22 @@
 # coding: utf-8
 
+from datetime import timedelta
 import urllib
 
 from django.conf import settings
 from django.contrib.auth.models import User
 from django.core import mail
+from django.core.management import call_command
 from django.core.urlresolvers import reverse
 from django.test import TestCase
+from django.utils import timezone
 
 from zds.member.factories import ProfileFactory, StaffProfileFactory, NonAsciiProfileFactory
 from zds.member.forms import RegisterForm, ChangeUserForm, ChangePasswordForm
 from zds.member.models import Profile
 
 from zds.member.models import TokenRegister, Ban
+from zds.utils.models import OutgoingEmail
 
 
 class MemberTests(TestCase):
@@ -59,7 +63,9 @@ class MemberTests(TestCase):
 
         self.assertEqual(result.status_code, 200)
 
-        # check email has been sent
+        # check email has been queued then sent
+        self.assertEquals(len(mail.outbox), 0)
+        call_command('send_emails')
         self.assertEquals(len(mail.outbox), 1)
 
         # clic on the link which has been sent in mail
@@ -76,6 +82,36 @@ class MemberTests(TestCase):
 
         self.assertTrue(User.objects.get(username='firm1').is_active)
 
+    def test_forgot_password(self):
+        """To test the email sent when an user forgot his password."""
+        user = ProfileFactory().user
+
+        result = self.client.post(
+            reverse('zds.member.views.forgot_password'),
+            {'username': user.username},
+            follow=False)
+        self.assertEqual(result.status_code, 200)
+        self.assertEqual(OutgoingEmail.objects.filter(recipient=user.email).count(), 1)
+
+        # a failing email is kept in the outbox and retried later
+        OutgoingEmail.objects.create(recipient=user.email, subject=u"Test",
+                                     template="email/unknown")
+        call_command('send_emails')
+        self.assertEquals(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, [user.email])
+        failed = OutgoingEmail.objects.get()
+        self.assertEqual(failed.attempts, 1)
+        self.assertNotEqual(failed.last_error, u'')
+
+        # the email is due again, but it has no attempt left
+        OutgoingEmail.objects.update(
+            next_attempt=timezone.now() - timedelta(seconds=1))
+        with self.settings(MAIL_QUEUE_MAX_ATTEMPTS=1):
+            call_command('send_emails')
+        self.assertEqual(OutgoingEmail.objects.get().attempts, 1)
+        call_command('send_emails')
+        self.assertEqual(OutgoingEmail.objects.get().attempts, 2)
+
     def test_sanctions(self):
         """Test various sanctions."""
 
@@ -11,15 +11,12 @@ from django.contrib.auth.decorators import login_required
 from django.contrib.auth.models import User, Group, Permission, SiteProfileNotAvailable
 from django.core.context_processors import csrf
 from django.core.exceptions import PermissionDenied
-from django.core.mail import EmailMultiAlternatives
 from django.core.paginator import Paginator, PageNotAnInteger, EmptyPage
 from django.core.urlresolvers import reverse
 from django.db import transaction
-from django.db.models import Q
 from django.http import Http404, HttpResponse
 from django.shortcuts import redirect, get_object_or_404
-from django.template import Context, RequestContext
-from django.template.loader import get_template
+from django.template import RequestContext
 from django.views.decorators.http import require_POST
 import json
 import pygal
@@ -30,11 +27,11 @@ from forms import LoginForm, MiniProfileForm, ProfileForm, RegisterForm, \
 from models import Profile, TokenForgotPassword, Ban, TokenRegister, \
     get_info_old_tuto, logout_user
 from zds.gallery.forms import ImageAsAvatarForm
-from zds.article.models import Article
-from zds.forum.models import Topic, follow
+from zds.forum.models import Topic, follow, get_readable_forums
 from zds.member.decorator import can_write_and_read_now
-from zds.tutorial.models import Tutorial
 from zds.utils import render_template
+from zds.utils.mails import queue_email
+from zds.utils.models import PublishedContent
 from zds.utils.mps import send_mp
 from zds.utils.paginator import paginator_range
 from zds.utils.tokens import generate_token
@@ -118,29 +115,20 @@ def details(request, user_name):
         os.makedirs(img_path, mode=0o777)
     fchart = os.path.join(img_path, "mod-{}.svg".format(str(usr.pk)))
     dot_chart.render_to_file(fchart)
-    my_articles = Article.objects.filter(sha_public__isnull=False).order_by(
-        "-pubdate").filter(authors__in=[usr]).all()[:5]
-    my_tutorials = \
-        Tutorial.objects.filter(sha_public__isnull=False) \
-        .filter(authors__in=[usr]) \
-        .order_by("-pubdate"
-                  ).all()[:5]
-    
-    my_tuto_versions = []
-    for my_tutorial in my_tutorials:
-        mandata = my_tutorial.load_json_for_public()
-        my_tutorial.load_dic(mandata)
-        my_tuto_versions.append(mandata)
-    my_article_versions = []
-    for my_article in my_articles:
-        article_version = my_article.load_json_for_public()
-        my_article.load_dic(article_version)
-        my_article_versions.append(article_version)
+    my_article_versions = PublishedContent.objects\
+        .filter(article__isnull=False, authors__in=[usr])\
+        .select_related("article")\
+        .order_by("-pubdate")[:5]
+    my_tuto_versions = PublishedContent.objects\
+        .filter(tutorial__isnull=False, authors__in=[usr])\
+        .select_related("tutorial__image")\
+        .prefetch_related("subcategory")\
+        .order_by("-pubdate")[:5]
 
     my_topics = \
         Topic.objects\
         .filter(author=usr)\
-        .exclude(Q(forum__group__isnull=False) & ~Q(forum__group__in=request.user.groups.all()))\
+        .filter(forum__in=get_readable_forums(request.user))\
         .prefetch_related("author")\
         .order_by("-pubdate").all()[:5]
 
@@ -608,19 +596,11 @@ def register_view(request):
 
             # send email
 
-            subject = "ZDS - Confirmation d'inscription"
-            from_email = "Zeste de Savoir <{0}>".format(settings.MAIL_NOREPLY)
-            message_html = get_template("email/register/confirm.html").render(Context(
-                {"username": user.username, "url": settings.SITE_URL + token.get_absolute_url()}))
-            message_txt = get_template("email/register/confirm.txt") .render(Context(
-                {"username": user.username, "url": settings.SITE_URL + token.get_absolute_url()}))
-            msg = EmailMultiAlternatives(subject, message_txt, from_email,
-                                         [user.email])
-            msg.attach_alternative(message_html, "text/html")
-            try:
-                msg.send()
-            except:
-                msg = None
+            queue_email(user.email,
+                        u"ZDS - Confirmation d'inscription",
+                        "email/register/confirm",
+                        {"username": user.username,
+                         "url": settings.SITE_URL + token.get_absolute_url()})
             return render_template("member/register/success.html", {})
         else:
             return render_template("member/register/index.html", {"form": form})
@@ -650,16 +630,11 @@ def forgot_password(request):
 
             # send email
 
-            subject = "ZDS - Mot de passe oublié"
-            from_email = "Zeste de Savoir <{0}>".format(settings.MAIL_NOREPLY)
-            message_html = get_template("email/forgot_password/confirm.html").render(Context(
-                {"username": usr.username, "url": settings.SITE_URL + token.get_absolute_url()}))
-            message_txt = get_template("email/forgot_password/confirm.txt") .render(Context(
-                {"username": usr.username, "url": settings.SITE_URL + token.get_absolute_url()}))
-            msg = EmailMultiAlternatives(subject, message_txt, from_email,
-                                         [usr.email])
-            msg.attach_alternative(message_html, "text/html")
-            msg.send()
+            queue_email(usr.email,
+                        u"ZDS - Mot de passe oublié",
+                        "email/forgot_password/confirm",
+                        {"username": usr.username,
+                         "url": settings.SITE_URL + token.get_absolute_url()})
             return render_template("member/forgot_password/success.html")
         else:
             return render_template("member/forgot_password/index.html",
@@ -787,23 +762,11 @@ def generate_token_account(request):
 
     # send email
 
-    subject = "ZDS - Confirmation d'inscription"
-    from_email = "Zeste de Savoir <{0}>".format(settings.MAIL_NOREPLY)
-    message_html = get_template("email/register/confirm.html"
-                                ) \
-        .render(Context({"username": token.user.username,
-                         "url": settings.SITE_URL + token.get_absolute_url()}))
-    message_txt = get_template("email/register/confirm.txt"
-                               ) \
-        .render(Context({"username": token.user.username,
-                         "url": settings.SITE_URL + token.get_absolute_url()}))
-    msg = EmailMultiAlternatives(subject, message_txt, from_email,
-                                 [token.user.email])
-    msg.attach_alternative(message_html, "text/html")
-    try:
-        msg.send()
-    except:
-        msg = None
+    queue_email(token.user.email,
+                u"ZDS - Confirmation d'inscription",
+                "email/register/confirm",
+                {"username": token.user.username,
+                 "url": settings.SITE_URL + token.get_absolute_url()})
     return render_template('member/register/success.html', {})
 
 
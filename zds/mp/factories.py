@@ -24,5 +24,7 @@ class PrivatePostFactory(factory.DjangoModelFactory):
         ptopic = kwargs.pop('privatetopic', None)
         if ptopic:
             ptopic.last_message = ppost
-            ptopic.save()
+            ptopic.last_position = max(ptopic.last_position,
+                                       ppost.position_in_topic)
+            ptopic.save(update_fields=['last_message', 'last_position'])
         return ppost
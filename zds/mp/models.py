@@ -7,7 +7,7 @@ from math import ceil
 
 from django.contrib.auth.models import User
 
-from zds.utils import get_current_user
+from zds.utils import get_current_user, next_position, exclude_counters
 from django.core.urlresolvers import reverse
 
 
@@ -29,11 +29,18 @@ class PrivateTopic(models.Model):
                                      related_name='last_message',
                                      verbose_name='Dernier message')
     pubdate = models.DateTimeField('Date de création', auto_now_add=True, db_index=True)
+    last_position = models.IntegerField('Position du dernier message',
+                                        default=0)
 
     def __unicode__(self):
         """Textual form of a thread."""
         return self.title
 
+    def save(self, *args, **kwargs):
+        # the position counter is only written by next_post_position()
+        kwargs = exclude_counters(self, ['last_position'], kwargs)
+        super(PrivateTopic, self).save(*args, **kwargs)
+
     def get_absolute_url(self):
         return reverse('zds.mp.views.topic',
                        kwargs={'topic_pk': self.pk,
@@ -43,6 +50,10 @@ class PrivateTopic(models.Model):
         """Return the number of private posts in the private topic."""
         return PrivatePost.objects.filter(privatetopic__pk=self.pk).count()
 
+    def next_post_position(self):
+        """Allocate the position of a new private post in the topic."""
+        return next_position(self, 'last_position')
+
     def get_last_answer(self):
         """Gets the last answer in the thread, if any."""
         last_post = PrivatePost.objects\
@@ -7,21 +7,19 @@ from django.contrib import messages
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.models import User
 from django.core.exceptions import PermissionDenied
-from django.core.mail import EmailMultiAlternatives
 from django.core.paginator import Paginator, PageNotAnInteger, EmptyPage
 from django.core.urlresolvers import reverse
 from django.db import transaction
 from django.db.models import Q
 from django.http import Http404
 from django.shortcuts import redirect, get_object_or_404
-from django.template import Context
-from django.template.loader import get_template
 from django.views.decorators.http import require_POST
 from django.forms.util import ErrorList
 
 from zds.utils import render_template, slugify
+from zds.utils.mails import queue_emails
 from zds.utils.mps import send_mp
-from zds.utils.paginator import paginator_range
+from zds.utils.paginator import paginator_range, PositionPaginator
 from zds.utils.templatetags.emarkdown import emarkdown
 
 from .forms import PrivateTopicForm, PrivatePostForm
@@ -98,37 +96,28 @@ def topic(request, topic_pk, topic_slug):
         if never_privateread(g_topic):
             mark_read(g_topic)
 
-    posts = PrivatePost.objects.filter(privatetopic__pk=g_topic.pk)\
-        .order_by('position_in_topic')\
-        .all()
+    posts = PrivatePost.objects.filter(privatetopic__pk=g_topic.pk)
 
     last_post_pk = g_topic.last_message.pk
 
     # Handle pagination
-    paginator = Paginator(posts, settings.POSTS_PER_PAGE)
+    paginator = PositionPaginator(posts, settings.POSTS_PER_PAGE,
+                                  g_topic.last_message.position_in_topic,
+                                  position_field='position_in_topic')
 
     try:
         page_nbr = int(request.GET['page'])
     except KeyError:
         page_nbr = 1
 
+    # Show the last post of the previous page too
     try:
-        posts = paginator.page(page_nbr)
+        res = paginator.page(page_nbr)
     except PageNotAnInteger:
-        posts = paginator.page(1)
+        res = paginator.page(1)
     except EmptyPage:
         raise Http404
 
-    res = []
-    if page_nbr != 1:
-        # Show the last post of the previous page
-        last_page = paginator.page(page_nbr - 1).object_list
-        last_post = (last_page)[len(last_page) - 1]
-        res.append(last_post)
-
-    for post in posts:
-        res.append(post)
-
     # Build form to add an answer for the current topid.
     form = PrivatePostForm(g_topic, request.user)
 
@@ -251,6 +240,7 @@ def edit(request):
 
 
 @login_required
+@transaction.atomic
 def answer(request):
     """Adds an answer from an user to a topic."""
     try:
@@ -302,50 +292,31 @@ def answer(request):
                 post.text = data['text']
                 post.text_html = emarkdown(data['text'])
                 post.pubdate = datetime.now()
-                post.position_in_topic = g_topic.get_post_count() + 1
+                post.position_in_topic = g_topic.next_post_position()
                 post.save()
 
                 g_topic.last_message = post
                 g_topic.save()
 
-                # send email
-                subject = "ZDS - MP : " + g_topic.title
-                from_email = "Zeste de Savoir <{0}>".format(settings.MAIL_NOREPLY)
-                parts = list(g_topic.participants.all())
+                # send email to the participants who had read the previous
+                # message
+                parts = list(g_topic.participants.select_related("profile"))
                 parts.append(g_topic.author)
                 parts.remove(request.user)
-                for part in parts:
-                    profile = part.profile
-                    if profile.email_for_answer:
-                        pos = post.position_in_topic - 1
-                        last_read = PrivateTopicRead.objects.filter(
-                            privatetopic=g_topic,
-                            privatepost__position_in_topic=pos,
-                            user=part).count()
-                        if last_read > 0:
-                            message_html = get_template('email/mp/new.html') \
-                                .render(
-                                    Context({
-                                        'username': part.username,
-                                        'url': settings.SITE_URL
-                                        + post.get_absolute_url(),
-                                        'author': request.user.username
-                                    })
-                            )
-                            message_txt = get_template('email/mp/new.txt').render(
-                                Context({
-                                    'username': part.username,
-                                    'url': settings.SITE_URL
-                                    + post.get_absolute_url(),
-                                    'author': request.user.username
-                                })
-                            )
-
-                            msg = EmailMultiAlternatives(
-                                subject, message_txt, from_email, [
-                                    part.email])
-                            msg.attach_alternative(message_html, "text/html")
-                            msg.send()
+                parts = [part for part in parts if part.profile.email_for_answer]
+                readers = PrivateTopicRead.objects.filter(
+                    privatetopic=g_topic,
+                    privatepost__position_in_topic=post.position_in_topic - 1,
+                    user__in=parts).values_list("user", flat=True)
+                readers = set(readers)
+                queue_emails(
+                    u"ZDS - MP : " + g_topic.title,
+                    "email/mp/new",
+                    dict((part.email, {
+                        'username': part.username,
+                        'url': settings.SITE_URL + post.get_absolute_url(),
+                        'author': request.user.username
+                    }) for part in parts if part.pk in readers))
 
                 return redirect(post.get_absolute_url())
             else:
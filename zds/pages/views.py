@@ -26,17 +26,8 @@ from zds.utils.models import Alert
 def home(request):
     """Display the home page with last topics added."""
 
-    tutos = []
-    for tuto in get_last_tutorials():
-        data = tuto.load_json_for_public()
-        tuto.load_dic(data)
-        tutos.append(data)
-
-    articles = []
-    for article in get_last_articles():
-        data = article.load_json_for_public()
-        data = article.load_dic(data)
-        articles.append(data)
+    tutos = get_last_tutorials()
+    articles = get_last_articles()
 
     try:
         with open(os.path.join(SITE_ROOT, 'quotes.txt'), 'r') as fh:
@@ -260,6 +260,8 @@ TOP_TAG_MAX = 2
 POSTS_PER_PAGE = 21
 TOPICS_PER_PAGE = 21
 MEMBERS_PER_PAGE = 36
+TUTORIALS_PER_PAGE = 21
+ARTICLES_PER_PAGE = 21
 
 # Constants to avoid spam
 SPAM_LIMIT_SECONDS = 60 * 15
@@ -307,6 +309,88 @@ MAIL_CA_ASSO = 'ca-zeste-de-savoir@googlegroups.com'
 # WITHOUT THE APPROVAL OF THE ASSOCIATION COMMITEE
 MAIL_NOREPLY = 'noreply@zestedesavoir.com'
 
+# Emails of the outbox sent at once by the send_emails command, and number of
+# tries before giving up on an email. A failed email is tried again after
+# MAIL_QUEUE_RETRY_DELAY seconds, doubled at each try, and an email is kept
+# for the worker sending it for MAIL_QUEUE_CLAIM_TIMEOUT seconds.
+MAIL_QUEUE_BATCH_SIZE = 100
+MAIL_QUEUE_MAX_ATTEMPTS = 5
+MAIL_QUEUE_RETRY_DELAY = 60
+MAIL_QUEUE_CLAIM_TIMEOUT = 60 * 10
+
+# Seconds a feed is kept in cache, the feeds are also invalidated by their
+# new items
+FEEDS_CACHE_TIMEOUT = 60 * 60
+
+# The read markers are buffered in the cache and written by the
+# flush_read_markers command, or once this number of markers is waiting
+READ_MARKERS_FLUSH_THRESHOLD = 500
+# Seconds a buffered read marker is kept in the cache
+READ_MARKERS_TIMEOUT = 60 * 60 * 24
+
+# Manifests of the tutorials and articles kept in the memory of each process,
+# they are also kept in memcached
+MANIFEST_CACHE_SIZE = 500
+
+# Trees of the versions of the tutorials kept in the memory of each process,
+# and texts read by the views (introductions, conclusions and extracts) kept
+# for all the trees
+CONTENT_TREE_CACHE_SIZE = 100
+CONTENT_TEXTS_CACHE_SIZE = 1000
+
+# HTML of the markdown files of the repositories kept in the memory of each
+# process, by blob, and seconds it's kept in memcached. The version is part of
+# the keys in memcached: change it when the markdown rendering changes.
+RENDER_CACHE_SIZE = 500
+RENDER_CACHE_TIMEOUT = 60 * 60 * 24 * 7
+RENDER_CACHE_VERSION = 1
+
+# Git repositories kept open by each thread
+REPO_POOL_SIZE = 20
+
+# Processes rendering the markdown files of a tutorial during its publication,
+# None for one per CPU. They're forked by the web worker handling the request
+# of the validator, keep it small: 1 renders the files in that worker.
+PUBLICATION_WORKERS = 2
+
+# Remote images of a tutorial fetched at once during its publication, and
+# seconds before a fetch is given up. The fetched images are kept in
+# IMAGES_CACHE_PATH, and the url of an image isn't fetched again for
+# IMAGES_URL_TIMEOUT seconds.
+IMAGES_FETCH_WORKERS = 8
+IMAGES_FETCH_TIMEOUT = 10
+IMAGES_CACHE_PATH = os.path.join(SITE_ROOT, 'images-cache')
+IMAGES_URL_TIMEOUT = 60 * 60 * 24
+# Seconds an unused image is kept in IMAGES_CACHE_PATH
+IMAGES_CACHE_MAX_AGE = 60 * 60 * 24 * 30
+
+# Pandoc processes run at once by the run_export_jobs command, seconds before
+# an export is given up (a job still running after twice that was left by a
+# stopped worker, it's run again), and characters of the pandoc output kept
+# with a job
+EXPORT_MAX_PROCESSES = 3
+EXPORT_TIMEOUT = 60 * 10
+EXPORT_LOG_LENGTH = 10000
+# Store of the exports, by digest of their content, and seconds an unused
+# export is kept there
+EXPORT_ARTIFACTS_PATH = os.path.join(SITE_ROOT, 'exports')
+EXPORT_ARTIFACTS_MAX_AGE = 60 * 60 * 24 * 30
+
+# Words of the introduction kept in the lists of the published contents
+PUBLISHED_INTRODUCTION_WORDS = 50
+
+# Zip archives of the published tutorials and articles, by sha, removed by the
+# clean_archives command once their version isn't published anymore
+ARCHIVES_PATH = os.path.join(SITE_ROOT, 'archives')
+
+# Header sending the downloaded files by the web server: None to send them
+# from Django, 'X-Sendfile' (Apache, lighttpd) or 'X-Accel-Redirect' (nginx).
+# nginx gets the path under SENDFILE_ROOT, prefixed by SENDFILE_URL, which
+# has to be an internal location of its configuration.
+SENDFILE_HEADER = None
+SENDFILE_ROOT = SITE_ROOT
+SENDFILE_URL = '/protected/'
+
 # DEFAULT LICENCE :
 DEFAULT_LICENCE_PK = 7
 
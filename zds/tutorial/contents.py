@@ -0,0 +1,426 @@
+# coding: utf-8
+
+"""Tree of a version of a tutorial, built from its manifest.
+
+The tree of a version is built once, with the slugs, the positions and the
+urls of its parts, chapters and extracts, and it's never modified: the
+views share it through a small LRU of the process, keyed by the version.
+The texts (introductions, conclusions and extracts) are only read when
+they are used, from the repository for the drafts and from the production
+directory for the public version. They aren't kept by the trees but by
+another LRU of the process, of `CONTENT_TEXTS_CACHE_SIZE` texts, keyed by
+the version and the path of the text.
+"""
+
+from collections import OrderedDict
+import os
+import threading
+
+from django.conf import settings
+from django.core.urlresolvers import reverse
+
+from zds.utils import slugify
+from zds.utils.manifests import SHA_RE, get_manifest
+from zds.utils.repositories import get_repo
+from zds.utils.tutorials import get_blob, CommitReader
+
+
+_texts = OrderedDict()
+_texts_lock = threading.Lock()
+
+
+class Texts(object):
+
+    """Texts of a version of a tutorial, read once each. Those of a version
+    identified by `version` are kept in the LRU of the texts, the others
+    by this object only."""
+
+    def __init__(self, version=None):
+        self.version = version
+        self.texts = {}
+
+    def get(self, chemin):
+        """Return the kept text of a path, a missing file is None, or raise
+        KeyError if it isn't kept."""
+        if self.version is None:
+            return self.texts[chemin]
+        key = (self.version, chemin)
+        with _texts_lock:
+            text = _texts.pop(key)
+            # the most recently used texts are at the end
+            _texts[key] = text
+            return text
+
+    def set(self, chemin, text):
+        if self.version is None:
+            self.texts[chemin] = text
+            return
+        key = (self.version, chemin)
+        with _texts_lock:
+            _texts.pop(key, None)
+            _texts[key] = text
+            while len(_texts) > settings.CONTENT_TEXTS_CACHE_SIZE:
+                _texts.popitem(last=False)
+
+    def is_kept(self, chemin):
+        try:
+            self.get(chemin)
+        except KeyError:
+            return False
+        return True
+
+
+class RepositoryTexts(Texts):
+
+    """Texts of a commit of the repository of a tutorial."""
+
+    def __init__(self, repo_path, sha):
+        # Only a full sha identifies a commit, a reference can move
+        version = None
+        if sha is not None and SHA_RE.match(sha):
+            version = ("draft", repo_path, sha)
+        super(RepositoryTexts, self).__init__(version)
+        self.repo_path = repo_path
+        self.sha = sha
+
+    def read(self, chemin):
+        try:
+            return self.get(chemin)
+        except KeyError:
+            # the repositories are opened by each thread
+            tree = get_repo(self.repo_path).commit(self.sha).tree
+            text = get_blob(tree, chemin)
+            self.set(chemin, text)
+            return text
+
+    def read_many(self, chemins):
+        """Read the texts of several paths with a single git call."""
+        chemins = [chemin for chemin in chemins if not self.is_kept(chemin)]
+        if chemins:
+            reader = CommitReader(get_repo(self.repo_path), self.sha)
+            for chemin, text in reader.read_many(chemins).items():
+                self.set(chemin, text)
+
+
+class ProductionTexts(Texts):
+
+    """Texts of the production directory of a tutorial: the rendered
+    files, or the markdown ones when `extension` is empty. The texts are
+    only kept for the next trees when the published `sha` is given."""
+
+    def __init__(self, prod_path, extension=".html", sha=None):
+        version = None
+        if sha is not None:
+            version = ("online", prod_path, extension, sha)
+        super(ProductionTexts, self).__init__(version)
+        self.prod_path = prod_path
+        self.extension = extension
+
+    def read(self, chemin):
+        try:
+            return self.get(chemin)
+        except KeyError:
+            path = os.path.join(self.prod_path, chemin + self.extension)
+            text = None
+            if os.path.isfile(path):
+                with open(path, "r") as f:
+                    text = f.read().decode("utf-8")
+            self.set(chemin, text)
+            return text
+
+    def read_many(self, chemins):
+        for chemin in chemins:
+            self.read(chemin)
+
+
+class Node(object):
+
+    """Read-only node of the tree of a tutorial."""
+
+    __slots__ = ("_texts",)
+
+    def __init__(self, texts, **attrs):
+        object.__setattr__(self, "_texts", texts)
+        for name, value in attrs.items():
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(
+            "{0} is read-only".format(self.__class__.__name__))
+
+    def _read(self, chemin):
+        if not chemin:
+            return None
+        return self._texts.read(chemin)
+
+
+class ContainerNode(Node):
+
+    """Node with an introduction and a conclusion."""
+
+    __slots__ = ("introduction", "conclusion")
+
+    @property
+    def intro(self):
+        return self._read(self.introduction)
+
+    @property
+    def conclu(self):
+        return self._read(self.conclusion)
+
+
+class ExtractNode(Node):
+
+    __slots__ = ("pk", "title", "text", "chapter", "position_in_chapter",
+                 "get_absolute_url", "get_absolute_url_online")
+
+    @property
+    def txt(self):
+        return self._read(self.text)
+
+
+class ChapterNode(ContainerNode):
+
+    __slots__ = ("pk", "title", "slug", "type", "tutorial", "part",
+                 "position_in_part", "position_in_tutorial", "extracts",
+                 "get_absolute_url", "get_absolute_url_online")
+
+
+class PartNode(ContainerNode):
+
+    __slots__ = ("pk", "title", "slug", "tutorial", "position_in_tutorial",
+                 "chapters", "get_chapters", "get_absolute_url",
+                 "get_absolute_url_online")
+
+
+class TutorialNode(ContainerNode):
+
+    __slots__ = ("pk", "title", "slug", "description", "type", "licence",
+                 "parts", "get_parts", "chapter", "get_absolute_url",
+                 "get_absolute_url_online")
+
+    def get_chapters(self):
+        """Return all the chapters of the tutorial, in their order."""
+        if self.chapter is not None:
+            return [self.chapter]
+        return [chapter for part in self.parts for chapter in part.chapters]
+
+    def get_part(self, pk):
+        """Return the part of the given pk, or None."""
+        for part in self.parts:
+            if str(part.pk) == str(pk):
+                return part
+        return None
+
+    def get_chapter(self, pk):
+        """Return the chapter of the given pk, or None."""
+        for chapter in self.get_chapters():
+            if str(chapter.pk) == str(pk):
+                return chapter
+        return None
+
+    def get_extracts(self):
+        """Return all the extracts of the tutorial, in their order."""
+        return [extract for chapter in self.get_chapters()
+                for extract in chapter.extracts]
+
+    def load_texts(self, nodes):
+        """Read the texts of several nodes at once."""
+        chemins = []
+        for node in nodes:
+            if isinstance(node, ExtractNode):
+                chemins.append(node.text)
+            else:
+                chemins.extend([node.introduction, node.conclusion])
+        self._texts.read_many([chemin for chemin in chemins if chemin])
+
+    def to_dict(self):
+        """Return a new dictionary of the tutorial, the views fill it with
+        the fields of the database (`load_dic()`)."""
+        return {
+            "title": self.title,
+            "description": self.description,
+            "type": self.type,
+            "licence": self.licence,
+            "introduction": self.introduction,
+            "conclusion": self.conclusion,
+            "parts": self.parts,
+            "get_parts": self.get_parts,
+            "chapter": self.chapter,
+        }
+
+
+def _build_extracts(manifest, texts, chapter, url, url_online):
+    extracts = []
+    for position, extract in enumerate(manifest.get("extracts", []), 1):
+        anchor = "#{0}-{1}".format(position, slugify(extract["title"]))
+        extracts.append(ExtractNode(
+            texts,
+            pk=extract.get("pk"),
+            title=extract["title"],
+            text=extract.get("text"),
+            chapter=chapter,
+            position_in_chapter=position,
+            get_absolute_url=url + anchor,
+            get_absolute_url_online=url_online + anchor))
+    return tuple(extracts)
+
+
+def build_tree(manifest, pk, texts, chapter_pk=None):
+    """Build the tree of a tutorial from its manifest.
+
+    `texts` reads the texts of the nodes. The manifest of a small tutorial
+    doesn't have the pk of its chapter, it's given by `chapter_pk`.
+    """
+    slug = slugify(manifest["title"])
+    tutorial = TutorialNode(
+        texts,
+        pk=pk,
+        title=manifest["title"],
+        slug=slug,
+        description=manifest.get("description"),
+        type=manifest.get("type"),
+        licence=manifest.get("licence"),
+        introduction=manifest.get("introduction"),
+        conclusion=manifest.get("conclusion"),
+        get_absolute_url=reverse("zds.tutorial.views.view_tutorial",
+                                 args=[pk, slug]),
+        get_absolute_url_online=reverse(
+            "zds.tutorial.views.view_tutorial_online", args=[pk, slug]))
+
+    chapter = None
+    parts = ()
+    if "chapter" in manifest:
+        # the chapter of a small tutorial has its introduction and conclusion
+        chapter = ChapterNode(
+            texts,
+            pk=chapter_pk,
+            title=manifest["title"],
+            slug=slug,
+            type="MINI",
+            tutorial=tutorial,
+            part=None,
+            position_in_part=1,
+            position_in_tutorial=1,
+            introduction=tutorial.introduction,
+            conclusion=tutorial.conclusion,
+            get_absolute_url=tutorial.get_absolute_url,
+            get_absolute_url_online=tutorial.get_absolute_url_online)
+        object.__setattr__(chapter, "extracts", _build_extracts(
+            manifest["chapter"], texts, chapter,
+            chapter.get_absolute_url, chapter.get_absolute_url_online))
+    elif "parts" in manifest:
+        parts = []
+        position_in_tutorial = 1
+        for position, part_manifest in enumerate(manifest["parts"], 1):
+            part_slug = slugify(part_manifest["title"])
+            args = [pk, slug, part_manifest["pk"], part_slug]
+            part = PartNode(
+                texts,
+                pk=part_manifest["pk"],
+                title=part_manifest["title"],
+                slug=part_slug,
+                tutorial=tutorial,
+                position_in_tutorial=position,
+                introduction=part_manifest.get("introduction"),
+                conclusion=part_manifest.get("conclusion"),
+                get_absolute_url=reverse("zds.tutorial.views.view_part",
+                                         args=args),
+                get_absolute_url_online=reverse(
+                    "zds.tutorial.views.view_part_online", args=args))
+
+            chapters = []
+            for chapter_position, chapter_manifest in enumerate(
+                    part_manifest.get("chapters", []), 1):
+                chapter_slug = slugify(chapter_manifest["title"])
+                suffix = "{0}/{1}/".format(chapter_manifest["pk"],
+                                           chapter_slug)
+                part_chapter = ChapterNode(
+                    texts,
+                    pk=chapter_manifest["pk"],
+                    title=chapter_manifest["title"],
+                    slug=chapter_slug,
+                    type="BIG",
+                    tutorial=None,
+                    part=part,
+                    position_in_part=chapter_position,
+                    position_in_tutorial=position_in_tutorial,
+                    introduction=chapter_manifest.get("introduction"),
+                    conclusion=chapter_manifest.get("conclusion"),
+                    get_absolute_url=part.get_absolute_url + suffix,
+                    get_absolute_url_online=part.get_absolute_url_online
+                    + suffix)
+                object.__setattr__(part_chapter, "extracts", _build_extracts(
+                    chapter_manifest, texts, part_chapter,
+                    part_chapter.get_absolute_url,
+                    part_chapter.get_absolute_url_online))
+                chapters.append(part_chapter)
+                position_in_tutorial += 1
+
+            object.__setattr__(part, "chapters", tuple(chapters))
+            object.__setattr__(part, "get_chapters", part.chapters)
+            parts.append(part)
+        parts = tuple(parts)
+
+    object.__setattr__(tutorial, "chapter", chapter)
+    object.__setattr__(tutorial, "parts", parts)
+    object.__setattr__(tutorial, "get_parts", parts)
+    return tutorial
+
+
+_trees = OrderedDict()
+_trees_lock = threading.Lock()
+
+
+def _get_local(key):
+    with _trees_lock:
+        tree = _trees.pop(key, None)
+        if tree is not None:
+            # the most recently used trees are at the end
+            _trees[key] = tree
+        return tree
+
+
+def _set_local(key, tree):
+    with _trees_lock:
+        _trees.pop(key, None)
+        _trees[key] = tree
+        while len(_trees) > settings.CONTENT_TREE_CACHE_SIZE:
+            _trees.popitem(last=False)
+
+
+def get_tree(tutorial, sha):
+    """Return the tree of a version of the repository of a tutorial."""
+    from zds.tutorial.models import Chapter
+
+    # Only a full sha identifies a commit, a reference can move
+    key = ("draft", tutorial.pk, sha)
+    cacheable = sha is not None and SHA_RE.match(sha)
+    tree = _get_local(key) if cacheable else None
+    if tree is None:
+        manifest = get_manifest(tutorial.get_path(), sha)
+        chapter_pk = None
+        if "chapter" in manifest:
+            chapter = Chapter.objects.filter(tutorial__pk=tutorial.pk).first()
+            if chapter is not None:
+                chapter_pk = chapter.pk
+        tree = build_tree(manifest, tutorial.pk,
+                          RepositoryTexts(tutorial.get_path(), sha),
+                          chapter_pk)
+        if cacheable:
+            _set_local(key, tree)
+    return tree
+
+
+def get_online_tree(tutorial):
+    """Return the tree of the public version of a tutorial, its texts are
+    the rendered files of the production directory."""
+    prod_path = tutorial.get_prod_path()
+    key = ("online", tutorial.pk, tutorial.sha_public, prod_path)
+    tree = _get_local(key)
+    if tree is None:
+        tree = build_tree(tutorial.load_json_for_online(), tutorial.pk,
+                          ProductionTexts(prod_path,
+                                          sha=tutorial.sha_public))
+        _set_local(key, tree)
+    return tree
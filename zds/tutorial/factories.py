@@ -289,7 +289,9 @@ class NoteFactory(factory.DjangoModelFactory):
         tutorial = kwargs.pop('tutorial', None)
         if tutorial:
             tutorial.last_note = note
-            tutorial.save()
+            tutorial.last_note_position = max(tutorial.last_note_position,
+                                              note.position)
+            tutorial.save(update_fields=['last_note', 'last_note_position'])
         return note
 
 class SubCategoryFactory(factory.DjangoModelFactory):
@@ -1,21 +1,23 @@
 # coding: utf-8
 
-from django.contrib.syndication.views import Feed
-
 from django.utils.feedgenerator import Atom1Feed
 
-from .models import Tutorial
+from zds.utils.feeds import CachedFeed
+from zds.utils.models import PublishedContent
 
 
-class LastTutorialsFeedRSS(Feed):
+class LastTutorialsFeedRSS(CachedFeed):
     title = "Tutoriels sur Zeste de Savoir"
     link = "/tutoriels/"
     description = "Les derniers tutoriels parus sur Zeste de Savoir."
 
+    cache_group = 'tutorial'
+
     def items(self):
-        return Tutorial.objects\
-            .filter(sha_public__isnull=False)\
-            .order_by('-pubdate')[:5]
+        return PublishedContent.objects\
+            .filter(tutorial__isnull=False)\
+            .order_by('-pubdate')\
+            .prefetch_related('authors')[:5]
 
     def item_title(self, item):
         return item.title
@@ -35,7 +37,7 @@ class LastTutorialsFeedRSS(Feed):
         return authors
 
     def item_link(self, item):
-        return item.get_absolute_url()
+        return item.get_absolute_url_online()
 
 
 class LastTutorialsFeedATOM(LastTutorialsFeedRSS):
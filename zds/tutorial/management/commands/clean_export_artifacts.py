@@ -0,0 +1,13 @@
+# coding: utf-8
+
+from django.core.management.base import NoArgsCommand
+
+from zds.utils.tutorials import clean_export_artifacts
+
+
+class Command(NoArgsCommand):
+    help = u"Removes the stored exports unused for EXPORT_ARTIFACTS_MAX_AGE seconds."
+
+    def handle_noargs(self, **options):
+        nb_removed = clean_export_artifacts()
+        self.stdout.write(u"{0} export(s) supprimé(s)".format(nb_removed))
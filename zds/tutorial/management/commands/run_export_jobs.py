@@ -0,0 +1,27 @@
+# coding: utf-8
+
+import time
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+
+from zds.utils.tutorials import run_export_jobs
+
+
+class Command(BaseCommand):
+    help = u"Builds the HTML, PDF and EPUB exports of the published tutorials."
+    option_list = BaseCommand.option_list + (
+        make_option('--limit', type='int', dest='limit', default=None,
+                    help=u"Maximum number of exports built by batch."),
+        make_option('--loop', type='int', dest='loop', default=None,
+                    help=u"Keep running and check the exports asked for every LOOP seconds."),
+    )
+
+    def handle(self, *args, **options):
+        while True:
+            nb_jobs = run_export_jobs(options['limit'])
+            if nb_jobs:
+                self.stdout.write(u"{0} export(s) généré(s)".format(nb_jobs))
+            if not options['loop']:
+                break
+            time.sleep(options['loop'])
@@ -1,5 +1,6 @@
 # coding: utf-8
 
+from datetime import timedelta
 from math import ceil
 try:
     import ujson as json_reader
@@ -16,13 +17,21 @@ from django.conf import settings
 from django.contrib.auth.models import User
 from django.core.urlresolvers import reverse
 from django.db import models
+from django.db.models import Q
+from django.dispatch import receiver
 from django.utils import timezone
-from git.repo import Repo
 
 from zds.gallery.models import Image, Gallery
-from zds.utils import slugify, get_current_user
-from zds.utils.models import SubCategory, Licence, Comment
-from zds.utils.tutorials import get_blob, export_tutorial
+from zds.utils import slugify, get_current_user, next_position, \
+    exclude_counters
+from zds.utils.feeds import invalidate_feeds
+from zds.utils.manifests import get_manifest
+from zds.utils.models import SubCategory, Licence, Comment, publish_content, \
+    PublishedContent, update_published_lists
+from zds.utils.read_markers import buffer_read, get_buffered_reads
+from zds.utils.repositories import get_repo
+from zds.utils.tutorials import get_blob, export_tutorial, \
+    get_export_digest, install_export_artifact
 
 
 TYPE_CHOICES = (
@@ -37,6 +46,20 @@ STATUS_CHOICES = (
     ('REJECT', 'Rejeté'),
 )
 
+EXPORT_FORMATS = (
+    ('html', 'HTML'),
+    ('pdf', 'PDF'),
+    ('epub', 'EPUB'),
+)
+
+EXPORT_STATUS_CHOICES = (
+    ('PENDING', 'En attente'),
+    ('RUNNING', 'En cours'),
+    ('SUCCESS', 'Terminé'),
+    ('FAILURE', 'Échec'),
+    ('CANCELED', 'Annulé'),
+)
+
 
 class Tutorial(models.Model):
 
@@ -79,6 +102,8 @@ class Tutorial(models.Model):
                                       blank=True, null=True, max_length=80, db_index=True)
     sha_draft = models.CharField('Sha1 de la version de rédaction',
                                  blank=True, null=True, max_length=80, db_index=True)
+    slug_public = models.SlugField('Slug de la version publique',
+                                   blank=True, null=True, max_length=80)
 
     licence = models.ForeignKey(Licence,
                                 verbose_name='Licence',
@@ -107,6 +132,8 @@ class Tutorial(models.Model):
     last_note = models.ForeignKey('Note', blank=True, null=True,
                                   related_name='last_note',
                                   verbose_name='Derniere note')
+    last_note_position = models.IntegerField('Position de la dernière note',
+                                             default=0)
     is_locked = models.BooleanField('Est verrouillé', default=False)
 
     def __unicode__(self):
@@ -176,11 +203,19 @@ class Tutorial(models.Model):
         else:
             return os.path.join(settings.REPO_PATH, self.get_phy_slug())
 
-    def get_prod_path(self):
-        data = self.load_json_for_public()
-        return os.path.join(
-            settings.REPO_PATH_PROD,
-            str(self.pk) + '_' + slugify(data['title']))
+    def get_prod_path(self, slug_public=None):
+        """Return the production directory of the public version, or of a
+        public version whose slug would be `slug_public`."""
+        if slug_public is None:
+            if not self.slug_public and self.sha_public:
+                # published before the slug of the public version was stored
+                self.slug_public = slugify(
+                    self.load_json_for_public()['title'])
+                Tutorial.objects.filter(pk=self.pk)\
+                    .update(slug_public=self.slug_public)
+            slug_public = self.slug_public or slugify(self.title)
+        return os.path.join(settings.REPO_PATH_PROD,
+                            str(self.pk) + '_' + slug_public)
 
     def load_dic(self, mandata, sha=None):
         '''fill mandata with informations from database model'''
@@ -247,11 +282,23 @@ class Tutorial(models.Model):
     def load_json_for_public(self, sha=None):
         if sha is None:
             sha = self.sha_public
-        repo = Repo(self.get_path())
-        mantuto = get_blob(repo.commit(sha).tree, 'manifest.json')
-        data = json_reader.loads(mantuto)
-
-        return data
+        return get_manifest(self.get_path(), sha)
+
+    def load_json_for_online(self):
+        '''Load the manifest of the public version from the production
+        directory, without reading the repository'''
+        mandata = self.load_json(online=True)
+        if mandata is None:
+            mandata = self.load_json_for_public()
+        return mandata
+
+    def update_published_content(self):
+        '''Write the listing of the public version of the tutorial'''
+        mandata = self.load_json_for_online()
+        return publish_content(self,
+                               mandata['title'],
+                               mandata.get('description', self.description),
+                               self.get_introduction_online())
 
     def load_json(self, path=None, online=False):
 
@@ -286,10 +333,9 @@ class Tutorial(models.Model):
         # find hash code
         if sha is None:
             sha = self.sha_draft
-        repo = Repo(self.get_path())
+        repo = get_repo(self.get_path())
         
-        manifest = get_blob(repo.commit(sha).tree, "manifest.json")
-        tutorial_version = json_reader.loads(manifest)
+        tutorial_version = get_manifest(self.get_path(), sha)
         if "introduction" in tutorial_version:
             path_tuto = tutorial_version["introduction"]
 
@@ -313,10 +359,9 @@ class Tutorial(models.Model):
         # find hash code
         if sha is None:
             sha = self.sha_draft
-        repo = Repo(self.get_path())
+        repo = get_repo(self.get_path())
         
-        manifest = get_blob(repo.commit(sha).tree, "manifest.json")
-        tutorial_version = json_reader.loads(manifest)
+        tutorial_version = get_manifest(self.get_path(), sha)
         if "introduction" in tutorial_version:
             path_tuto = tutorial_version["conclusion"]
 
@@ -339,12 +384,18 @@ class Tutorial(models.Model):
     def save(self, *args, **kwargs):
         self.slug = slugify(self.title)
 
+        # the position counter is only written by next_note_position()
+        kwargs = exclude_counters(self, ['last_note_position'], kwargs)
         super(Tutorial, self).save(*args, **kwargs)
 
     def get_note_count(self):
         """Return the number of notes in the tutorial."""
         return Note.objects.filter(tutorial__pk=self.pk).count()
 
+    def next_note_position(self):
+        """Allocate the position of a new note on the tutorial."""
+        return next_position(self, 'last_note_position')
+
     def get_last_note(self):
         """Gets the last answer in the thread, if any."""
         return Note.objects.all()\
@@ -359,8 +410,22 @@ class Tutorial(models.Model):
             .order_by('pubdate')\
             .first()
 
+    def buffered_read_note(self):
+        """Return the last note read by the user if its marker is still in
+        the write-behind buffer, None otherwise."""
+        user = get_current_user()
+        if user is None:
+            return None
+        pk = get_buffered_reads('tutorial', user.pk).get(self.pk)
+        if pk is None:
+            return None
+        return Note.objects.filter(pk=pk).first()
+
     def last_read_note(self):
         """Return the last post the user has read."""
+        buffered = self.buffered_read_note()
+        if buffered is not None:
+            return buffered
         try:
             return TutorialRead.objects\
                 .select_related()\
@@ -372,9 +437,11 @@ class Tutorial(models.Model):
     def first_unread_note(self):
         """Return the first note the user has unread."""
         try:
-            last_note = TutorialRead.objects\
-                .filter(tutorial=self, user=get_current_user())\
-                .latest('note__pubdate').note
+            last_note = self.buffered_read_note()
+            if last_note is None:
+                last_note = TutorialRead.objects\
+                    .filter(tutorial=self, user=get_current_user())\
+                    .latest('note__pubdate').note
 
             next_note = Note.objects.filter(
                 tutorial__pk=self.pk,
@@ -422,23 +489,31 @@ class Tutorial(models.Model):
         return os.path.isfile(os.path.join(self.get_prod_path(),
                                            self.slug +
                                            ".md"))
+
+    def have_export(self, format):
+        """Check if an export of the tutorial exists or is being built."""
+        if os.path.isfile(os.path.join(self.get_prod_path(),
+                                       self.slug + "." + format)):
+            return True
+        return ExportJob.objects.filter(tutorial=self,
+                                        format=format,
+                                        status__in=['PENDING', 'RUNNING'])\
+            .exists()
+
     def have_html(self):
-        return os.path.isfile(os.path.join(self.get_prod_path(),
-                                           self.slug +
-                                           ".html"))
+        return self.have_export("html")
+
     def have_pdf(self):
-        return os.path.isfile(os.path.join(self.get_prod_path(),
-                                           self.slug +
-                                           ".pdf"))
+        return self.have_export("pdf")
+
     def have_epub(self):
-        return os.path.isfile(os.path.join(self.get_prod_path(),
-                                           self.slug +
-                                           ".epub"))
+        return self.have_export("epub")
 
 def get_last_tutorials():
-    tutorials = Tutorial.objects.all()\
-        .exclude(sha_public__isnull=True)\
-        .exclude(sha_public__exact='')\
+    tutorials = PublishedContent.objects\
+        .filter(tutorial__isnull=False)\
+        .select_related('tutorial__image')\
+        .prefetch_related('subcategory')\
         .order_by('-pubdate')[:5]
 
     return tutorials
@@ -494,6 +569,10 @@ def never_read(tutorial, user=None):
     if user is None:
         user = get_current_user()
 
+    buffered = get_buffered_reads('tutorial', user.pk).get(tutorial.pk)
+    if buffered is not None:
+        return buffered != tutorial.last_note_id
+
     return TutorialRead.objects\
         .filter(note=tutorial.last_note, tutorial=tutorial, user=user)\
         .count() == 0
@@ -502,6 +581,9 @@ def never_read(tutorial, user=None):
 def mark_read(tutorial):
     """Mark a tutorial as read for the user."""
     if tutorial.last_note is not None:
+        if buffer_read('tutorial', get_current_user().pk, tutorial.pk,
+                       tutorial.last_note_id):
+            return
         TutorialRead.objects.filter(
             tutorial=tutorial,
             user=get_current_user()).delete()
@@ -585,10 +667,9 @@ class Part(models.Model):
         # find hash code
         if sha is None:
             sha = tutorial.sha_draft
-        repo = Repo(tutorial.get_path())
+        repo = get_repo(tutorial.get_path())
         
-        manifest = get_blob(repo.commit(sha).tree, "manifest.json")
-        tutorial_version = json_reader.loads(manifest)
+        tutorial_version = get_manifest(tutorial.get_path(), sha)
         if "parts" in tutorial_version:
             for part in tutorial_version["parts"]:
                 if part["pk"] == self.pk:
@@ -619,10 +700,9 @@ class Part(models.Model):
         # find hash code
         if sha is None:
             sha = tutorial.sha_draft
-        repo = Repo(tutorial.get_path())
+        repo = get_repo(tutorial.get_path())
         
-        manifest = get_blob(repo.commit(sha).tree, "manifest.json")
-        tutorial_version = json_reader.loads(manifest)
+        tutorial_version = get_manifest(tutorial.get_path(), sha)
         if "parts" in tutorial_version:
             for part in tutorial_version["parts"]:
                 if part["pk"] == self.pk:
@@ -786,14 +866,13 @@ class Chapter(models.Model):
             tutorial = self.tutorial
         else:
             tutorial = self.part.tutorial        
-        repo = Repo(tutorial.get_path())
+        repo = get_repo(tutorial.get_path())
 
         # find hash code
         if sha is None:
             sha = tutorial.sha_draft
         
-        manifest = get_blob(repo.commit(sha).tree, "manifest.json")
-        tutorial_version = json_reader.loads(manifest)
+        tutorial_version = get_manifest(tutorial.get_path(), sha)
         if "parts" in tutorial_version:
             for part in tutorial_version["parts"]:
                 if "chapters" in part:
@@ -841,14 +920,13 @@ class Chapter(models.Model):
             tutorial = self.tutorial
         else:
             tutorial = self.part.tutorial        
-        repo = Repo(tutorial.get_path())
+        repo = get_repo(tutorial.get_path())
 
         # find hash code
         if sha is None:
             sha = tutorial.sha_draft
         
-        manifest = get_blob(repo.commit(sha).tree, "manifest.json")
-        tutorial_version = json_reader.loads(manifest)
+        tutorial_version = get_manifest(tutorial.get_path(), sha)
         if "parts" in tutorial_version:
             for part in tutorial_version["parts"]:
                 if "chapters" in part:
@@ -990,14 +1068,13 @@ class Extract(models.Model):
             tutorial = self.chapter.tutorial
         else:
             tutorial = self.chapter.part.tutorial        
-        repo = Repo(tutorial.get_path())
+        repo = get_repo(tutorial.get_path())
 
         # find hash code
         if sha is None:
             sha = tutorial.sha_draft
         
-        manifest = get_blob(repo.commit(sha).tree, "manifest.json")
-        tutorial_version = json_reader.loads(manifest)
+        tutorial_version = get_manifest(tutorial.get_path(), sha)
         if "parts" in tutorial_version:
             for part in tutorial_version["parts"]:
                 if "chapters" in part:
@@ -1084,3 +1161,126 @@ class Validation(models.Model):
 
     def is_reject(self):
         return self.status == 'REJECT'
+
+
+class ExportJob(models.Model):
+
+    """Build of an export of a published tutorial by pandoc, run by the
+    run_export_jobs command."""
+    class Meta:
+        verbose_name = 'Export'
+        verbose_name_plural = 'Exports'
+
+    tutorial = models.ForeignKey(Tutorial, verbose_name='Tutoriel',
+                                 related_name='export_jobs', db_index=True)
+    sha = models.CharField('Sha1 de la version', max_length=80)
+    format = models.CharField('Format', max_length=10,
+                              choices=EXPORT_FORMATS)
+    status = models.CharField('Statut', max_length=10,
+                              choices=EXPORT_STATUS_CHOICES,
+                              default='PENDING', db_index=True)
+    pubdate = models.DateTimeField('Date de création', auto_now_add=True)
+    date_start = models.DateTimeField('Date de début', blank=True, null=True)
+    date_end = models.DateTimeField('Date de fin', blank=True, null=True)
+    log = models.TextField('Sortie de pandoc', blank=True)
+    digest = models.CharField('Empreinte du contenu', max_length=64,
+                              blank=True, default='', db_index=True)
+
+    def __unicode__(self):
+        return u'<Export {0} de "{1}", {2}>'.format(self.format,
+                                                    self.tutorial,
+                                                    self.status)
+
+    def is_pending(self):
+        return self.status in ('PENDING', 'RUNNING')
+
+    def is_failed(self):
+        return self.status == 'FAILURE'
+
+    def get_path(self):
+        """Return the path of the export in the production directory."""
+        return os.path.join(self.tutorial.get_prod_path(),
+                            self.tutorial.slug + "." + self.format)
+
+    def get_build_path(self):
+        """Return the path where pandoc writes the export, it keeps the
+        extension pandoc uses to choose the output format. Each claim of the
+        job has its own."""
+        return os.path.join(self.tutorial.get_prod_path(),
+                            u".{0}-{1}-{2}.{3}".format(
+                                self.tutorial.slug,
+                                self.pk,
+                                self.date_start.strftime("%Y%m%d%H%M%S"),
+                                self.format))
+
+    def get_artifact_path(self):
+        """Return the path of the export in the store of the exports, which
+        keeps it for any content with the same digest."""
+        return os.path.join(settings.EXPORT_ARTIFACTS_PATH,
+                            u"{0}.{1}".format(self.digest, self.format))
+
+    def is_obsolete(self):
+        """Check if a newer export of the same format was asked for."""
+        return ExportJob.objects.filter(tutorial=self.tutorial_id,
+                                        format=self.format,
+                                        pk__gt=self.pk).exists()
+
+    def claim(self):
+        """Mark the job as running, return False if another worker has
+        already taken it."""
+        # the date of the claim identifies it, as stored by the database
+        date_start = timezone.now().replace(microsecond=0)
+        taken = ExportJob.objects\
+            .filter(claimable_export_jobs(), pk=self.pk)\
+            .update(status='RUNNING', date_start=date_start)
+        if taken:
+            self.status = 'RUNNING'
+            self.date_start = date_start
+        return taken == 1
+
+    def get_claim(self):
+        """Return the running job of the current claim, to update it: the
+        job may have been claimed again by another worker since."""
+        return ExportJob.objects.filter(pk=self.pk, status='RUNNING',
+                                        date_start=self.date_start)
+
+
+def claimable_export_jobs():
+    """Return the filter of the jobs a worker can run: the pending ones,
+    and the running ones whose worker was stopped. A worker gives up a job
+    after `EXPORT_TIMEOUT` seconds, the job is left to it twice as long."""
+    limit = timezone.now() - timedelta(seconds=2 * settings.EXPORT_TIMEOUT)
+    return Q(status='PENDING') | Q(status='RUNNING', date_start__lt=limit)
+
+
+def queue_exports(tutorial, sha, md_text):
+    """Ask for the exports of a published version of a tutorial, whose
+    markdown is `md_text`. The exports already built for the same content
+    are reused instead."""
+    ExportJob.objects.filter(tutorial=tutorial, status='PENDING')\
+        .update(status='CANCELED')
+    for export_format, name in EXPORT_FORMATS:
+        job = ExportJob(tutorial=tutorial,
+                        sha=sha,
+                        format=export_format,
+                        digest=get_export_digest(md_text, export_format))
+        if install_export_artifact(job):
+            job.status = 'SUCCESS'
+            job.date_start = job.date_end = timezone.now()
+            job.log = u'Export déjà généré pour ce contenu'
+        job.save()
+
+
+@receiver(models.signals.post_save, sender=Tutorial)
+@receiver(models.signals.post_delete, sender=Tutorial)
+def tutorial_changed(sender, **kwargs):
+    """Forget the cached feeds of the tutorials."""
+    invalidate_feeds('tutorial')
+
+
+@receiver(models.signals.m2m_changed, sender=Tutorial.authors.through)
+@receiver(models.signals.m2m_changed, sender=Tutorial.subcategory.through)
+def tutorial_lists_changed(sender, **kwargs):
+    """Keep the authors and the subcategories of the listing of a published
+    tutorial up to date."""
+    update_published_lists(**kwargs)
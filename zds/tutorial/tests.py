@@ -1,8 +1,13 @@
 # coding: utf-8
 
+import BaseHTTPServer
 import os
 import shutil
 import HTMLParser
+from StringIO import StringIO
+from datetime import timedelta
+import threading
+import zipfile
 from django.db.models import Q
 from django.conf import settings
 from django.core import mail
@@ -10,6 +15,7 @@ from django.core.urlresolvers import reverse
 from django.test import TestCase, RequestFactory
 from django.test.utils import override_settings
 from django.utils import html
+from git import Repo
 
 from zds.forum.factories import CategoryFactory, ForumFactory
 from zds.member.factories import ProfileFactory, StaffProfileFactory
@@ -19,9 +25,20 @@ from zds.settings import SITE_ROOT
 from zds.tutorial.factories import BigTutorialFactory, MiniTutorialFactory, PartFactory, \
     ChapterFactory, NoteFactory, SubCategoryFactory, LicenceFactory
 from zds.gallery.factories import GalleryFactory
-from zds.tutorial.models import Note, Tutorial, Validation, Extract, Part, Chapter
-from zds.utils.models import SubCategory, Licence, Alert
+from zds.tutorial import contents
+from zds.tutorial.contents import get_tree, get_online_tree
+from zds.tutorial.models import Note, Tutorial, Validation, Extract, Part, Chapter, ExportJob
+from zds.tutorial.views import MEP, UNMEP, render_md_file, render_md_files, \
+    get_url_images
+from zds.utils.models import SubCategory, Licence, Alert, PublishedContent
 from zds.utils.misc import compute_hash
+from zds.utils.archives import ARCHIVE_MODE, clean_archives
+from zds.utils.images import clean_images_cache
+from zds.utils.renders import get_blob_sha, render_markdown
+from zds.utils.repositories import get_repo, release_repo
+from zds.utils.templatetags.emarkdown import emarkdown
+from zds.utils.tutorials import get_blob, CommitReader, run_export_jobs, \
+    finish_export_job, clean_export_artifacts
 @override_settings(MEDIA_ROOT=os.path.join(SITE_ROOT, 'media-test'))
 @override_settings(REPO_PATH=os.path.join(SITE_ROOT, 'tutoriels-private-test'))
 @override_settings(
@@ -32,6 +49,12 @@ from zds.utils.misc import compute_hash
     REPO_ARTICLE_PATH=os.path.join(
         SITE_ROOT,
         'articles-data-test'))
+@override_settings(
+    EXPORT_ARTIFACTS_PATH=os.path.join(
+        SITE_ROOT,
+        'exports-test'))
+@override_settings(ARCHIVES_PATH=os.path.join(SITE_ROOT, 'archives-test'))
+@override_settings(IMAGES_CACHE_PATH=os.path.join(SITE_ROOT, 'images-cache-test'))
 class BigTutorialTests(TestCase):
 
     def setUp(self):
@@ -126,6 +149,423 @@ class BigTutorialTests(TestCase):
 
         mail.outbox = []
 
+    def test_commit_reader(self):
+        """Test the files of a version of the tutorial, read at once."""
+        sha = self.bigtuto.sha_draft
+        repo = Repo(self.bigtuto.get_path())
+        mandata = self.bigtuto.load_json_for_public(sha=sha)
+        paths = [mandata["introduction"], mandata["conclusion"]] \
+            + [part["introduction"] for part in mandata["parts"]]
+
+        reader = CommitReader(repo, sha)
+        texts = reader.read_many(paths + ["inexistant.md"])
+        for path in paths:
+            self.assertEqual(texts[path],
+                             get_blob(repo.commit(sha).tree, path))
+        self.assertIsNone(texts["inexistant.md"])
+        self.assertEqual(reader.read("./" + mandata["introduction"]),
+                         texts[mandata["introduction"]])
+        # a directory isn't a file
+        part_path = os.path.dirname(mandata["parts"][0]["introduction"])
+        self.assertIsNone(reader.read(part_path))
+
+    def test_repo_pool(self):
+        """Test the repositories kept open."""
+        repo = get_repo(self.bigtuto.get_path())
+        self.assertIs(get_repo(self.bigtuto.get_path() + "/"), repo)
+        release_repo(self.bigtuto.get_path())
+        self.assertIsNot(get_repo(self.bigtuto.get_path()), repo)
+
+    def test_incremental_publication(self):
+        """Test the publication of a new version, which only renders the
+        files changed since the published version."""
+        tutorial = Tutorial.objects.get(pk=self.bigtuto.pk)
+        prod_path = tutorial.get_prod_path()
+        part_html = os.path.join(prod_path, self.part1.introduction + ".html")
+        with open(part_html, "a") as f:
+            f.write("<!-- unchanged -->")
+
+        repo = Repo(tutorial.get_path())
+        with open(os.path.join(tutorial.get_path(), tutorial.introduction), "w") as f:
+            f.write(u"Nouvelle introduction".encode("utf-8"))
+        repo.index.add([tutorial.introduction])
+        sha = repo.index.commit("Nouvelle introduction").hexsha
+
+        MEP(tutorial, sha)
+        with open(os.path.join(prod_path, tutorial.introduction + ".html")) as f:
+            self.assertIn("Nouvelle introduction", f.read())
+        with open(part_html) as f:
+            self.assertIn("<!-- unchanged -->", f.read())
+        self.assertFalse(os.path.exists(prod_path + ".build"))
+
+    def test_render_md_files(self):
+        """Test the markdown files rendered by several processes."""
+        md_texts = [u"Extrait **{0}** à rédiger".format(i)
+                    for i in range(5)] + [None]
+        with self.settings(PUBLICATION_WORKERS=2):
+            rendus = render_md_files(md_texts)
+        self.assertEqual([rendu[:2] for rendu in rendus],
+                         [render_md_file(md_text)[:2] for md_text in md_texts])
+        self.assertEqual(rendus[-1][:2], ("", ""))
+
+    def test_export_jobs(self):
+        """Test the exports of a published tutorial, built in background."""
+        jobs = ExportJob.objects.filter(tutorial=self.bigtuto)
+        self.assertEqual(jobs.filter(status="PENDING").count(), 3)
+        self.assertTrue(Tutorial.objects.get(pk=self.bigtuto.pk).have_pdf())
+
+        # the state of the build is shown until the export exists
+        result = self.client.get(
+            reverse('zds.tutorial.views.download_pdf') +
+            '?tutoriel={0}'.format(self.bigtuto.pk),
+            follow=False)
+        self.assertEqual(result.status_code, 200)
+
+        # a missing pandoc fails the jobs
+        with self.settings(PANDOC_LOC="/inexistant/"):
+            self.assertEqual(run_export_jobs(), 3)
+        self.assertEqual(jobs.filter(status="FAILURE").count(), 3)
+        self.assertFalse(Tutorial.objects.get(pk=self.bigtuto.pk).have_pdf())
+        self.assertEqual(run_export_jobs(), 0)
+
+        # the exports of the previous version aren't kept by a publication
+        tutorial = Tutorial.objects.get(pk=self.bigtuto.pk)
+        old_pdf = os.path.join(tutorial.get_prod_path(),
+                               tutorial.slug + ".pdf")
+        with open(old_pdf, "w") as f:
+            f.write("%PDF-1.4")
+        MEP(tutorial, tutorial.sha_public)
+        self.assertFalse(os.path.isfile(old_pdf))
+        self.assertTrue(os.path.isfile(os.path.join(
+            tutorial.get_prod_path(), "introduction.md.html")))
+        with self.settings(PANDOC_LOC="/inexistant/"):
+            self.assertEqual(run_export_jobs(), 3)
+        self.assertFalse(Tutorial.objects.get(pk=self.bigtuto.pk).have_pdf())
+
+    def test_export_jobs_recovery(self):
+        """Test the jobs left running by a stopped worker, and an export
+        which can't be put in the production directory."""
+        job = ExportJob.objects.get(tutorial=self.bigtuto, format="pdf",
+                                    status="PENDING")
+        self.assertTrue(job.claim())
+        self.assertFalse(job.claim())
+
+        # the job is run again once its worker would have given it up
+        start = job.date_start - timedelta(seconds=settings.EXPORT_TIMEOUT)
+        ExportJob.objects.filter(pk=job.pk).update(date_start=start)
+        self.assertFalse(job.claim())
+        start -= timedelta(seconds=settings.EXPORT_TIMEOUT + 1)
+        ExportJob.objects.filter(pk=job.pk).update(date_start=start)
+        stopped = ExportJob.objects.get(pk=job.pk)
+        self.assertTrue(job.claim())
+        self.assertNotEqual(stopped.get_build_path(), job.get_build_path())
+
+        # the first worker doesn't end the job of the second one
+        with open(stopped.get_build_path(), "w") as f:
+            f.write("%PDF-1.4")
+        finish_export_job(stopped, True, u"")
+        self.assertFalse(os.path.isfile(stopped.get_build_path()))
+        self.assertEqual(ExportJob.objects.get(pk=job.pk).status, "RUNNING")
+
+        # the export can't replace the one of the production directory
+        with open(job.get_build_path(), "w") as f:
+            f.write("%PDF-1.4")
+        os.makedirs(job.get_path())
+        finish_export_job(job, True, u"")
+        self.assertFalse(os.path.isfile(job.get_build_path()))
+        self.assertEqual(ExportJob.objects.get(pk=job.pk).status, "FAILURE")
+
+    def test_export_artifacts(self):
+        """Test the exports reused when the same content is published
+        again."""
+        tutorial = Tutorial.objects.get(pk=self.bigtuto.pk)
+        job = ExportJob.objects.get(tutorial=tutorial, format="pdf",
+                                    status="PENDING")
+        self.assertTrue(job.claim())
+        with open(job.get_build_path(), "w") as f:
+            f.write("%PDF-1.4")
+        finish_export_job(job, True, u"")
+        self.assertEqual(job.status, "SUCCESS")
+        self.assertTrue(os.path.isfile(job.get_artifact_path()))
+
+        # unpublish and publish the same version again
+        UNMEP(tutorial)
+        MEP(tutorial, tutorial.sha_public)
+        job = ExportJob.objects.filter(tutorial=tutorial, format="pdf")\
+            .latest("pk")
+        self.assertEqual(job.status, "SUCCESS")
+        with open(job.get_path()) as f:
+            self.assertEqual(f.read(), "%PDF-1.4")
+        self.assertEqual(ExportJob.objects.filter(tutorial=tutorial,
+                                                  status="PENDING").count(), 2)
+
+        # the export of the published version is kept
+        self.assertEqual(clean_export_artifacts(0), 0)
+        Tutorial.objects.filter(pk=tutorial.pk).update(sha_public=None)
+        self.assertEqual(clean_export_artifacts(0), 1)
+        self.assertFalse(os.path.isfile(job.get_artifact_path()))
+
+    def test_download_zip(self):
+        """Test the archives of the draft and the published version."""
+        for online in ("", "&online"):
+            result = self.client.get(
+                reverse('zds.tutorial.views.download') +
+                '?tutoriel={0}{1}'.format(self.bigtuto.pk, online),
+                follow=False)
+            self.assertEqual(result.status_code, 200)
+            archive = zipfile.ZipFile(
+                StringIO("".join(result.streaming_content)))
+            self.assertIn("manifest.json", archive.namelist())
+            self.assertIn(self.part1.introduction, archive.namelist())
+
+        # the archive of the published version is kept, readable by the web
+        # server, until the version isn't published anymore
+        path = os.path.join(settings.ARCHIVES_PATH,
+                            self.bigtuto.sha_public + ".zip")
+        self.assertTrue(os.path.isfile(path))
+        self.assertEqual(os.stat(path).st_mode & 0o777, ARCHIVE_MODE)
+        open(os.path.join(settings.ARCHIVES_PATH, "0" * 40 + ".zip"),
+             "w").close()
+        self.assertEqual(clean_archives(), 1)
+        self.assertTrue(os.path.isfile(path))
+        Tutorial.objects.filter(pk=self.bigtuto.pk).update(sha_public=None)
+        self.assertEqual(clean_archives(), 1)
+        self.assertFalse(os.path.isfile(path))
+
+    def test_download_range(self):
+        """Test the parts of a file downloaded, and the file sent by the web
+        server."""
+        url = reverse('zds.tutorial.views.download_markdown') + \
+            '?tutoriel={0}'.format(self.bigtuto.pk)
+        self.client.login(username=self.staff.username, password='hostel77')
+        result = self.client.get(url)
+        self.assertEqual(result.status_code, 200)
+        content = "".join(result.streaming_content)
+
+        result = self.client.get(url, HTTP_RANGE="bytes=0-9")
+        self.assertEqual(result.status_code, 206)
+        self.assertEqual("".join(result.streaming_content), content[:10])
+        self.assertEqual(result["Content-Range"],
+                         "bytes 0-9/{0}".format(len(content)))
+        result = self.client.get(url, HTTP_RANGE="bytes=-5")
+        self.assertEqual("".join(result.streaming_content), content[-5:])
+        result = self.client.get(
+            url, HTTP_RANGE="bytes={0}-".format(len(content)))
+        self.assertEqual(result.status_code, 416)
+
+        # the client already has this version
+        etag = self.client.get(url)["ETag"]
+        result = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(result.status_code, 304)
+
+        with self.settings(SENDFILE_HEADER="X-Sendfile"):
+            result = self.client.get(url)
+        self.assertEqual(result["X-Sendfile"], os.path.join(
+            self.bigtuto.get_prod_path(), self.bigtuto.slug + ".md"))
+        self.assertEqual(result.content, "")
+
+    def test_get_url_images(self):
+        """Test the remote images of a publication, fetched once each."""
+        with open(os.path.join(settings.SITE_ROOT, "fixtures",
+                               "noir_black.png"), "rb") as f:
+            image = f.read()
+        requests = []
+
+        class ImageHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+            def do_GET(self):
+                requests.append(self.path)
+                if self.path.startswith("/introuvable"):
+                    self.send_response(404)
+                    self.end_headers()
+                    self.wfile.write("Introuvable")
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "image/png")
+                self.end_headers()
+                self.wfile.write(image)
+
+            def log_message(self, *args):
+                pass
+
+        server = BaseHTTPServer.HTTPServer(("127.0.0.1", 0), ImageHandler)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+        try:
+            url = "http://127.0.0.1:{0}".format(server.server_port)
+            md_texts = [
+                u"![Image]({0}/image.png) et ![Copie]({0}/copie.png)"
+                .format(url),
+                u"![Image]({0}/image.png)".format(url),
+                u"![Animation]({0}/introuvable.gif)".format(url),
+                None,
+            ]
+            build_path = os.path.join(settings.REPO_PATH_PROD, "images-test")
+            get_url_images(md_texts, build_path)
+        finally:
+            server.shutdown()
+            thread.join()
+
+        self.assertEqual(sorted(requests),
+                         ["/copie.png", "/image.png", "/introuvable.gif"])
+        images_path = os.path.join(build_path, "images")
+        with open(os.path.join(images_path, "image.png"), "rb") as f:
+            self.assertEqual(f.read(), image)
+        self.assertTrue(os.path.isfile(os.path.join(images_path,
+                                                    "copie.png")))
+        # the error page is replaced by a black image
+        self.assertTrue(os.path.isfile(os.path.join(images_path,
+                                                    "introuvable.png")))
+        # the same image is stored once
+        self.assertEqual(len(os.listdir(settings.IMAGES_CACHE_PATH)), 2)
+
+        # the images unused since are removed
+        self.assertEqual(clean_images_cache(), 0)
+        self.assertEqual(clean_images_cache(-1), 2)
+        self.assertEqual(os.listdir(settings.IMAGES_CACHE_PATH), [])
+
+    def test_prod_path(self):
+        """Test the production directory, found without the repository."""
+        tutorial = Tutorial.objects.get(pk=self.bigtuto.pk)
+        self.assertEqual(tutorial.slug_public, tutorial.slug)
+        prod_path = tutorial.get_prod_path()
+        self.assertTrue(os.path.isdir(prod_path))
+
+        repo_path = tutorial.get_path()
+        release_repo(repo_path)
+        shutil.move(repo_path, repo_path + "-moved")
+        try:
+            tutorial = Tutorial.objects.get(pk=self.bigtuto.pk)
+            self.assertEqual(tutorial.get_prod_path(), prod_path)
+            self.assertEqual(tutorial.load_json_for_online()["title"],
+                             tutorial.title)
+        finally:
+            shutil.move(repo_path + "-moved", repo_path)
+
+    def test_prod_path_rename(self):
+        """Test the production directory of a version published under a new
+        title, which is used once it's built."""
+        tutorial = Tutorial.objects.get(pk=self.bigtuto.pk)
+        old_prod_path = tutorial.get_prod_path(u"ancien-titre")
+        shutil.move(tutorial.get_prod_path(), old_prod_path)
+        Tutorial.objects.filter(pk=tutorial.pk)\
+            .update(slug_public=u"ancien-titre")
+
+        # the new version can't be built
+        tutorial = Tutorial.objects.get(pk=self.bigtuto.pk)
+        build_path = tutorial.get_prod_path(tutorial.slug) + ".build"
+        open(build_path, "w").close()
+        try:
+            self.assertRaises(OSError, MEP, tutorial, tutorial.sha_public)
+        finally:
+            os.remove(build_path)
+        tutorial = Tutorial.objects.get(pk=self.bigtuto.pk)
+        self.assertEqual(tutorial.get_prod_path(), old_prod_path)
+        self.assertTrue(os.path.isdir(old_prod_path))
+
+        MEP(tutorial, tutorial.sha_public)
+        tutorial = Tutorial.objects.get(pk=self.bigtuto.pk)
+        self.assertEqual(tutorial.slug_public, tutorial.slug)
+        self.assertTrue(os.path.isdir(tutorial.get_prod_path()))
+        self.assertFalse(os.path.isdir(old_prod_path))
+
+    def test_content_tree(self):
+        """Test the tree of a version of the tutorial, shared by the views."""
+        tree = get_online_tree(self.bigtuto)
+        self.assertIs(get_online_tree(self.bigtuto), tree)
+        self.assertEqual([part.pk for part in tree.get_parts],
+                         [self.part1.pk, self.part2.pk, self.part3.pk])
+        chapter = tree.get_chapter(self.chapter2_1.pk)
+        self.assertEqual(chapter.part.pk, self.part2.pk)
+        self.assertEqual(chapter.position_in_part, 1)
+        self.assertEqual(chapter.position_in_tutorial, 4)
+        self.assertEqual(chapter.get_absolute_url_online,
+                         self.chapter2_1.get_absolute_url_online())
+        with self.assertRaises(AttributeError):
+            chapter.title = u"Autre titre"
+
+        # the views get the same tree
+        result = self.client.get(self.chapter2_1.get_absolute_url_online())
+        self.assertEqual(result.status_code, 200)
+        self.assertIs(result.context['chapter'], chapter)
+        self.assertEqual(result.context['prev'],
+                         tree.get_chapter(self.chapter1_3.pk))
+
+        # the draft is read from the repository
+        draft = get_tree(self.bigtuto, self.bigtuto.sha_draft)
+        self.assertIsNot(draft, tree)
+        self.assertIs(get_tree(self.bigtuto, self.bigtuto.sha_draft), draft)
+        self.assertEqual(draft.get_part(self.part1.pk).intro,
+                         self.part1.get_introduction())
+
+        # the texts are kept apart from the trees, in a bounded LRU
+        with self.settings(CONTENT_TEXTS_CACHE_SIZE=2):
+            draft.load_texts(draft.get_chapters())
+            self.assertEqual(len(contents._texts), 2)
+            chapter = draft.get_chapter(self.chapter2_1.pk)
+            self.assertEqual(chapter.intro,
+                             self.chapter2_1.get_introduction())
+            self.assertEqual(len(contents._texts), 2)
+
+    def test_render_cache(self):
+        """Test the HTML of the files of the repository, kept by blob."""
+        sha = self.bigtuto.sha_draft
+        tree = get_repo(self.bigtuto.get_path()).commit(sha).tree
+        text = get_blob(tree, self.bigtuto.introduction)
+        self.assertEqual(get_blob_sha(text),
+                         tree[self.bigtuto.introduction].hexsha)
+
+        rendu = render_markdown(text)
+        self.assertEqual(rendu, emarkdown(text))
+        self.assertEqual(render_markdown(text), rendu)
+        self.assertEqual(render_markdown(u''), u'')
+
+        # the draft is shown with the cached HTML
+        result = self.client.get(
+            self.bigtuto.get_absolute_url() + '?version=' + sha)
+        self.assertEqual(result.status_code, 200)
+        self.assertIn(rendu, result.content)
+
+    def test_published_content(self):
+        """Test the listing of the published version of the tutorial."""
+        published = PublishedContent.objects.get(tutorial=self.bigtuto)
+        self.assertEqual(published.title, self.bigtuto.title)
+        self.assertEqual(list(published.authors.all()), [self.user_author])
+        self.assertEqual(published.get_absolute_url_online(),
+                         self.bigtuto.get_absolute_url_online())
+
+        result = self.client.get(reverse('zds.tutorial.views.index'))
+        self.assertEqual(result.status_code, 200)
+        self.assertEqual(list(result.context['tutorials']), [published])
+        result = self.client.get(
+            reverse('zds.tutorial.views.index') +
+            '?tag={0}'.format(self.subcat.slug))
+        self.assertEqual(list(result.context['tutorials']), [])
+
+        # the authors and the subcategories of the tutorial are copied
+        user1 = ProfileFactory().user
+        self.bigtuto.authors.add(user1)
+        self.bigtuto.authors.remove(self.user_author)
+        self.assertEqual(list(published.authors.all()), [user1])
+        self.user_author.tutorial_set.add(self.bigtuto)
+        self.assertEqual(set(published.authors.all()),
+                         set([user1, self.user_author]))
+        self.bigtuto.subcategory.add(self.subcat)
+        result = self.client.get(
+            reverse('zds.tutorial.views.index') +
+            '?tag={0}'.format(self.subcat.slug))
+        self.assertEqual(list(result.context['tutorials']), [published])
+
+        # unpublish the tutorial
+        self.client.login(username=self.staff.username, password='hostel77')
+        result = self.client.post(
+            reverse('zds.tutorial.views.invalid_tutorial',
+                    args=[self.bigtuto.pk]),
+            follow=False)
+        self.assertEqual(result.status_code, 302)
+        self.assertFalse(PublishedContent.objects
+                         .filter(tutorial=self.bigtuto).exists())
+
     def test_add_note(self):
         """To test add note for tutorial."""
         user1 = ProfileFactory().user
@@ -2131,6 +2571,12 @@ class BigTutorialTests(TestCase):
             shutil.rmtree(settings.REPO_PATH_PROD)
         if os.path.isdir(settings.REPO_ARTICLE_PATH):
             shutil.rmtree(settings.REPO_ARTICLE_PATH)
+        if os.path.isdir(settings.EXPORT_ARTIFACTS_PATH):
+            shutil.rmtree(settings.EXPORT_ARTIFACTS_PATH)
+        if os.path.isdir(settings.ARCHIVES_PATH):
+            shutil.rmtree(settings.ARCHIVES_PATH)
+        if os.path.isdir(settings.IMAGES_CACHE_PATH):
+            shutil.rmtree(settings.IMAGES_CACHE_PATH)
         if os.path.isdir(settings.MEDIA_ROOT):
             shutil.rmtree(settings.MEDIA_ROOT)
 
@@ -3,7 +3,6 @@
 from collections import OrderedDict
 from datetime import datetime
 from operator import attrgetter
-from urllib import urlretrieve
 from django.contrib.humanize.templatetags.humanize import naturalday, naturaltime
 from urlparse import urlparse, parse_qs
 try:
@@ -15,9 +14,12 @@ except:
         import json as json_reader
 
 import json as json_writer
+import logging
+import multiprocessing
 import os.path
 import re
 import shutil
+import time
 import zipfile
 
 from PIL import Image as ImagePIL
@@ -41,7 +43,8 @@ from lxml import etree
 from forms import TutorialForm, PartForm, ChapterForm, EmbdedChapterForm, \
     ExtractForm, ImportForm, NoteForm, AskValidationForm, ValidForm, RejectForm
 from models import Tutorial, Part, Chapter, Extract, Validation, never_read, \
-    mark_read, Note
+    mark_read, Note, ExportJob, queue_exports, EXPORT_FORMATS
+from zds.tutorial.contents import get_tree, get_online_tree
 from zds.gallery.models import Gallery, UserGallery, Image
 from zds.member.decorator import can_write_and_read_now
 from zds.member.models import get_info_old_tuto, Profile
@@ -49,16 +52,25 @@ from zds.member.views import get_client_ip
 from zds.forum.models import Forum, Topic
 from zds.utils import render_template
 from zds.utils import slugify
+from zds.utils.archives import zip_response
+from zds.utils.downloads import serve_file
+from zds.utils.images import collect_image_urls, fetch_images, \
+    is_remote, parse_image_url
+from zds.utils.repositories import get_repo, release_repo
 from zds.utils.models import Alert
-from zds.utils.models import Category, Licence, CommentLike, CommentDislike, \
-    SubCategory
+from zds.utils.models import Category, Licence, SubCategory, load_votes, \
+    PublishedContent, unpublish_content
 from zds.utils.mps import send_mp
 from zds.utils.forums import create_topic, send_post, lock_topic, unlock_topic
-from zds.utils.paginator import paginator_range
+from zds.utils.paginator import paginator_range, PositionPaginator
 from zds.utils.templatetags.emarkdown import emarkdown
-from zds.utils.tutorials import get_blob, export_tutorial_to_md, move
+from zds.utils.tutorials import export_tutorial_to_md, move, CommitReader
 from zds.utils.misc import compute_hash, content_has_changed
 
+
+logger = logging.getLogger(__name__)
+
+
 def render_chapter_form(chapter):
     if chapter.part:
         return ChapterForm({"title": chapter.title,
@@ -80,25 +92,37 @@ def index(request):
         tag = get_object_or_404(SubCategory, slug=request.GET["tag"])
     except (KeyError, Http404):
         tag = None
-    if tag is None:
-        tutorials = \
-            Tutorial.objects.filter(sha_public__isnull=False).exclude(sha_public="") \
-            .order_by("-pubdate") \
-            .all()
-    else:
+    tutorials = PublishedContent.objects\
+        .filter(tutorial__isnull=False)\
+        .select_related("tutorial__image")\
+        .prefetch_related("subcategory")\
+        .order_by("-pubdate")
+    if tag is not None:
         # The tag isn't None and exist in the system. We can use it to retrieve
         # all tutorials in the subcategory specified.
 
-        tutorials = Tutorial.objects.filter(
-            sha_public__isnull=False,
-            subcategory__in=[tag]).exclude(sha_public="").order_by("-pubdate").all()
-    
-    tuto_versions = []
-    for tutorial in tutorials:
-        mandata = tutorial.load_json_for_public()
-        tutorial.load_dic(mandata)
-        tuto_versions.append(mandata)
-    return render_template("tutorial/index.html", {"tutorials": tuto_versions, "tag": tag})
+        tutorials = tutorials.filter(subcategory__in=[tag])
+
+    # Paginator
+
+    paginator = Paginator(tutorials, settings.TUTORIALS_PER_PAGE)
+    page = request.GET.get("page")
+    try:
+        shown_tutorials = paginator.page(page)
+        page = int(page)
+    except PageNotAnInteger:
+        shown_tutorials = paginator.page(1)
+        page = 1
+    except EmptyPage:
+        shown_tutorials = paginator.page(paginator.num_pages)
+        page = paginator.num_pages
+
+    return render_template("tutorial/index.html", {
+        "tutorials": shown_tutorials,
+        "tag": tag,
+        "pages": paginator_range(page, paginator.num_pages),
+        "nb": page,
+    })
 
 
 # Staff actions.
@@ -209,7 +233,7 @@ def diff(request, tutorial_pk, tutorial_slug):
     if request.user not in tutorial.authors.all():
         if not request.user.has_perm("tutorial.change_tutorial"):
             raise PermissionDenied
-    repo = Repo(tutorial.get_path())
+    repo = get_repo(tutorial.get_path())
     hcommit = repo.commit(sha)
     tdiff = hcommit.diff("HEAD~1")
     return render_template("tutorial/tutorial/diff.html", {
@@ -231,7 +255,7 @@ def history(request, tutorial_pk, tutorial_slug):
         if not request.user.has_perm("tutorial.change_tutorial"):
             raise PermissionDenied
 
-    repo = Repo(tutorial.get_path())
+    repo = get_repo(tutorial.get_path())
     logs = repo.head.reference.log()
     logs = sorted(logs, key=attrgetter("time"), reverse=True)
     return render_template("tutorial/tutorial/history.html",
@@ -371,6 +395,7 @@ def valid_tutorial(request):
         tutorial.source = request.POST["source"]
         tutorial.sha_validation = None
         tutorial.save()
+        tutorial.update_published_content()
         messages.success(request, u"Le tutoriel a bien été validé.")
 
         # send feedback
@@ -434,6 +459,7 @@ def invalid_tutorial(request, tutorial_pk):
     tutorial.sha_validation = validation.version
     tutorial.pubdate = None
     tutorial.save()
+    unpublish_content(tutorial)
     messages.success(request, u"Le tutoriel a bien été dépublié.")
     return redirect(tutorial.get_absolute_url() + "?version="
                     + validation.version)
@@ -770,70 +796,20 @@ def view_tutorial(request, tutorial_pk, tutorial_slug):
             raise PermissionDenied
 
 
-    # Two variables to handle two distinct cases (large/small tutorial)
-
-    chapter = None
-    parts = None
+    # Load the tutorial, and the text of all its extracts at once
 
-    # Find the good manifest file
-
-    repo = Repo(tutorial.get_path())
+    tree = get_tree(tutorial, sha)
+    tree.load_texts([tree] + tree.get_extracts())
+    mandata = tree.to_dict()
+    tutorial.load_dic(mandata, sha)
+    mandata["get_introduction"] = tree.intro
+    mandata["get_conclusion"] = tree.conclu
 
-    # Load the tutorial.
+    # Two variables to handle two distinct cases (large/small tutorial)
 
-    manifest = get_blob(repo.commit(sha).tree, "manifest.json")
-    mandata = json_reader.loads(manifest)
-    tutorial.load_dic(mandata, sha)
-    tutorial.load_introduction_and_conclusion(mandata, sha)
-
-    # If it's a small tutorial, fetch its chapter
-
-    if tutorial.type == "MINI":
-        if 'chapter' in mandata:
-            chapter = mandata["chapter"]
-            chapter["path"] = tutorial.get_path()
-            chapter["type"] = "MINI"
-            chapter["pk"] = Chapter.objects.get(tutorial=tutorial).pk
-            chapter["intro"] = get_blob(repo.commit(sha).tree,
-                                        "introduction.md")
-            chapter["conclu"] = get_blob(repo.commit(sha).tree, "conclusion.md"
-                                         )
-            cpt = 1
-            for ext in chapter["extracts"]:
-                ext["position_in_chapter"] = cpt
-                ext["path"] = tutorial.get_path()
-                ext["txt"] = get_blob(repo.commit(sha).tree, ext["text"])
-                cpt += 1
-        else:
-            chapter = None
-    else:
+    chapter = tree.chapter
+    parts = tree.parts if tutorial.type != "MINI" else None
 
-        # If it's a big tutorial, fetch parts.
-
-        parts = mandata["parts"]
-        cpt_p = 1
-        for part in parts:
-            part["tutorial"] = tutorial
-            part["path"] = tutorial.get_path()
-            part["slug"] = slugify(part["title"])
-            part["position_in_tutorial"] = cpt_p
-            cpt_c = 1
-            for chapter in part["chapters"]:
-                chapter["part"] = part
-                chapter["path"] = tutorial.get_path()
-                chapter["slug"] = slugify(chapter["title"])
-                chapter["type"] = "BIG"
-                chapter["position_in_part"] = cpt_c
-                chapter["position_in_tutorial"] = cpt_c * cpt_p
-                cpt_e = 1
-                for ext in chapter["extracts"]:
-                    ext["chapter"] = chapter
-                    ext["position_in_chapter"] = cpt_e
-                    ext["path"] = tutorial.get_path()
-                    ext["txt"] = get_blob(repo.commit(sha).tree, ext["text"])
-                    cpt_e += 1
-                cpt_c += 1
-            cpt_p += 1
     validation = Validation.objects.filter(tutorial__pk=tutorial.pk)\
                                     .order_by("-date_proposition")\
                                     .first()
@@ -866,75 +842,20 @@ def view_tutorial_online(request, tutorial_pk, tutorial_slug):
     if not tutorial.on_line():
         raise Http404
 
-    # Two variables to handle two distinct cases (large/small tutorial)
-
-    chapter = None
-    parts = None
-
     # find the good manifest file
 
-    mandata = tutorial.load_json_for_public()
+    tree = get_online_tree(tutorial)
+    mandata = tree.to_dict()
     tutorial.load_dic(mandata, sha=tutorial.sha_public)
-    tutorial.load_introduction_and_conclusion(mandata, public=True)
+    mandata["get_introduction_online"] = tree.intro
+    mandata["get_conclusion_online"] = tree.conclu
     mandata["update"] = tutorial.update
     mandata["get_note_count"] = tutorial.get_note_count()
 
-    # If it's a small tutorial, fetch its chapter
-
-    if tutorial.type == "MINI":
-        if "chapter" in mandata:
-            chapter = mandata["chapter"]
-            chapter["path"] = tutorial.get_prod_path()
-            chapter["type"] = "MINI"
-            intro = open(os.path.join(tutorial.get_prod_path(),
-                                      mandata["introduction"] + ".html"), "r")
-            chapter["intro"] = intro.read()
-            intro.close()
-            conclu = open(os.path.join(tutorial.get_prod_path(),
-                                       mandata["conclusion"] + ".html"), "r")
-            chapter["conclu"] = conclu.read()
-            conclu.close()
-            cpt = 1
-            for ext in chapter["extracts"]:
-                ext["position_in_chapter"] = cpt
-                ext["path"] = tutorial.get_prod_path()
-                text = open(os.path.join(tutorial.get_prod_path(), ext["text"]
-                                         + ".html"), "r")
-                ext["txt"] = text.read()
-                text.close()
-                cpt += 1
-        else:
-            chapter = None
-    else:
+    # Two variables to handle two distinct cases (large/small tutorial)
 
-        # chapter = Chapter.objects.get(tutorial=tutorial)
-
-        parts = mandata["parts"]
-        cpt_p = 1
-        for part in parts:
-            part["tutorial"] = mandata
-            part["path"] = tutorial.get_path()
-            part["slug"] = slugify(part["title"])
-            part["position_in_tutorial"] = cpt_p
-            cpt_c = 1
-            for chapter in part["chapters"]:
-                chapter["part"] = part
-                chapter["path"] = tutorial.get_path()
-                chapter["slug"] = slugify(chapter["title"])
-                chapter["type"] = "BIG"
-                chapter["position_in_part"] = cpt_c
-                chapter["position_in_tutorial"] = cpt_c * cpt_p
-                cpt_e = 1
-                for ext in chapter["extracts"]:
-                    ext["chapter"] = chapter
-                    ext["position_in_chapter"] = cpt_e
-                    ext["path"] = tutorial.get_path()
-                    cpt_e += 1
-                cpt_c += 1
-            part["get_chapters"] = part["chapters"]
-            cpt_p += 1
-
-        mandata['get_parts'] = parts
+    chapter = tree.chapter
+    parts = tree.parts if tutorial.type != "MINI" else None
 
     # If the user is authenticated
 
@@ -947,39 +868,35 @@ def view_tutorial_online(request, tutorial_pk, tutorial_slug):
 
     # Find all notes of the tutorial.
 
-    notes = Note.objects.filter(tutorial__pk=tutorial.pk).order_by("position"
-                                                                   ).all()
+    notes = Note.objects.filter(tutorial__pk=tutorial.pk)
 
     # Retrieve pk of the last note. If there aren't notes for the tutorial, we
     # initialize this last note at 0.
 
     last_note_pk = 0
+    last_note_position = 0
     if tutorial.last_note:
         last_note_pk = tutorial.last_note.pk
+        last_note_position = tutorial.last_note.position
 
     # Handle pagination
 
-    paginator = Paginator(notes, settings.POSTS_PER_PAGE)
+    paginator = PositionPaginator(notes, settings.POSTS_PER_PAGE,
+                                  last_note_position)
     try:
         page_nbr = int(request.GET["page"])
     except KeyError:
         page_nbr = 1
+
+    # Show the last note of the previous page too
+
     try:
-        notes = paginator.page(page_nbr)
+        res = paginator.page(page_nbr)
     except PageNotAnInteger:
-        notes = paginator.page(1)
+        res = paginator.page(1)
     except EmptyPage:
         raise Http404
-    res = []
-    if page_nbr != 1:
-
-        # Show the last note of the previous page
-
-        last_page = paginator.page(page_nbr - 1).object_list
-        last_note = last_page[len(last_page) - 1]
-        res.append(last_note)
-    for note in notes:
-        res.append(note)
+    load_votes(res, request.user)
 
     # Build form to send a note for the current tutorial.
 
@@ -1235,52 +1152,19 @@ def view_part(
         if not request.user.has_perm("tutorial.change_tutorial"):
             raise PermissionDenied
 
-    final_part = None
-
     # find the good manifest file
 
-    repo = Repo(tutorial.get_path())
-    manifest = get_blob(repo.commit(sha).tree, "manifest.json")
-    mandata = json_reader.loads(manifest)
+    tree = get_tree(tutorial, sha)
+    mandata = tree.to_dict()
     tutorial.load_dic(mandata, sha=sha)
 
-    parts = mandata["parts"]
-    find = False
-    cpt_p = 1
-    for part in parts:
-        if part_pk == str(part["pk"]):
-            find = True
-            part["tutorial"] = tutorial
-            part["path"] = tutorial.get_path()
-            part["slug"] = slugify(part["title"])
-            part["position_in_tutorial"] = cpt_p
-            part["intro"] = get_blob(repo.commit(sha).tree, part["introduction"
-                                                                 ])
-            part["conclu"] = get_blob(repo.commit(sha).tree, part["conclusion"
-                                                                  ])
-            cpt_c = 1
-            for chapter in part["chapters"]:
-                chapter["part"] = part
-                chapter["path"] = tutorial.get_path()
-                chapter["slug"] = slugify(chapter["title"])
-                chapter["type"] = "BIG"
-                chapter["position_in_part"] = cpt_c
-                chapter["position_in_tutorial"] = cpt_c * cpt_p
-                cpt_e = 1
-                for ext in chapter["extracts"]:
-                    ext["chapter"] = chapter
-                    ext["position_in_chapter"] = cpt_e
-                    ext["path"] = tutorial.get_path()
-                    cpt_e += 1
-                cpt_c += 1
-            final_part = part
-            break
-        cpt_p += 1
-    
+    final_part = tree.get_part(part_pk)
+
     # if part can't find
-    if not find:
+    if final_part is None:
         raise Http404
-    
+    tree.load_texts([final_part])
+
     return render_template("tutorial/part/view.html",
                            {"tutorial": mandata,
                             "part": final_part,
@@ -1303,55 +1187,21 @@ def view_part_online(
 
     # find the good manifest file
 
-    mandata = tutorial.load_json_for_public()
+    tree = get_online_tree(tutorial)
+    mandata = tree.to_dict()
     tutorial.load_dic(mandata, sha=tutorial.sha_public)
     mandata["update"] = tutorial.update
 
-    mandata["get_parts"] = mandata["parts"]
-    parts = mandata["parts"]
-    cpt_p = 1
-    final_part= None
-    find = False
-    for part in parts:
-        part["tutorial"] = mandata
-        part["path"] = tutorial.get_path()
-        part["slug"] = slugify(part["title"])
-        part["position_in_tutorial"] = cpt_p
-        if part_pk == str(part["pk"]):
-            find = True
-            intro = open(os.path.join(tutorial.get_prod_path(),
-                                      part["introduction"] + ".html"), "r")
-            part["intro"] = intro.read()
-            intro.close()
-            conclu = open(os.path.join(tutorial.get_prod_path(),
-                                       part["conclusion"] + ".html"), "r")
-            part["conclu"] = conclu.read()
-            conclu.close()
-            final_part=part
-        cpt_c = 1
-        for chapter in part["chapters"]:
-            chapter["part"] = part
-            chapter["path"] = tutorial.get_path()
-            chapter["slug"] = slugify(chapter["title"])
-            chapter["type"] = "BIG"
-            chapter["position_in_part"] = cpt_c
-            chapter["position_in_tutorial"] = cpt_c * cpt_p
-            if part_slug == slugify(part["title"]):
-                cpt_e = 1
-                for ext in chapter["extracts"]:
-                    ext["chapter"] = chapter
-                    ext["position_in_chapter"] = cpt_e
-                    ext["path"] = tutorial.get_prod_path()
-                    cpt_e += 1
-            cpt_c += 1
-        part["get_chapters"] = part["chapters"]
-        cpt_p += 1
+    final_part = tree.get_part(part_pk)
 
     # if part can't find
-    if not find:
+    if final_part is None:
         raise Http404
-    
-    return render_template("tutorial/part/view_online.html", {"part": final_part})
+
+    return render_template("tutorial/part/view_online.html", {
+        "tutorial": mandata,
+        "part": final_part,
+    })
 
 
 @can_write_and_read_now
@@ -1569,67 +1419,25 @@ def view_chapter(
 
     # find the good manifest file
 
-    repo = Repo(tutorial.get_path())
-    manifest = get_blob(repo.commit(sha).tree, "manifest.json")
-    mandata = json_reader.loads(manifest)
+    tree = get_tree(tutorial, sha)
+    mandata = tree.to_dict()
     tutorial.load_dic(mandata, sha=sha)
 
-    parts = mandata["parts"]
-    cpt_p = 1
-    final_chapter = None
-    chapter_tab = []
-    final_position = 0
-    find = False
-    for part in parts:
-        cpt_c = 1
-        part["slug"] = slugify(part["title"])
-        part["get_absolute_url"] = reverse(
-            "zds.tutorial.views.view_part",
-            args=[
-                tutorial.pk,
-                tutorial.slug,
-                part["pk"],
-                part["slug"]])
-        part["tutorial"] = tutorial
-        for chapter in part["chapters"]:
-            chapter["part"] = part
-            chapter["path"] = tutorial.get_path()
-            chapter["slug"] = slugify(chapter["title"])
-            chapter["type"] = "BIG"
-            chapter["position_in_part"] = cpt_c
-            chapter["position_in_tutorial"] = cpt_c * cpt_p
-            chapter["get_absolute_url"] = part["get_absolute_url"] \
-                + "{0}/{1}/".format(chapter["pk"], chapter["slug"])
-            if chapter_pk == str(chapter["pk"]):
-                find = True
-                chapter["intro"] = get_blob(repo.commit(sha).tree,
-                                            chapter["introduction"])
-                chapter["conclu"] = get_blob(repo.commit(sha).tree,
-                                             chapter["conclusion"])
-                
-                cpt_e = 1
-                for ext in chapter["extracts"]:
-                    ext["chapter"] = chapter
-                    ext["position_in_chapter"] = cpt_e
-                    ext["path"] = tutorial.get_path()
-                    ext["txt"] = get_blob(repo.commit(sha).tree, ext["text"])
-                    cpt_e += 1
-            chapter_tab.append(chapter)
-            if chapter_pk == str(chapter["pk"]):
-                final_chapter = chapter
-                final_position = len(chapter_tab) - 1
-            cpt_c += 1
-        cpt_p += 1
-    
-    # if chapter can't find
-    if not find:
+    final_chapter = tree.get_chapter(chapter_pk)
+
+    # if chapter can't find (the chapter of a small tutorial is shown with
+    # the tutorial)
+    if final_chapter is None or final_chapter.part is None:
         raise Http404
+    tree.load_texts([final_chapter] + list(final_chapter.extracts))
 
+    chapter_tab = tree.get_chapters()
+    final_position = chapter_tab.index(final_chapter)
     prev_chapter = (chapter_tab[final_position - 1] if final_position
                     > 0 else None)
     next_chapter = (chapter_tab[final_position + 1] if final_position + 1
                     < len(chapter_tab) else None)
-    
+
     return render_template("tutorial/chapter/view.html", {
         "tutorial": mandata,
         "chapter": final_chapter,
@@ -1657,88 +1465,26 @@ def view_chapter_online(
 
     # find the good manifest file
 
-    mandata = tutorial.load_json_for_public()
+    tree = get_online_tree(tutorial)
+    mandata = tree.to_dict()
     tutorial.load_dic(mandata, sha=tutorial.sha_public)
     mandata["update"] = tutorial.update
 
-    mandata['get_parts'] = mandata["parts"]
-    parts = mandata["parts"]
-    cpt_p = 1
-    final_chapter = None
-    chapter_tab = []
-    final_position = 0
-    
-    find = False
-    for part in parts:
-        cpt_c = 1
-        part["slug"] = slugify(part["title"])
-        part["get_absolute_url_online"] = reverse(
-            "zds.tutorial.views.view_part_online",
-            args=[
-                tutorial.pk,
-                tutorial.slug,
-                part["pk"],
-                part["slug"]])
-        part["tutorial"] = mandata
-        part["position_in_tutorial"] = cpt_p
-        part["get_chapters"] = part["chapters"]
-        for chapter in part["chapters"]:
-            chapter["part"] = part
-            chapter["path"] = tutorial.get_prod_path()
-            chapter["slug"] = slugify(chapter["title"])
-            chapter["type"] = "BIG"
-            chapter["position_in_part"] = cpt_c
-            chapter["position_in_tutorial"] = cpt_c * cpt_p
-            chapter["get_absolute_url_online"] = part[
-                "get_absolute_url_online"] + "{0}/{1}/".format(chapter["pk"], chapter["slug"])
-            if chapter_pk == str(chapter["pk"]):
-                find = True
-                intro = open(
-                    os.path.join(
-                        tutorial.get_prod_path(),
-                        chapter["introduction"] +
-                        ".html"),
-                    "r")
-                chapter["intro"] = intro.read()
-                intro.close()
-                conclu = open(
-                    os.path.join(
-                        tutorial.get_prod_path(),
-                        chapter["conclusion"] +
-                        ".html"),
-                    "r")
-                chapter["conclu"] = conclu.read()
-                conclu.close()
-                cpt_e = 1
-                for ext in chapter["extracts"]:
-                    ext["chapter"] = chapter
-                    ext["position_in_chapter"] = cpt_e
-                    ext["path"] = tutorial.get_path()
-                    text = open(os.path.join(tutorial.get_prod_path(),
-                                             ext["text"] + ".html"), "r")
-                    ext["txt"] = text.read()
-                    text.close()
-                    cpt_e += 1
-            else:
-                intro = None
-                conclu = None
-            chapter_tab.append(chapter)
-            if chapter_pk == str(chapter["pk"]):
-                final_chapter = chapter
-                final_position = len(chapter_tab) - 1
-            cpt_c += 1
-        cpt_p += 1
-    
+    final_chapter = tree.get_chapter(chapter_pk)
+
     # if chapter can't find
-    if not find:
+    if final_chapter is None or final_chapter.part is None:
         raise Http404
 
+    chapter_tab = tree.get_chapters()
+    final_position = chapter_tab.index(final_chapter)
     prev_chapter = (chapter_tab[final_position - 1] if final_position > 0 else None)
     next_chapter = (chapter_tab[final_position + 1] if final_position + 1 < len(chapter_tab) else None)
-    
+
     return render_template("tutorial/chapter/view_online.html", {
+        "tutorial": mandata,
         "chapter": final_chapter,
-        "parts": parts,
+        "parts": tree.parts,
         "prev": prev_chapter,
         "next": next_chapter,
     })
@@ -2243,17 +1989,14 @@ def find_tuto(request, pk_user):
         return render_template("tutorial/member/beta.html",
                                {"tutorials": tuto_versions, "usr": display_user})
     else:
-        tutorials = Tutorial.objects.all().filter(
-            authors__in=[display_user],
-            sha_public__isnull=False).exclude(sha_public="").order_by("-pubdate")
-        
-        tuto_versions = []
-        for tutorial in tutorials:
-            mandata = tutorial.load_json_for_public()
-            tutorial.load_dic(mandata)
-            tuto_versions.append(mandata)
-
-        return render_template("tutorial/member/online.html", {"tutorials": tuto_versions,
+        tutorials = PublishedContent.objects.filter(
+            tutorial__isnull=False,
+            authors__in=[display_user])\
+            .select_related("tutorial__image")\
+            .prefetch_related("subcategory")\
+            .order_by("-pubdate")
+
+        return render_template("tutorial/member/online.html", {"tutorials": tutorials,
                                                                "usr": display_user})
 
 
@@ -2584,10 +2327,12 @@ def maj_repo_tuto(
 ):
 
     if action == "del":
+        release_repo(old_slug_path)
         shutil.rmtree(old_slug_path)
     else:
         if action == "maj":
             if old_slug_path != new_slug_path:
+                release_repo(old_slug_path)
                 shutil.move(old_slug_path, new_slug_path)
                 repo = Repo(new_slug_path)
             msg = "Modification du tutoriel"
@@ -2821,33 +2566,15 @@ def maj_repo_extract(
 
 
 
-def insert_into_zip(zip_file, git_tree):
-    """recursively add files from a git_tree to a zip archive"""
-    for blob in git_tree.blobs: # first, add files :
-        zip_file.writestr(blob.path, blob.data_stream.read())
-    if len(git_tree.trees) is not 0: # then, recursively add dirs :
-        for subtree in git_tree.trees:
-            insert_into_zip(zip_file, subtree)
-
-
 def download(request):
     """Download a tutorial."""
     tutorial = get_object_or_404(Tutorial, pk=request.GET["tutoriel"])
     repo_path = os.path.join(settings.REPO_PATH, tutorial.get_phy_slug())
-    repo = Repo(repo_path)
-    sha = tutorial.sha_draft
+    repo = get_repo(repo_path)
     if 'online' in request.GET and tutorial.sha_public is not None:
-        sha = tutorial.sha_public
-    zip_path = os.path.join('/tmp/',tutorial.slug+'.zip')
-    zip_file = zipfile.ZipFile(zip_path, 'w')
-    insert_into_zip(zip_file, repo.commit(sha).tree)
-    zip_file.close()
-    response = HttpResponse(open(zip_path , "rb").read(),
-                            content_type="application/zip")
-    response["Content-Disposition"] = \
-        "attachment; filename={0}.zip".format(tutorial.slug)
-    os.remove(zip_path) # TODO: caching (at least for the public version?)
-    return response
+        return zip_response(request, repo, tutorial.sha_public,
+                            tutorial.slug, public=True)
+    return zip_response(request, repo, tutorial.sha_draft, tutorial.slug)
 
 
 
@@ -2859,140 +2586,97 @@ def download_markdown(request):
     phy_path = os.path.join(
                 tutorial.get_prod_path(),
                 tutorial.slug +
-                ".md") 
-    response = HttpResponse(
-        open(phy_path, "rb").read(),
-        mimetype="application/txt")
-    response["Content-Disposition"] = \
-        "attachment; filename={0}.md".format(tutorial.slug)
-    return response
+                ".md")
+    if not os.path.isfile(phy_path):
+        raise Http404
+    return serve_file(request, phy_path, "application/txt",
+                      tutorial.slug + ".md")
 
 
 
-def download_html(request):
-    """Download a pdf tutorial."""
+def download_export(request, export_format, mimetype):
+    """Download an export of a tutorial, or show the state of its build."""
 
     tutorial = get_object_or_404(Tutorial, pk=request.GET["tutoriel"])
     phy_path = os.path.join(
                 tutorial.get_prod_path(),
                 tutorial.slug +
-                ".html")
+                "." + export_format)
     if not os.path.isfile(phy_path):
-        raise Http404
-    response = HttpResponse(
-        open(phy_path, "rb").read(),
-        mimetype="text/html")
-    response["Content-Disposition"] = \
-        "attachment; filename={0}.html".format(tutorial.slug)
-    return response
+        job = ExportJob.objects.filter(tutorial=tutorial,
+                                       format=export_format)\
+            .order_by("-pk").first()
+        if job is None:
+            raise Http404
+        return render_template("tutorial/tutorial/export_job.html", {
+            "tutorial": tutorial,
+            "job": job,
+        })
+    return serve_file(request, phy_path, mimetype,
+                      tutorial.slug + "." + export_format)
+
 
+def download_html(request):
+    """Download an html tutorial."""
+    return download_export(request, "html", "text/html")
 
 
 def download_pdf(request):
     """Download a pdf tutorial."""
-
-    tutorial = get_object_or_404(Tutorial, pk=request.GET["tutoriel"])
-    phy_path = os.path.join(
-                tutorial.get_prod_path(),
-                tutorial.slug +
-                ".pdf")
-    if not os.path.isfile(phy_path):
-        raise Http404
-    response = HttpResponse(
-        open(phy_path, "rb").read(),
-        mimetype="application/pdf")
-    response["Content-Disposition"] = \
-        "attachment; filename={0}.pdf".format(tutorial.slug)
-    return response
-
+    return download_export(request, "pdf", "application/pdf")
 
 
 def download_epub(request):
     """Download an epub tutorial."""
-
-    tutorial = get_object_or_404(Tutorial, pk=request.GET["tutoriel"])
-    phy_path = os.path.join(
-                tutorial.get_prod_path(),
-                tutorial.slug +
-                ".epub")
-    if not os.path.isfile(phy_path):
-        raise Http404
-    response = HttpResponse(
-        open(phy_path, "rb").read(),
-        mimetype="application/epub")
-    response["Content-Disposition"] = \
-        "attachment; filename={0}.epub".format(tutorial.slug)
-    return response
+    return download_export(request, "epub", "application/epub")
 
 
-def get_url_images(md_text, pt):
-    """find images urls in markdown text and download this."""
-
-    regex = ur"(!\[.*?\]\()(.+?)(\))"
+def copy_image(source, target, png_target):
+    """Copy an image, a gif is also converted to png. What isn't an image
+    is replaced by a black one."""
     unknow_path = os.path.join(settings.SITE_ROOT, "fixtures", "noir_black.png")
-
-    # if text is empty don't download
-
-    if md_text is not None:
-        imgs = re.findall(regex, md_text)
-        for img in imgs:
-            real_url=img[1]
-            # decompose images 
-            parse_object = urlparse(real_url)
-            if parse_object.query!='':
-                resp = parse_qs(urlparse(img[1]).query, keep_blank_values=True)
-                real_url = resp["u"][0]
-                parse_object = urlparse(real_url)
-
-            # if link is http type
-            if parse_object.scheme in ["http", "https", "ftp"] or \
-            parse_object.netloc[:3]=="www" or \
-            parse_object.path[:3]=="www":
-                (filepath, filename) = os.path.split(parse_object.path)
-                if not os.path.isdir(os.path.join(pt, "images")):
-                    os.makedirs(os.path.join(pt, "images"))
-
-                # download image
-                down_path=os.path.abspath(os.path.join(pt, "images", filename))
-                try:
-                    urlretrieve(real_url, down_path)                    
-                    try:
-                        ext = filename.split(".")[-1]
-                        im = ImagePIL.open(down_path)
-                        # if image is gif, convert to png
-                        if ext == "gif":
-                            im.save(os.path.join(pt, "images", filename.split(".")[0] + ".png"))
-                    except IOError:
-                        ext = filename.split(".")[-1]
-                        im = ImagePIL.open(unknow_path)
-                        if ext == "gif":
-                            im.save(os.path.join(pt, "images", filename.split(".")[0] + ".png"))
-                        else:
-                            im.save(os.path.join(pt, "images", filename))
-                except IOError:
-                    pass
-            else:
-                # relative link
-                srcfile = settings.SITE_ROOT + real_url
-                if os.path.isfile(srcfile):
-                    dstroot = pt + real_url
-                    dstdir = os.path.dirname(dstroot)
-                    if not os.path.exists(dstdir):
-                        os.makedirs(dstdir)
-                    shutil.copy(srcfile, dstroot)
-                    try:
-                        ext = dstroot.split(".")[-1]
-                        im = ImagePIL.open(dstroot)
-                        # if image is gif, convert to png
-                        if ext == "gif":
-                            im.save(os.path.join(dstroot.split(".")[0] + ".png"))
-                    except IOError:
-                        ext = dstroot.split(".")[-1]
-                        im = ImagePIL.open(unknow_path)
-                        if ext == "gif":
-                            im.save(os.path.join(dstroot.split(".")[0] + ".png"))
-                        else:
-                            im.save(os.path.join(dstroot))
+    ext = target.split(".")[-1]
+    if not os.path.isdir(os.path.dirname(target)):
+        os.makedirs(os.path.dirname(target))
+    shutil.copy(source, target)
+    try:
+        im = ImagePIL.open(target)
+        # if image is gif, convert to png
+        if ext == "gif":
+            im.save(png_target)
+    except IOError:
+        im = ImagePIL.open(unknow_path)
+        if ext == "gif":
+            im.save(png_target)
+        else:
+            im.save(target)
+
+
+def get_url_images(md_texts, pt):
+    """find images urls in markdown texts and download them, each one once."""
+
+    urls = collect_image_urls(md_texts)
+    remote_urls = [url for url in urls if is_remote(parse_image_url(url)[1])]
+    fetched = fetch_images(remote_urls)
+    for url in urls:
+        parse_object = parse_image_url(url)[1]
+
+        # if link is http type
+        if url in fetched:
+            (filepath, filename) = os.path.split(parse_object.path)
+            if fetched[url] is None or filename == "":
+                continue
+            copy_image(fetched[url],
+                       os.path.join(pt, "images", filename),
+                       os.path.join(pt, "images",
+                                    filename.split(".")[0] + ".png"))
+        else:
+            # relative link
+            srcfile = settings.SITE_ROOT + url
+            if os.path.isfile(srcfile):
+                dstroot = pt + url
+                copy_image(srcfile, dstroot,
+                           os.path.join(dstroot.split(".")[0] + ".png"))
 
 
 def sub_urlimg(g):
@@ -3031,21 +2715,39 @@ def markdown_to_out(md_text):
                   md_text)
 
 
-def MEP(tutorial, sha):
-    (output, err) = (None, None)
-    repo = Repo(tutorial.get_path())
-    manifest = get_blob(repo.commit(sha).tree, "manifest.json")
-    tutorial_version = json_reader.loads(manifest)
-    if os.path.isdir(tutorial.get_prod_path()):
-        try:
-            shutil.rmtree(tutorial.get_prod_path())
-        except:
-            shutil.rmtree(u"\\\\?\{0}".format(tutorial.get_prod_path()))
-    shutil.copytree(tutorial.get_path(), tutorial.get_prod_path())
-    repo.head.reset(commit = sha, index=True, working_tree=True)
-    
-    # collect md files
+def render_md_file(md_text):
+    """Render a markdown file of a tutorial in the out format and in HTML.
+    Return both with the time spent."""
+    start = time.time()
+    if md_text is None:
+        return ("", "", 0)
+    out_contenu = markdown_to_out(md_text.encode("utf-8"))
+    html_contenu = smart_str(emarkdown(md_text))
+    return (out_contenu, html_contenu, time.time() - start)
+
+
+def render_md_files(md_texts):
+    """Render markdown files with `render_md_file()`, in a pool of
+    `PUBLICATION_WORKERS` processes forked by the web worker which handles
+    the validation. The results are in the order of the texts."""
+    workers = min(settings.PUBLICATION_WORKERS or multiprocessing.cpu_count(),
+                  len(md_texts))
+    if workers < 2:
+        return map(render_md_file, md_texts)
+    pool = multiprocessing.Pool(workers)
+    try:
+        rendus = pool.map(render_md_file, md_texts)
+        pool.close()
+    except:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+    return rendus
 
+
+def collect_md_files(tutorial_version):
+    """Return the paths of the markdown files of a version of a tutorial."""
     fichiers = []
     fichiers.append(tutorial_version["introduction"])
     fichiers.append(tutorial_version["conclusion"])
@@ -3065,23 +2767,102 @@ def MEP(tutorial, sha):
         if "extracts" in tutorial_version["chapter"]:
             for extract in chapter["extracts"]:
                 fichiers.append(extract["text"])
+    return fichiers
+
+
+def remove_dir(path):
+    try:
+        shutil.rmtree(path)
+    except:
+        shutil.rmtree(u"\\\\?\{0}".format(path))
+
+
+def swap_dir(new_path, path):
+    """Replace the directory `path` by `new_path`."""
+    old_path = path + ".old"
+    if os.path.isdir(old_path):
+        remove_dir(old_path)
+    if os.path.isdir(path):
+        os.rename(path, old_path)
+    os.rename(new_path, path)
+    if os.path.isdir(old_path):
+        remove_dir(old_path)
+
+
+def remove_exports(path):
+    """Remove the HTML, PDF and EPUB exports from the directory of a
+    published version, but not its rendered files."""
+    formats = [export_format for export_format, name in EXPORT_FORMATS]
+    for name in os.listdir(path):
+        chemin = os.path.join(path, name)
+        if os.path.isfile(chemin) and not name.endswith(".md.html") \
+                and os.path.splitext(name)[1][1:] in formats:
+            os.remove(chemin)
+
+
+def MEP(tutorial, sha):
+    (output, err) = (None, None)
+    repo = get_repo(tutorial.get_path())
+    reader = CommitReader(repo, sha)
+    manifest = reader.read("manifest.json")
+    tutorial_version = json_reader.loads(manifest)
+    old_prod_path = tutorial.get_prod_path()
+    slug_public = slugify(tutorial_version["title"])
+    prod_path = tutorial.get_prod_path(slug_public)
+
+    # The new version is built aside. It starts from the published version,
+    # whose files unchanged since are reused.
+
+    build_path = prod_path + ".build"
+    if os.path.isdir(build_path):
+        remove_dir(build_path)
+    changed = None
+    if tutorial.sha_public and os.path.isdir(old_prod_path):
+        try:
+            changed = set(repo.git.diff(tutorial.sha_public, sha,
+                                        "--name-only", "--no-renames")
+                          .splitlines())
+        except GitCommandError:
+            changed = None
+    if changed is None:
+        os.makedirs(build_path)
+    else:
+        shutil.copytree(old_prod_path, build_path)
+    repo.head.reset(commit = sha, index=True, working_tree=True)
+    
+    # collect md files
+
+    fichiers = collect_md_files(tutorial_version)
+    if changed is not None:
+        for fichier in changed.difference(fichiers):
+            for path in (fichier, fichier + ".html"):
+                if os.path.isfile(os.path.join(build_path, path)):
+                    os.remove(os.path.join(build_path, path))
+        fichiers = [fichier for fichier in fichiers
+                    if fichier in changed or not os.path.isfile(
+                        os.path.join(build_path, fichier + ".html"))]
 
     # convert markdown file to html file
 
-    for fichier in fichiers:
-        md_file_contenu = get_blob(repo.commit(sha).tree, fichier)
+    contenus = reader.read_many(fichiers)
 
-        # download images
+    # download images
+
+    get_url_images([contenus[fichier] for fichier in fichiers], build_path)
 
-        get_url_images(md_file_contenu, tutorial.get_prod_path())
+    start = time.time()
+    rendus = render_md_files([contenus[fichier] for fichier in fichiers])
+    for fichier, (out_contenu, html_contenu, duration) in zip(fichiers, rendus):
+        logger.debug(u"%s rendu en %.3f s", fichier, duration)
 
         # convert to out format
-        out_file = open(os.path.join(tutorial.get_prod_path(), fichier), "w")
-        if md_file_contenu is not None:
-            out_file.write(markdown_to_out(md_file_contenu.encode("utf-8")))
+        out_path = os.path.join(build_path, fichier)
+        if not os.path.isdir(os.path.dirname(out_path)):
+            os.makedirs(os.path.dirname(out_path))
+        out_file = open(out_path, "w")
+        out_file.write(out_contenu)
         out_file.close()
-        target = os.path.join(tutorial.get_prod_path(), fichier + ".html")
-        os.chdir(os.path.dirname(target))
+        target = out_path + ".html"
         try:
             html_file = open(target, "w")
         except IOError:
@@ -3090,9 +2871,27 @@ def MEP(tutorial, sha):
 
             target = u"\\\\?\{0}".format(target)
             html_file = open(target, "w")
-        if md_file_contenu is not None:
-            html_file.write(emarkdown(md_file_contenu))
+        html_file.write(html_contenu)
         html_file.close()
+    logger.info(u"Tutoriel %s : %d fichier(s) rendu(s) en %.3f s",
+                tutorial.pk, len(fichiers), time.time() - start)
+
+    man_file = open(os.path.join(build_path, "manifest.json"), "w")
+    man_file.write(manifest.encode("utf-8"))
+    man_file.close()
+
+    # the exports of the previous version mustn't be served until the
+    # export jobs have built those of this one
+
+    remove_exports(build_path)
+    swap_dir(build_path, prod_path)
+
+    # the published version is the new one only once it's in place
+
+    tutorial.slug_public = slug_public
+    Tutorial.objects.filter(pk=tutorial.pk).update(slug_public=slug_public)
+    if old_prod_path != prod_path and os.path.isdir(old_prod_path):
+        remove_dir(old_prod_path)
 
     # load markdown out
 
@@ -3101,47 +2900,21 @@ def MEP(tutorial, sha):
     out_file.write(smart_str(contenu))
     out_file.close()
 
-    # define whether to log pandoc's errors
-    
-    pandoc_debug_str = ""
-    if settings.PANDOC_LOG_STATE:
-        pandoc_debug_str = " 2>&1 | tee -a "+settings.PANDOC_LOG
-    
-    # load pandoc
-
-    os.chdir(tutorial.get_prod_path())
-    os.system(settings.PANDOC_LOC
-              + "pandoc --latex-engine=xelatex -s -S --toc "
-              + os.path.join(tutorial.get_prod_path(), tutorial.slug)
-              + ".md -o " + os.path.join(tutorial.get_prod_path(),
-                                         tutorial.slug) + ".html"+pandoc_debug_str)
-    os.system(settings.PANDOC_LOC + "pandoc " + "--latex-engine=xelatex "
-              + "--template=../../assets/tex/template.tex " + "-s " + "-S "
-              + "-N " + "--toc " + "-V documentclass=scrbook "
-              + "-V lang=francais " + "-V mainfont=Verdana "
-              + "-V monofont=\"Andale Mono\" " + "-V fontsize=12pt "
-              + "-V geometry:margin=1in "
-              + os.path.join(tutorial.get_prod_path(), tutorial.slug) + ".md "
-              + "-o " + os.path.join(tutorial.get_prod_path(), tutorial.slug)
-              + ".pdf"+pandoc_debug_str)
-    os.system(settings.PANDOC_LOC + "pandoc -s -S --toc "
-              + os.path.join(tutorial.get_prod_path(), tutorial.slug)
-              + ".md -o " + os.path.join(tutorial.get_prod_path(),
-                                         tutorial.slug) + ".epub"+pandoc_debug_str)
-    os.chdir(settings.SITE_ROOT)
+    # the HTML, PDF and EPUB exports are built by the run_export_jobs
+    # command, unless this content was already exported
+
+    queue_exports(tutorial, sha, contenu)
     return (output, err)
 
 
 def UNMEP(tutorial):
     if os.path.isdir(tutorial.get_prod_path()):
-        try:
-            shutil.rmtree(tutorial.get_prod_path())
-        except:
-            shutil.rmtree(u"\\\\?\{0}".format(tutorial.get_prod_path()))
+        remove_dir(tutorial.get_prod_path())
 
 
 @can_write_and_read_now
 @login_required
+@transaction.atomic
 def answer(request):
     """Adds an answer from a user to an tutorial."""
 
@@ -3176,9 +2949,10 @@ def answer(request):
         last_note_pk = tutorial.last_note.pk
     
     # Retrieve lasts notes of the current tutorial.
-    notes = Note.objects.filter(tutorial=tutorial) \
-    .prefetch_related() \
-    .order_by("-pubdate")[:settings.POSTS_PER_PAGE]
+    notes = list(Note.objects.filter(tutorial=tutorial)
+                 .prefetch_related()
+                 .order_by("-pubdate")[:settings.POSTS_PER_PAGE])
+    load_votes(notes, request.user)
 
     # User would like preview his post or post a new note on the tutorial.
 
@@ -3211,7 +2985,7 @@ def answer(request):
                 note.text = data["text"]
                 note.text_html = emarkdown(data["text"])
                 note.pubdate = datetime.now()
-                note.position = tutorial.get_note_count() + 1
+                note.position = tutorial.next_note_position()
                 note.ip_address = get_client_ip(request)
                 note.save()
                 tutorial.last_note = note
@@ -3382,29 +3156,7 @@ def like_note(request):
 
     user = request.user
     if note.author.pk != request.user.pk:
-
-        # Making sure the user is allowed to do that
-
-        if CommentLike.objects.filter(user__pk=user.pk,
-                                      comments__pk=note_pk).count() == 0:
-            like = CommentLike()
-            like.user = user
-            like.comments = note
-            note.like = note.like + 1
-            note.save()
-            like.save()
-            if CommentDislike.objects.filter(user__pk=user.pk,
-                                             comments__pk=note_pk).count() > 0:
-                CommentDislike.objects.filter(
-                    user__pk=user.pk,
-                    comments__pk=note_pk).all().delete()
-                note.dislike = note.dislike - 1
-                note.save()
-        else:
-            CommentLike.objects.filter(user__pk=user.pk,
-                                       comments__pk=note_pk).all().delete()
-            note.like = note.like - 1
-            note.save()
+        note.toggle_like(user)
     resp["upvotes"] = note.like
     resp["downvotes"] = note.dislike
     if request.is_ajax():
@@ -3426,28 +3178,7 @@ def dislike_note(request):
     note = get_object_or_404(Note, pk=note_pk)
     user = request.user
     if note.author.pk != request.user.pk:
-
-        # Making sure the user is allowed to do that
-
-        if CommentDislike.objects.filter(user__pk=user.pk,
-                                         comments__pk=note_pk).count() == 0:
-            dislike = CommentDislike()
-            dislike.user = user
-            dislike.comments = note
-            note.dislike = note.dislike + 1
-            note.save()
-            dislike.save()
-            if CommentLike.objects.filter(user__pk=user.pk,
-                                          comments__pk=note_pk).count() > 0:
-                CommentLike.objects.filter(user__pk=user.pk,
-                                           comments__pk=note_pk).all().delete()
-                note.like = note.like - 1
-                note.save()
-        else:
-            CommentDislike.objects.filter(user__pk=user.pk,
-                                          comments__pk=note_pk).all().delete()
-            note.dislike = note.dislike - 1
-            note.save()
+        note.toggle_dislike(user)
     resp["upvotes"] = note.like
     resp["downvotes"] = note.dislike
     if request.is_ajax():
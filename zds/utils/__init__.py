@@ -1,5 +1,7 @@
 # coding: utf-8
 
+from django.db import transaction
+from django.db.models import F
 from django.template import RequestContext, defaultfilters
 
 from django.shortcuts import render_to_response
@@ -47,6 +49,40 @@ def render_template(tmpl, dct=None):
         tmpl, dct, context_instance=RequestContext(get_current_request()))
 
 
+def next_position(instance, field):
+    """Increment the counter `field` of `instance` in database and return
+    its new value.
+
+    The increment is done with a single UPDATE, which locks the row until
+    the end of the transaction: two concurrent callers never get the same
+    value.
+    """
+    model = instance.__class__
+    with transaction.atomic():
+        model.objects.filter(pk=instance.pk).update(**{field: F(field) + 1})
+        value = model.objects.filter(pk=instance.pk) \
+            .values_list(field, flat=True)[0]
+    setattr(instance, field, value)
+    return value
+
+
+def exclude_counters(instance, counters, kwargs):
+    """Keep the counters of an existing instance out of its full `save()`.
+
+    The counters are only written by UPDATEs (`next_position()`, the
+    signals): an instance loaded earlier would put back their old value.
+    Return the keyword arguments of `save()`, with the `update_fields` of
+    all the other fields.
+    """
+    if instance._state.adding or kwargs.get('force_insert') \
+            or kwargs.get('update_fields') is not None:
+        return kwargs
+    kwargs['update_fields'] = [
+        field.name for field in instance._meta.concrete_fields
+        if not field.primary_key and field.name not in counters]
+    return kwargs
+
+
 def slugify(text):
     if defaultfilters.slugify(text).strip('') == '':
         return '--'
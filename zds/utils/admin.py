@@ -1,6 +1,7 @@
 from django.contrib import admin
 
-from zds.utils.models import Alert, Licence, Category, SubCategory, CategorySubCategory, Tag
+from zds.utils.models import Alert, Licence, Category, SubCategory, CategorySubCategory, Tag, \
+    OutgoingEmail, PublishedContent
 
 
 admin.site.register(Alert)
@@ -9,3 +10,5 @@ admin.site.register(Licence)
 admin.site.register(Category)
 admin.site.register(SubCategory)
 admin.site.register(CategorySubCategory)
+admin.site.register(OutgoingEmail)
+admin.site.register(PublishedContent)
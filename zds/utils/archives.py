@@ -0,0 +1,133 @@
+# coding: utf-8
+
+"""Zip archives of the tutorials and articles, for their download.
+
+An archive is built from the git tree of a version, file by file, and sent
+while it is built: neither the archive nor its files are written on disk or
+kept in memory at once. The archive of a published version never changes,
+so it's also kept in `ARCHIVES_PATH`, by sha, and sent from there until
+the clean_archives command removes it, once the version isn't published
+anymore.
+"""
+
+import os
+import tempfile
+import time
+import zipfile
+
+from django.conf import settings
+from django.http import StreamingHttpResponse
+
+from zds.utils.downloads import serve_file
+
+
+# Seconds before an archive left unfinished by a stopped process is removed
+UNFINISHED_ARCHIVE_AGE = 60 * 60
+
+# The archives are readable by the web server, which may send them
+_umask = os.umask(0)
+os.umask(_umask)
+ARCHIVE_MODE = 0o644 & ~_umask
+
+
+class ZipStream(object):
+
+    """File-like object a `ZipFile` writes to, which keeps the written
+    data until it's taken by `pop()`."""
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def write(self, data):
+        self.chunks.append(data)
+        self.position += len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def pop(self):
+        data = "".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def iter_zip(tree):
+    """Generate the zip archive of a git tree, by chunks."""
+    stream = ZipStream()
+    zip_file = zipfile.ZipFile(stream, "w")
+    for item in tree.traverse():
+        if item.type != "blob":
+            continue
+        zip_file.writestr(item.path, item.data_stream.read())
+        yield stream.pop()
+    zip_file.close()
+    yield stream.pop()
+
+
+def get_archive_path(tree, sha):
+    """Return the path of the archive of a published version, it is built
+    the first time."""
+    path = os.path.join(settings.ARCHIVES_PATH, sha + ".zip")
+    if os.path.isfile(path):
+        return path
+
+    if not os.path.isdir(settings.ARCHIVES_PATH):
+        os.makedirs(settings.ARCHIVES_PATH)
+    # the archive is built aside, it may be downloaded meanwhile
+    fd, tmp_path = tempfile.mkstemp(dir=settings.ARCHIVES_PATH, prefix=".")
+    try:
+        with os.fdopen(fd, "wb") as archive:
+            for chunk in iter_zip(tree):
+                archive.write(chunk)
+        os.chmod(tmp_path, ARCHIVE_MODE)
+        os.rename(tmp_path, path)
+    except:
+        os.remove(tmp_path)
+        raise
+    return path
+
+
+def clean_archives():
+    """Remove the archives of the versions which aren't published anymore.
+    Return the number of files removed."""
+    from zds.article.models import Article
+    from zds.tutorial.models import Tutorial
+
+    if not os.path.isdir(settings.ARCHIVES_PATH):
+        return 0
+    published = set()
+    for model in (Tutorial, Article):
+        published.update(model.objects
+                         .filter(sha_public__isnull=False)
+                         .values_list("sha_public", flat=True))
+    limit = time.time() - UNFINISHED_ARCHIVE_AGE
+    nb_removed = 0
+    for filename in os.listdir(settings.ARCHIVES_PATH):
+        path = os.path.join(settings.ARCHIVES_PATH, filename)
+        if filename.startswith("."):
+            # an archive being built
+            if os.path.getmtime(path) > limit:
+                continue
+        elif filename[:-len(".zip")] in published:
+            continue
+        os.remove(path)
+        nb_removed += 1
+    return nb_removed
+
+
+def zip_response(request, repo, sha, slug, public=False):
+    """Send the archive of a version of a repository, named after `slug`.
+    The archive of a published version is sent from the disk."""
+    tree = repo.commit(sha).tree
+    if public:
+        return serve_file(request, get_archive_path(tree, sha),
+                          "application/zip", slug + ".zip")
+    response = StreamingHttpResponse(iter_zip(tree),
+                                     content_type="application/zip")
+    response["Content-Disposition"] = \
+        "attachment; filename={0}.zip".format(slug)
+    return response
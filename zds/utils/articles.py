@@ -4,7 +4,7 @@ from collections import OrderedDict
 
 from git import *
 
-import os
+from zds.utils.tutorials import find_blob
 
 
 # Export-to-dict functions
@@ -22,15 +22,8 @@ def export_article(article):
 
 
 def get_blob(tree, chemin):
-    for bl in tree.blobs:
-        if os.path.abspath(bl.path) == os.path.abspath(chemin):
-            data = bl.data_stream.read()
-            return data.decode('utf-8')
-    if len(tree.trees) > 0:
-        for tr in tree.trees:
-            result = get_blob(tr, chemin)
-            if result is not None:
-                return result
-        return None
-    else:
+    """Return the content of the file at the given path of a tree."""
+    blob = find_blob(tree, chemin)
+    if blob is None:
         return None
+    return blob.data_stream.read().decode('utf-8')
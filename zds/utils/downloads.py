@@ -0,0 +1,117 @@
+# coding: utf-8
+
+"""Responses sending the files of the disk: the exports and the archives of
+the tutorials and articles.
+
+A file is sent by chunks, and only when the client doesn't have it yet
+(`ETag` and `Last-Modified`). A single range of bytes can be asked for, to
+resume a download. When `SENDFILE_HEADER` is set, the web server sends the
+file itself, the response only tells which one:
+
+* `X-Sendfile` (Apache, lighttpd) gets the path of the file;
+* `X-Accel-Redirect` (nginx) gets the path of the file under
+  `SENDFILE_ROOT`, prefixed by the internal location `SENDFILE_URL`.
+"""
+
+import os
+import re
+import urllib
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseNotModified, \
+    StreamingHttpResponse
+from django.utils.http import http_date
+from django.views.static import was_modified_since
+
+
+CHUNK_SIZE = 64 * 1024
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+def iter_file(path, start=0, length=None):
+    """Generate the content of a file, by chunks, from the byte `start`
+    and for `length` bytes."""
+    with open(path, "rb") as f:
+        f.seek(start)
+        while length is None or length > 0:
+            size = CHUNK_SIZE if length is None else min(CHUNK_SIZE, length)
+            chunk = f.read(size)
+            if not chunk:
+                break
+            if length is not None:
+                length -= len(chunk)
+            yield chunk
+
+
+def get_range(request, size, etag):
+    """Return the (first, last) bytes asked for by the `Range` header of a
+    request, None to send the whole file, or False if the range can't be
+    satisfied. Only a single range is supported."""
+    header = request.META.get("HTTP_RANGE")
+    if not header:
+        return None
+    # the range is only valid for the version the client already has
+    if_range = request.META.get("HTTP_IF_RANGE")
+    if if_range and if_range != etag:
+        return None
+    match = RANGE_RE.match(header.strip())
+    if match is None or match.groups() == ("", ""):
+        return None
+
+    first, last = match.groups()
+    if not first:
+        # the last bytes of the file
+        first, last = max(0, size - int(last)), size - 1
+    else:
+        first = int(first)
+        last = min(int(last), size - 1) if last else size - 1
+    if first > last:
+        return False
+    return first, last
+
+
+def serve_file(request, path, content_type, filename):
+    """Send a file of the disk as the attachment `filename`."""
+    stat = os.stat(path)
+    etag = '"{0:x}-{1:x}"'.format(int(stat.st_mtime), stat.st_size)
+    if request.META.get("HTTP_IF_NONE_MATCH") == etag or \
+            not was_modified_since(
+                request.META.get("HTTP_IF_MODIFIED_SINCE"),
+                stat.st_mtime, stat.st_size):
+        return HttpResponseNotModified()
+
+    if settings.SENDFILE_HEADER:
+        response = HttpResponse(content_type=content_type)
+        if settings.SENDFILE_HEADER == "X-Accel-Redirect":
+            relative_path = os.path.relpath(path, settings.SENDFILE_ROOT)
+            response["X-Accel-Redirect"] = settings.SENDFILE_URL \
+                + urllib.quote(relative_path.replace(os.sep, "/"))
+        else:
+            response[settings.SENDFILE_HEADER] = path
+    else:
+        byte_range = get_range(request, stat.st_size, etag)
+        if byte_range is False:
+            response = HttpResponse(status=416)
+            response["Content-Range"] = "bytes */{0}".format(stat.st_size)
+            return response
+        if byte_range is None:
+            response = StreamingHttpResponse(iter_file(path),
+                                             content_type=content_type)
+            response["Content-Length"] = stat.st_size
+        else:
+            first, last = byte_range
+            response = StreamingHttpResponse(
+                iter_file(path, first, last - first + 1),
+                content_type=content_type,
+                status=206)
+            response["Content-Length"] = last - first + 1
+            response["Content-Range"] = "bytes {0}-{1}/{2}".format(
+                first, last, stat.st_size)
+        response["Accept-Ranges"] = "bytes"
+
+    response["ETag"] = etag
+    response["Last-Modified"] = http_date(stat.st_mtime)
+    response["Content-Disposition"] = \
+        "attachment; filename={0}".format(filename)
+    return response
@@ -0,0 +1,83 @@
+# coding: utf-8
+
+import hashlib
+
+from django.conf import settings
+from django.contrib.syndication.views import Feed
+from django.core.cache import cache
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.http import parse_http_date_safe, quote_etag
+
+
+def _feed_version_key(group):
+    return u'feed_version_{0}'.format(group)
+
+
+def invalidate_feeds(group):
+    """Forget the cached feeds of a group ("forum", "article"...)."""
+    try:
+        cache.incr(_feed_version_key(group))
+    except ValueError:
+        cache.set(_feed_version_key(group), 1, None)
+
+
+class CachedFeed(Feed):
+
+    """Feed whose body is kept in the cache until its group is invalidated
+    with `invalidate_feeds()`.
+
+    The cached feeds are sent with an ETag and a Last-Modified header
+    computed from the newest item, and conditional requests are answered
+    with a 304 without touching the database.
+    """
+    cache_group = None
+    # GET parameters the content of the feed depends on
+    cache_parameters = ()
+
+    def get_cache_key(self, request):
+        version = cache.get(_feed_version_key(self.cache_group), 0)
+        parameters = u'&'.join(u'{0}={1}'.format(name, request.GET[name])
+                               for name in self.cache_parameters
+                               if name in request.GET)
+        return u'feed_{0}_{1}_{2}_{3}'.format(
+            self.cache_group,
+            version,
+            self.__class__.__name__,
+            hashlib.md5(parameters.encode('utf-8')).hexdigest())
+
+    def __call__(self, request, *args, **kwargs):
+        key = self.get_cache_key(request)
+        cached = cache.get(key)
+        if cached is None:
+            response = super(CachedFeed, self).__call__(request, *args,
+                                                        **kwargs)
+            last_modified = response.get('Last-Modified')
+            etag = quote_etag(hashlib.md5(
+                u'{0}{1}'.format(key, last_modified).encode('utf-8'))
+                .hexdigest())
+            cached = {'content': response.content,
+                      'content_type': response['Content-Type'],
+                      'last_modified': last_modified,
+                      'etag': etag}
+            cache.set(key, cached, settings.FEEDS_CACHE_TIMEOUT)
+
+        if self.is_not_modified(request, cached):
+            response = HttpResponseNotModified()
+        else:
+            response = HttpResponse(cached['content'],
+                                    content_type=cached['content_type'])
+        if cached['last_modified']:
+            response['Last-Modified'] = cached['last_modified']
+        response['ETag'] = cached['etag']
+        return response
+
+    def is_not_modified(self, request, cached):
+        if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+        if if_none_match is not None:
+            return cached['etag'] in [etag.strip() for etag
+                                      in if_none_match.split(',')]
+        if_modified_since = parse_http_date_safe(
+            request.META.get('HTTP_IF_MODIFIED_SINCE', ''))
+        last_modified = parse_http_date_safe(cached['last_modified'] or '')
+        return if_modified_since is not None and last_modified is not None \
+            and last_modified <= if_modified_since
@@ -39,7 +39,7 @@ def create_topic(
     post.text = text
     post.text_html = emarkdown(text)
     post.pubdate = datetime.now()
-    post.position = 1
+    post.position = n_topic.next_post_position()
     post.save()
 
     n_topic.last_message = post
@@ -57,7 +57,7 @@ def send_post(topic, text):
     post.text = text
     post.text_html = emarkdown(text)
     post.pubdate = datetime.now()
-    post.position = topic.last_message.position+1
+    post.position = topic.next_post_position()
     post.save()
     
     topic.last_message = post
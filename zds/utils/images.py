@@ -0,0 +1,150 @@
+# coding: utf-8
+
+"""Fetcher of the remote images of the tutorials, for their publication.
+
+The images of all the files of a tutorial are fetched at once, each url a
+single time, by `IMAGES_FETCH_WORKERS` threads. The fetched images are kept
+in `IMAGES_CACHE_PATH`, named after the digest of their content, and the
+digest of the image of an url is kept in the cache for
+`IMAGES_URL_TIMEOUT` seconds: the next publications don't fetch it again.
+The error pages aren't kept for the next publications, and the images
+unused for `IMAGES_CACHE_MAX_AGE` seconds are removed by the
+clean_images_cache command.
+"""
+
+import hashlib
+import httplib
+import os
+import re
+import tempfile
+import time
+import urllib2
+from multiprocessing.pool import ThreadPool
+from urlparse import urlparse, parse_qs
+
+from django.conf import settings
+from django.core.cache import cache
+
+
+IMAGE_RE = re.compile(ur"(!\[.*?\]\()(.+?)(\))")
+
+
+def parse_image_url(url):
+    """Return the url of an image and its parsed form. The url of the
+    image may be in the `u` parameter of the query."""
+    parse_object = urlparse(url)
+    if parse_object.query != '':
+        resp = parse_qs(parse_object.query, keep_blank_values=True)
+        if "u" in resp:
+            url = resp["u"][0]
+            parse_object = urlparse(url)
+    return url, parse_object
+
+
+def is_remote(parse_object):
+    """Check if a parsed url is the one of a remote image."""
+    return parse_object.scheme in ["http", "https", "ftp"] or \
+        parse_object.netloc[:3] == "www" or \
+        parse_object.path[:3] == "www"
+
+
+def collect_image_urls(md_texts):
+    """Return the urls of the images of markdown texts, each one once."""
+    urls = []
+    for md_text in md_texts:
+        if md_text is None:
+            continue
+        for img in IMAGE_RE.findall(md_text):
+            url = parse_image_url(img[1])[0]
+            if url not in urls:
+                urls.append(url)
+    return urls
+
+
+def _url_key(url):
+    return u'image_url_{0}'.format(
+        hashlib.sha1(url.encode("utf-8")).hexdigest())
+
+
+def _image_path(digest):
+    return os.path.join(settings.IMAGES_CACHE_PATH, digest)
+
+
+def fetch_image(url):
+    """Return the path of the fetched image of an url, or None if it can't
+    be reached."""
+    digest = cache.get(_url_key(url))
+    if digest is not None and os.path.isfile(_image_path(digest)):
+        # an image in use isn't collected by clean_images_cache()
+        os.utime(_image_path(digest), None)
+        return _image_path(digest)
+
+    found = True
+    try:
+        response = urllib2.urlopen(url, timeout=settings.IMAGES_FETCH_TIMEOUT)
+        try:
+            data = response.read()
+        finally:
+            response.close()
+    except urllib2.HTTPError as e:
+        # the error page takes the place of the image, the url is fetched
+        # again by the next publication
+        data = e.read()
+        found = False
+    except (IOError, ValueError, httplib.HTTPException):
+        return None
+
+    digest = hashlib.sha256(data).hexdigest()
+    path = _image_path(digest)
+    if not os.path.isfile(path):
+        if not os.path.isdir(settings.IMAGES_CACHE_PATH):
+            try:
+                os.makedirs(settings.IMAGES_CACHE_PATH)
+            except OSError:
+                # created by another thread meanwhile
+                pass
+        fd, tmp_path = tempfile.mkstemp(dir=settings.IMAGES_CACHE_PATH,
+                                        prefix=".")
+        with os.fdopen(fd, "wb") as image:
+            image.write(data)
+        os.rename(tmp_path, path)
+    else:
+        os.utime(path, None)
+    if found:
+        cache.set(_url_key(url), digest, settings.IMAGES_URL_TIMEOUT)
+    return path
+
+
+def fetch_images(urls):
+    """Fetch images, several at once. Return a dict mapping each url to the
+    path of its image, or None."""
+    urls = list(set(urls))
+    workers = min(settings.IMAGES_FETCH_WORKERS, len(urls))
+    if workers < 2:
+        return dict((url, fetch_image(url)) for url in urls)
+
+    pool = ThreadPool(workers)
+    try:
+        paths = pool.map(fetch_image, urls)
+    finally:
+        pool.close()
+        pool.join()
+    return dict(zip(urls, paths))
+
+
+def clean_images_cache(max_age=None):
+    """Remove the fetched images unused for `max_age` seconds. Return the
+    number of files removed."""
+    if max_age is None:
+        max_age = settings.IMAGES_CACHE_MAX_AGE
+    if not os.path.isdir(settings.IMAGES_CACHE_PATH):
+        return 0
+    limit = time.time() - max_age
+    nb_removed = 0
+    for filename in os.listdir(settings.IMAGES_CACHE_PATH):
+        path = os.path.join(settings.IMAGES_CACHE_PATH, filename)
+        if os.path.getmtime(path) > limit:
+            continue
+        os.remove(path)
+        nb_removed += 1
+    return nb_removed
@@ -0,0 +1,82 @@
+# coding: utf-8
+
+from datetime import timedelta
+import json
+
+from django.conf import settings
+from django.core.mail import get_connection
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from zds.utils.models import OutgoingEmail
+
+
+def queue_email(recipient, subject, template, context):
+    """Add an email to the outbox, the `send_emails` command will send it
+    later.
+
+    `template` is the name of the templates without their extension, each
+    email has a text (`template.txt`) and an html (`template.html`) version.
+    The context must be serializable in JSON.
+    """
+    queue_emails(subject, template, {recipient: context})
+
+
+def queue_emails(subject, template, contexts):
+    """Add an email to the outbox for each recipient of `contexts`, a dict
+    mapping the recipients to the context of their email. The emails are
+    inserted at once, whatever the number of recipients."""
+    OutgoingEmail.objects.bulk_create([
+        OutgoingEmail(recipient=recipient,
+                      subject=subject,
+                      template=template,
+                      context=json.dumps(context))
+        for recipient, context in contexts.items()])
+
+
+def send_queued_emails(limit=None):
+    """Send the emails of the outbox over a single connection.
+
+    Each email is claimed before it's sent, so several workers don't send it
+    twice. Sent emails are removed from the outbox, the failed ones are kept
+    and retried later, after a delay doubled at each attempt, until
+    `MAIL_QUEUE_MAX_ATTEMPTS` is reached. Returns the number of sent emails.
+    """
+    if limit is None:
+        limit = settings.MAIL_QUEUE_BATCH_SIZE
+    now = timezone.now()
+    emails = list(OutgoingEmail.objects
+                  .filter(Q(next_attempt__isnull=True) |
+                          Q(next_attempt__lte=now),
+                          attempts__lt=settings.MAIL_QUEUE_MAX_ATTEMPTS)
+                  .order_by('pubdate', 'pk')[:limit])
+
+    # the emails of a stopped worker are sent again once their claim ends
+    until = now + timedelta(seconds=settings.MAIL_QUEUE_CLAIM_TIMEOUT)
+    emails = [email for email in emails if email.claim(until)]
+    if not emails:
+        return 0
+
+    sent = []
+    connection = get_connection()
+    connection.open()
+    try:
+        for email in emails:
+            try:
+                email.get_message(connection=connection).send()
+            except Exception as e:
+                email.attempts += 1
+                email.last_error = u'{0}'.format(e)
+                email.next_attempt = timezone.now() + timedelta(
+                    seconds=settings.MAIL_QUEUE_RETRY_DELAY
+                    * 2 ** (email.attempts - 1))
+                email.save(update_fields=['attempts', 'last_error',
+                                          'next_attempt'])
+            else:
+                sent.append(email.pk)
+    finally:
+        connection.close()
+        with transaction.atomic():
+            OutgoingEmail.objects.filter(pk__in=sent).delete()
+    return len(sent)
@@ -0,0 +1,67 @@
+# coding: utf-8
+
+import time
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+
+from zds.utils.templatetags.emarkdown import get_markdown_instance, \
+    new_markdown_instance
+
+
+MESSAGE = u"""Bonjour,
+
+J'ai un souci avec la **compilation** de mon programme, voici le code :
+
+```c
+int main(void)
+{
+    return 0;
+}
+```
+
+Une idée ? Merci d'avance :)
+
+> Relisez la [documentation](http://zestedesavoir.com) *avant* de poster.
+"""
+
+
+class Command(BaseCommand):
+    help = u"Measures the cost of the markdown rendering of a message."
+    option_list = BaseCommand.option_list + (
+        make_option('--count', type='int', dest='count', default=200,
+                    help=u"Number of messages rendered."),
+        make_option('--file', dest='file', default=None,
+                    help=u"Markdown file rendered instead of the sample message."),
+    )
+
+    def measure(self, label, fn, count):
+        start = time.time()
+        for i in range(count):
+            fn()
+        duration = (time.time() - start) * 1000 / count
+        self.stdout.write(u"{0:<28} {1:8.3f} ms".format(label, duration))
+        return duration
+
+    def handle(self, *args, **options):
+        count = options['count']
+        text = MESSAGE
+        if options['file']:
+            with open(options['file'], "r") as f:
+                text = f.read().decode('utf-8')
+
+        self.stdout.write(u"{0} rendu(s) par mesure".format(count))
+        self.measure(u"construction", new_markdown_instance, count)
+        new = self.measure(
+            u"moteur neuf par message",
+            lambda: new_markdown_instance().convert(text), count)
+        # the first call builds the engine of the thread
+        get_markdown_instance().convert(text)
+        reused = self.measure(
+            u"moteur du thread",
+            lambda: get_markdown_instance().convert(text), count)
+        self.measure(
+            u"moteur du thread (inline)",
+            lambda: get_markdown_instance(Inline=True).convert(text), count)
+        self.stdout.write(u"gain par message : {0:.3f} ms ({1:.0%})".format(
+            new - reused, (new - reused) / new if new else 0))
@@ -0,0 +1,13 @@
+# coding: utf-8
+
+from django.core.management.base import NoArgsCommand
+
+from zds.utils.archives import clean_archives
+
+
+class Command(NoArgsCommand):
+    help = u"Removes the archives of the versions which aren't published anymore."
+
+    def handle_noargs(self, **options):
+        nb_removed = clean_archives()
+        self.stdout.write(u"{0} archive(s) supprimée(s)".format(nb_removed))
@@ -0,0 +1,13 @@
+# coding: utf-8
+
+from django.core.management.base import NoArgsCommand
+
+from zds.utils.images import clean_images_cache
+
+
+class Command(NoArgsCommand):
+    help = u"Removes the fetched images unused for IMAGES_CACHE_MAX_AGE seconds."
+
+    def handle_noargs(self, **options):
+        nb_removed = clean_images_cache()
+        self.stdout.write(u"{0} image(s) supprimée(s)".format(nb_removed))
@@ -0,0 +1,14 @@
+# coding: utf-8
+
+from django.core.management.base import NoArgsCommand
+
+from zds.utils.read_markers import flush_read_markers
+
+
+class Command(NoArgsCommand):
+    help = u"Writes the read markers waiting in the cache to the database."
+
+    def handle_noargs(self, **options):
+        nb_written = flush_read_markers()
+        self.stdout.write(u"{0} marqueur(s) de lecture enregistré(s)"
+                          .format(nb_written))
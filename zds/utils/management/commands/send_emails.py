@@ -0,0 +1,32 @@
+# coding: utf-8
+
+import time
+from optparse import make_option
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from zds.utils.mails import send_queued_emails
+
+
+class Command(BaseCommand):
+    help = u"Sends the emails waiting in the outbox."
+    option_list = BaseCommand.option_list + (
+        make_option('--limit', type='int', dest='limit', default=None,
+                    help=u"Maximum number of emails sent by batch."),
+        make_option('--loop', type='int', dest='loop', default=None,
+                    help=u"Keep running and check the outbox every LOOP seconds."),
+    )
+
+    def handle(self, *args, **options):
+        limit = options['limit'] or settings.MAIL_QUEUE_BATCH_SIZE
+        while True:
+            # keep sending while the batches are full
+            nb_sent = limit
+            while nb_sent == limit:
+                nb_sent = send_queued_emails(limit)
+                if nb_sent:
+                    self.stdout.write(u"{0} e-mail(s) envoyé(s)".format(nb_sent))
+            if not options['loop']:
+                break
+            time.sleep(options['loop'])
@@ -0,0 +1,22 @@
+# coding: utf-8
+
+from django.core.management.base import NoArgsCommand
+
+from zds.article.models import Article
+from zds.tutorial.models import Tutorial
+
+
+class Command(NoArgsCommand):
+    help = u"Writes again the listings of the published tutorials and articles."
+
+    def handle_noargs(self, **options):
+        nb_contents = 0
+        for model in (Tutorial, Article):
+            contents = model.objects\
+                .filter(sha_public__isnull=False)\
+                .exclude(sha_public="")
+            for content in contents:
+                content.update_published_content()
+                nb_contents += 1
+        self.stdout.write(u"{0} contenu(s) publié(s) mis à jour"
+                          .format(nb_contents))
@@ -0,0 +1,73 @@
+# coding: utf-8
+
+"""Cache of the manifests of the tutorials and the articles.
+
+A commit never changes, so the `manifest.json` of a given sha is kept
+forever: first in a small LRU of the process, then in memcached. Only the
+text of the manifest is cached and each call parses it again, since the
+callers fill the dictionary they get (`load_dic()`).
+"""
+
+from collections import OrderedDict
+import re
+import threading
+
+try:
+    import ujson as json_reader
+except:
+    try:
+        import simplejson as json_reader
+    except:
+        import json as json_reader
+
+from django.conf import settings
+from django.core.cache import cache
+
+from zds.utils.repositories import get_repo
+from zds.utils.tutorials import get_blob
+
+
+SHA_RE = re.compile(r'^[0-9a-f]{40}$')
+
+_manifests = OrderedDict()
+_manifests_lock = threading.Lock()
+
+
+def _get_local(sha):
+    with _manifests_lock:
+        text = _manifests.pop(sha, None)
+        if text is not None:
+            # the most recently used manifests are at the end
+            _manifests[sha] = text
+        return text
+
+
+def _set_local(sha, text):
+    with _manifests_lock:
+        _manifests.pop(sha, None)
+        _manifests[sha] = text
+        while len(_manifests) > settings.MANIFEST_CACHE_SIZE:
+            _manifests.popitem(last=False)
+
+
+def get_manifest_text(repo_path, sha):
+    """Return the text of the manifest of the repository at a commit."""
+    # Only a full sha identifies a commit, a reference can move
+    if sha is None or not SHA_RE.match(sha):
+        return get_blob(get_repo(repo_path).commit(sha).tree, 'manifest.json')
+
+    text = _get_local(sha)
+    if text is not None:
+        return text
+    key = u'manifest_{0}'.format(sha)
+    text = cache.get(key)
+    if text is None:
+        text = get_blob(get_repo(repo_path).commit(sha).tree, 'manifest.json')
+        cache.set(key, text, None)
+    _set_local(sha, text)
+    return text
+
+
+def get_manifest(repo_path, sha):
+    """Return the manifest of the repository at a commit, as a dict."""
+    return json_reader.loads(get_manifest_text(repo_path, sha))
@@ -1,14 +1,22 @@
 # coding: utf-8
 
+import json
 import os
 import string
 import uuid
 
+from django.conf import settings
 from django.contrib.auth.models import User
+from django.core.mail import EmailMultiAlternatives
 from django.core.urlresolvers import reverse
 from django.utils.encoding import smart_text
-from django.db import models
+from django.utils.text import Truncator
+from django.db import models, transaction
+from django.db.models import F
+from django.template import Context
+from django.template.loader import get_template
 from zds.utils import slugify
+from zds.utils.feeds import invalidate_feeds
 
 from model_utils.managers import InheritanceManager
 
@@ -189,11 +197,61 @@ class Comment(models.Model):
 
     def get_like_count(self):
         """Gets number of like for the post."""
-        return CommentLike.objects.filter(comments__pk=self.pk).count()
+        return self.like
 
     def get_dislike_count(self):
         """Gets number of dislike for the post."""
-        return CommentDislike.objects.filter(comments__pk=self.pk).count()
+        return self.dislike
+
+    def toggle_like(self, user):
+        """Like the comment, or remove the like of the user if he already
+        likes it. A dislike of the user is removed."""
+        self._toggle_vote(user, CommentLike, 'like', CommentDislike, 'dislike')
+
+    def toggle_dislike(self, user):
+        """Dislike the comment, or remove the dislike of the user if he
+        already dislikes it. A like of the user is removed."""
+        self._toggle_vote(user, CommentDislike, 'dislike', CommentLike, 'like')
+
+    def _toggle_vote(self, user, vote_model, counter, opposite_model,
+                     opposite_counter):
+        with transaction.atomic():
+            votes = vote_model.objects.filter(user__pk=user.pk,
+                                              comments__pk=self.pk)
+            if votes.exists():
+                votes.delete()
+                deltas = {counter: F(counter) - 1}
+            else:
+                vote_model(user=user, comments=self).save()
+                deltas = {counter: F(counter) + 1}
+                opposites = opposite_model.objects.filter(user__pk=user.pk,
+                                                          comments__pk=self.pk)
+                if opposites.exists():
+                    opposites.delete()
+                    deltas[opposite_counter] = F(opposite_counter) - 1
+            # The counters are updated in database, concurrent votes can't
+            # overwrite each other
+            Comment.objects.filter(pk=self.pk).update(**deltas)
+            self.like, self.dislike = Comment.objects.filter(pk=self.pk) \
+                .values_list('like', 'dislike')[0]
+        self._vote = None
+
+
+def load_votes(comments, user):
+    """Fetch at once the votes of the user on a list of comments, so that
+    the `liked` and `disliked` filters don't query the database."""
+    comments = list(comments)
+    if not comments or user is None or not user.is_authenticated():
+        return
+    pks = [comment.pk for comment in comments]
+    likes = set(CommentLike.objects
+                .filter(user__pk=user.pk, comments__pk__in=pks)
+                .values_list('comments', flat=True))
+    dislikes = set(CommentDislike.objects
+                   .filter(user__pk=user.pk, comments__pk__in=pks)
+                   .values_list('comments', flat=True))
+    for comment in comments:
+        comment._vote = (user.pk, comment.pk in likes, comment.pk in dislikes)
 
 
 class Alert(models.Model):
@@ -285,3 +343,163 @@ class Tag(models.Model):
         self.title = smart_text(self.title).lower()
         self.slug = slugify(self.title)
         super(Tag, self).save(*args, **kwargs)
+
+
+class OutgoingEmail(models.Model):
+
+    """Email waiting to be sent by the `send_emails` command."""
+    class Meta:
+        verbose_name = 'E-mail en attente'
+        verbose_name_plural = 'E-mails en attente'
+
+    recipient = models.EmailField('Destinataire')
+    subject = models.CharField('Sujet', max_length=255)
+    template = models.CharField('Gabarit', max_length=100)
+    context = models.TextField('Contexte', blank=True)
+    pubdate = models.DateTimeField('Date de création', auto_now_add=True,
+                                   db_index=True)
+    attempts = models.IntegerField('Nombre d\'essais', default=0)
+    last_error = models.TextField('Dernière erreur', blank=True)
+    next_attempt = models.DateTimeField('Prochain essai', blank=True,
+                                        null=True, db_index=True)
+
+    def __unicode__(self):
+        return u'{0} : {1}'.format(self.recipient, self.subject)
+
+    def claim(self, until):
+        """Keep the email for the current worker until `until`, return False
+        if another worker has already taken it."""
+        if self.next_attempt is None:
+            emails = OutgoingEmail.objects.filter(pk=self.pk,
+                                                  next_attempt__isnull=True)
+        else:
+            emails = OutgoingEmail.objects.filter(
+                pk=self.pk, next_attempt=self.next_attempt)
+        taken = emails.update(next_attempt=until)
+        if taken:
+            self.next_attempt = until
+        return taken == 1
+
+    def get_context(self):
+        return json.loads(self.context) if self.context else {}
+
+    def get_message(self, connection=None):
+        """Render the email with its text and html templates."""
+        context = Context(self.get_context())
+        message_txt = get_template(self.template + '.txt').render(context)
+        message_html = get_template(self.template + '.html').render(context)
+        msg = EmailMultiAlternatives(
+            self.subject,
+            message_txt,
+            u"Zeste de Savoir <{0}>".format(settings.MAIL_NOREPLY),
+            [self.recipient],
+            connection=connection)
+        msg.attach_alternative(message_html, "text/html")
+        return msg
+
+
+class PublishedContent(models.Model):
+
+    """Public version of a tutorial or an article, as shown in the lists of
+    the site. It's written at the publication, so the lists don't read the
+    repositories."""
+    class Meta:
+        verbose_name = 'Contenu publié'
+        verbose_name_plural = 'Contenus publiés'
+
+    tutorial = models.OneToOneField('tutorial.Tutorial',
+                                    verbose_name='Tutoriel',
+                                    related_name='published',
+                                    blank=True, null=True)
+    article = models.OneToOneField('article.Article',
+                                   verbose_name='Article',
+                                   related_name='published',
+                                   blank=True, null=True)
+    title = models.CharField('Titre', max_length=80)
+    description = models.CharField('Description', max_length=200)
+    slug = models.SlugField(max_length=80)
+    authors = models.ManyToManyField(User, verbose_name='Auteurs',
+                                     db_index=True)
+    subcategory = models.ManyToManyField(SubCategory,
+                                         verbose_name='Sous-Catégorie',
+                                         blank=True, db_index=True)
+    pubdate = models.DateTimeField('Date de publication', db_index=True)
+    introduction = models.TextField('Début de l\'introduction', blank=True)
+
+    def __unicode__(self):
+        return self.title
+
+    def get_content(self):
+        return self.tutorial if self.tutorial_id else self.article
+
+    def get_absolute_url_online(self):
+        if self.tutorial_id:
+            return reverse('zds.tutorial.views.view_tutorial_online',
+                           args=[self.tutorial_id, self.slug])
+        return reverse('zds.article.views.view_online',
+                       args=[self.article_id, self.slug])
+
+    @property
+    def image(self):
+        return self.get_content().image
+
+    @property
+    def sha_public(self):
+        return self.get_content().sha_public
+
+    def last_read_reaction(self):
+        return self.article.last_read_reaction()
+
+    def get_reaction_count(self):
+        return self.article.get_reaction_count()
+
+
+def publish_content(content, title, description, introduction):
+    """Write the listing of the public version of a tutorial or an article,
+    whose introduction is given in HTML."""
+    field = content._meta.app_label
+    published = PublishedContent.objects.filter(**{field: content}).first()
+    if published is None:
+        published = PublishedContent(**{field: content})
+    published.title = title
+    published.description = description
+    published.slug = slugify(title)
+    published.pubdate = content.pubdate
+    published.introduction = Truncator(introduction or u'').words(
+        settings.PUBLISHED_INTRODUCTION_WORDS, html=True)
+    published.save()
+    published.authors = content.authors.all()
+    published.subcategory = content.subcategory.all()
+    invalidate_feeds(field)
+    return published
+
+
+def update_published_lists(instance, action, reverse, model, pk_set,
+                           **kwargs):
+    """Copy the authors and the subcategories of the published tutorials or
+    articles whose ones changed to their listings, from a m2m_changed
+    signal."""
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if reverse:
+        # the contents were added to an user or a subcategory
+        contents = model.objects.filter(pk__in=pk_set or [],
+                                        published__isnull=False)
+    else:
+        contents = [instance]
+    for content in contents:
+        field = content._meta.app_label
+        published = PublishedContent.objects.filter(**{field: content})\
+            .first()
+        if published is None:
+            continue
+        published.authors = content.authors.all()
+        published.subcategory = content.subcategory.all()
+        invalidate_feeds(field)
+
+
+def unpublish_content(content):
+    """Remove a tutorial or an article from the lists."""
+    field = content._meta.app_label
+    PublishedContent.objects.filter(**{field: content}).delete()
+    invalidate_feeds(field)
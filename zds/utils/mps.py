@@ -39,7 +39,7 @@ def send_mp(
     post.text = text
     post.text_html = emarkdown(text)
     post.pubdate = datetime.now()
-    post.position_in_topic = 1
+    post.position_in_topic = n_topic.next_post_position()
     post.save()
 
     n_topic.last_message = post
@@ -1,5 +1,9 @@
 # coding: utf-8
 
+from math import ceil
+
+from django.core.paginator import PageNotAnInteger, EmptyPage
+
 
 def paginator_range(current, stop, start=1):
     assert(current <= stop)
@@ -32,3 +36,50 @@ def paginator_range(current, stop, start=1):
         # And ignore all other numbers
 
     return lst
+
+
+class PositionPaginator(object):
+
+    """Paginator for a thread of messages numbered by a dense position
+    (posts, private posts, notes and reactions).
+
+    Unlike Django's paginator, it needs neither a COUNT(*) nor an OFFSET
+    scan: the number of pages comes from the position of the last message
+    of the thread, and a page is fetched with a single `BETWEEN` query on
+    the position, which also brings the last message of the previous page.
+
+    """
+
+    def __init__(self, object_list, per_page, last_position,
+                 position_field='position'):
+        self.object_list = object_list
+        self.per_page = int(per_page)
+        self.last_position = last_position or 0
+        self.position_field = position_field
+
+    @property
+    def num_pages(self):
+        """Number of pages, there is always at least one."""
+        return max(1, int(ceil(self.last_position / float(self.per_page))))
+
+    def validate_number(self, number):
+        """Validates the given 1-based page number."""
+        try:
+            number = int(number)
+        except (TypeError, ValueError):
+            raise PageNotAnInteger('That page number is not an integer')
+        if number < 1:
+            raise EmptyPage('That page number is less than 1')
+        if number > self.num_pages:
+            raise EmptyPage('That page contains no results')
+        return number
+
+    def page(self, number):
+        """Returns the messages of the given 1-based page number, preceded by
+        the last message of the previous page (if any)."""
+        number = self.validate_number(number)
+        top = number * self.per_page
+        bottom = max(1, top - self.per_page)
+        return list(self.object_list
+                    .filter(**{self.position_field + '__range': (bottom, top)})
+                    .order_by(self.position_field))
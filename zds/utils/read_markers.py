@@ -0,0 +1,246 @@
+# coding: utf-8
+
+"""Write-behind buffer for the read markers (TopicRead, ArticleRead and
+TutorialRead).
+
+Marking a content as read only stores the marker in the cache: in a
+numbered slot of a queue of pending markers, and in a dict of the
+unflushed markers of the user which the read-state queries overlay on the
+database. The queue is written in bulk by `flush_read_markers()`, from the
+`flush_read_markers` command or once `READ_MARKERS_FLUSH_THRESHOLD`
+markers are waiting.
+
+The slots are the markers which are written: the last slot of an user on
+a content wins, and a discarded marker is a slot without message. The
+dict of an user only tells which of his markers aren't flushed yet, by
+the number of their slot, and the flush never writes it: two concurrent
+reads of an user may lose an entry of the dict, not a marker.
+
+When the cache can't count the pending markers (no memcached, dummy
+cache), the markers are written directly.
+"""
+
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import get_model
+
+
+# kind: (application, read model, content field, message field)
+READ_MARKERS = {
+    'topic': ('forum', 'TopicRead', 'topic', 'post'),
+    'article': ('article', 'ArticleRead', 'article', 'reaction'),
+    'tutorial': ('tutorial', 'TutorialRead', 'tutorial', 'note'),
+}
+
+FLUSH_BATCH_SIZE = 1000
+# Seconds a flush keeps its lock without finishing a batch
+FLUSH_LOCK_TIMEOUT = 60
+# Seconds a slot is waited for: its number is taken before it's written,
+# a slot still missing after that was lost
+MISSING_SLOT_DELAY = 60
+
+
+def _user_key(kind, user_pk):
+    return u'read_markers_{0}_unflushed_{1}'.format(kind, user_pk)
+
+
+def _slot_key(kind, number):
+    return u'read_markers_{0}_slot_{1}'.format(kind, number)
+
+
+def _count_key(kind):
+    return u'read_markers_{0}_count'.format(kind)
+
+
+def _flushed_key(kind):
+    return u'read_markers_{0}_flushed'.format(kind)
+
+
+def _missing_key(kind):
+    return u'read_markers_{0}_missing'.format(kind)
+
+
+def _lock_key(kind):
+    return u'read_markers_{0}_lock'.format(kind)
+
+
+def _unflushed(marks, flushed):
+    """Keep the entries of the dict of an user whose slot isn't flushed."""
+    return dict((content_pk, (message_pk, number))
+                for content_pk, (message_pk, number) in (marks or {}).items()
+                if number > flushed)
+
+
+def _push(kind, entry):
+    """Put an entry in a new slot of the queue, return its number or None
+    if the cache can't count the slots."""
+    cache.add(_count_key(kind), 0, None)
+    try:
+        number = cache.incr(_count_key(kind))
+    except ValueError:
+        return None
+    cache.set(_slot_key(kind, number), entry, settings.READ_MARKERS_TIMEOUT)
+    return number
+
+
+def get_buffered_reads(kind, user_pk):
+    """Return the unflushed markers of an user, as a dict mapping the pk of
+    the contents to the pk of the last message read."""
+    if user_pk is None:
+        return {}
+    return get_buffered_reads_many(kind, [user_pk]).get(user_pk, {})
+
+
+def get_buffered_reads_many(kind, user_pks):
+    """Return the unflushed markers of several users, as a dict mapping the
+    pk of each user to his markers."""
+    keys = dict((_user_key(kind, pk), pk) for pk in user_pks)
+    if not keys:
+        return {}
+    found = cache.get_many(keys.keys() + [_flushed_key(kind)])
+    flushed = found.pop(_flushed_key(kind), 0)
+    buffered = {}
+    for key, marks in found.items():
+        marks = _unflushed(marks, flushed)
+        if marks:
+            buffered[keys[key]] = dict(
+                (content_pk, message_pk)
+                for content_pk, (message_pk, number) in marks.items())
+    return buffered
+
+
+def buffer_read(kind, user_pk, content_pk, message_pk):
+    """Mark a content as read up to a message, in the buffer.
+
+    Return False if the marker couldn't be buffered, the caller has to
+    write it in the database itself.
+    """
+    found = cache.get_many([_user_key(kind, user_pk), _flushed_key(kind)])
+    flushed = found.get(_flushed_key(kind), 0)
+    marks = _unflushed(found.get(_user_key(kind, user_pk)), flushed)
+    if content_pk in marks and marks[content_pk][0] == message_pk:
+        return True
+
+    number = _push(kind, (user_pk, content_pk, message_pk))
+    if number is None:
+        return False
+    marks[content_pk] = (message_pk, number)
+    cache.set(_user_key(kind, user_pk), marks, settings.READ_MARKERS_TIMEOUT)
+
+    if number - flushed >= settings.READ_MARKERS_FLUSH_THRESHOLD:
+        flush_read_markers(kind)
+    return True
+
+
+def discard_buffered_read(kind, user_pk, content_pk):
+    """Forget the unflushed marker of an user on a content, it won't be
+    written by the next flush."""
+    marks = cache.get(_user_key(kind, user_pk)) or {}
+    if content_pk in marks:
+        del marks[content_pk]
+        cache.set(_user_key(kind, user_pk), marks,
+                  settings.READ_MARKERS_TIMEOUT)
+    # the slots of the marker are before this one
+    _push(kind, (user_pk, content_pk, None))
+
+
+def flush_read_markers(kind=None):
+    """Write the pending markers in the database. Return the number of
+    markers written."""
+    kinds = [kind] if kind is not None else READ_MARKERS.keys()
+    written = 0
+    for kind in kinds:
+        # Only one flush at a time for each kind
+        if not cache.add(_lock_key(kind), True, FLUSH_LOCK_TIMEOUT):
+            continue
+        try:
+            written += _flush(kind)
+        finally:
+            cache.delete(_lock_key(kind))
+    return written
+
+
+def _flush(kind):
+    written = 0
+    count = cache.get(_count_key(kind)) or 0
+    flushed = cache.get(_flushed_key(kind)) or 0
+    while flushed < count:
+        cache.set(_lock_key(kind), True, FLUSH_LOCK_TIMEOUT)
+        end = min(count, flushed + FLUSH_BATCH_SIZE)
+        numbers = range(flushed + 1, end + 1)
+        found = cache.get_many([_slot_key(kind, number)
+                                for number in numbers])
+
+        # A missing slot may be written in a moment, the flush stops before
+        # it until it's late
+        now = time.time()
+        missing = cache.get(_missing_key(kind)) or {}
+        for number in numbers:
+            if _slot_key(kind, number) not in found:
+                missing.setdefault(number, now)
+        last = flushed
+        entries = []
+        for number in numbers:
+            entry = found.get(_slot_key(kind, number))
+            if entry is None:
+                if now - missing[number] < MISSING_SLOT_DELAY:
+                    break
+            else:
+                entries.append(entry)
+            last = number
+
+        # Only the last marker of an user on a content is written, a
+        # discarded one isn't
+        latest = {}
+        for user_pk, content_pk, message_pk in entries:
+            latest[(user_pk, content_pk)] = message_pk
+        written += _write(kind, dict((key, message_pk)
+                                     for key, message_pk in latest.items()
+                                     if message_pk is not None))
+
+        cache.set(_flushed_key(kind), last, None)
+        cache.set(_missing_key(kind),
+                  dict((number, seen) for number, seen in missing.items()
+                       if number > last), None)
+        cache.delete_many([_slot_key(kind, number)
+                           for number in range(flushed + 1, last + 1)])
+        if last < end:
+            break
+        flushed = last
+    return written
+
+
+def _write(kind, latest):
+    """Replace the read markers of the database by the given ones."""
+    app_label, model_name, content_field, message_field = READ_MARKERS[kind]
+    model = get_model(app_label, model_name)
+    message_model = model._meta.get_field(message_field).rel.to
+
+    # Messages and users may have been deleted since
+    messages = set(message_model.objects
+                   .filter(pk__in=set(latest.values()))
+                   .values_list('pk', flat=True))
+    users = set(User.objects
+                .filter(pk__in=set(user_pk for user_pk, _ in latest))
+                .values_list('pk', flat=True))
+    latest = dict((key, message_pk) for key, message_pk in latest.items()
+                  if message_pk in messages and key[0] in users)
+
+    by_user = {}
+    for user_pk, content_pk in latest:
+        by_user.setdefault(user_pk, []).append(content_pk)
+    with transaction.atomic():
+        for user_pk, content_pks in by_user.items():
+            model.objects.filter(**{
+                'user__pk': user_pk,
+                content_field + '__pk__in': content_pks}).delete()
+        model.objects.bulk_create([
+            model(**{'user_id': user_pk,
+                     content_field + '_id': content_pk,
+                     message_field + '_id': message_pk})
+            for (user_pk, content_pk), message_pk in latest.items()])
+    return len(latest)
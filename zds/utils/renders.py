@@ -0,0 +1,72 @@
+# coding: utf-8
+
+"""Cache of the HTML of the markdown files of the repositories.
+
+The drafts and the betas of the tutorials and articles are rendered when
+they are read, and a file of a repository never changes: its HTML is kept
+by the sha of its blob, first in a small LRU of the process, then in
+memcached for `RENDER_CACHE_TIMEOUT` seconds. A file which is the same in
+several versions is rendered once. The keys in memcached have the
+`RENDER_CACHE_VERSION` setting, so that the HTML of a previous markdown
+engine isn't reused after an update.
+"""
+
+from collections import OrderedDict
+import hashlib
+import threading
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.safestring import mark_safe
+
+from zds.utils.templatetags.emarkdown import emarkdown, get_markdown_instance
+
+
+_renders = OrderedDict()
+_renders_lock = threading.Lock()
+
+
+def _get_local(sha):
+    with _renders_lock:
+        html = _renders.pop(sha, None)
+        if html is not None:
+            # the most recently used renders are at the end
+            _renders[sha] = html
+        return html
+
+
+def _set_local(sha, html):
+    with _renders_lock:
+        _renders.pop(sha, None)
+        _renders[sha] = html
+        while len(_renders) > settings.RENDER_CACHE_SIZE:
+            _renders.popitem(last=False)
+
+
+def get_blob_sha(text):
+    """Return the sha git gives to the blob of a text."""
+    data = text.encode('utf-8')
+    return hashlib.sha1('blob {0}\0'.format(len(data)) + data).hexdigest()
+
+
+def render_markdown(text):
+    """Return the HTML of a markdown file of a repository."""
+    if not text:
+        return mark_safe('')
+
+    sha = get_blob_sha(text)
+    html = _get_local(sha)
+    if html is not None:
+        return mark_safe(html)
+    key = u'render_{0}_{1}'.format(settings.RENDER_CACHE_VERSION, sha)
+    html = cache.get(key)
+    if html is None:
+        try:
+            html = get_markdown_instance(Inline=False).convert(text)\
+                .encode('utf-8')
+        except:
+            # the error message isn't kept
+            return emarkdown(text)
+        cache.set(key, html, settings.RENDER_CACHE_TIMEOUT)
+    _set_local(sha, html)
+    return mark_safe(html)
@@ -0,0 +1,75 @@
+# coding: utf-8
+
+"""Pool of the open git repositories of the tutorials and articles.
+
+Each `Repo` starts its own `git cat-file` helper processes on its first
+read, so the repositories are kept open and reused instead of being opened
+again for every call. GitPython's helper processes can't be shared between
+threads, so each thread has its own pool of at most `REPO_POOL_SIZE`
+repositories, and the least recently used one is closed when it is full.
+"""
+
+from collections import OrderedDict
+import os
+import threading
+
+from django.conf import settings
+from git import Repo
+
+
+_pools = threading.local()
+
+
+def _get_pool():
+    pool = getattr(_pools, 'repos', None)
+    if pool is None:
+        pool = _pools.repos = OrderedDict()
+    return pool
+
+
+def _close(repo):
+    """Stop the helper processes of a repository."""
+    repo.git.clear_cache()
+
+
+def _stamp(path):
+    """Identify the git directory of a path, to notice when it's replaced.
+
+    Its modification time also changes with each commit, which reopens the
+    repository after the writes.
+    """
+    for candidate in (os.path.join(path, '.git'), path):
+        try:
+            stat = os.stat(candidate)
+        except OSError:
+            continue
+        return (stat.st_ino, stat.st_mtime)
+    return None
+
+
+def get_repo(path):
+    """Return the open repository of a path."""
+    path = os.path.abspath(path)
+    pool = _get_pool()
+    entry = pool.pop(path, None)
+
+    # The directory may have been deleted, or deleted and created again
+    stamp = _stamp(path)
+    if entry is not None and (stamp is None or entry[1] != stamp):
+        _close(entry[0])
+        entry = None
+    if entry is None:
+        entry = (Repo(path), stamp)
+
+    # the most recently used repositories are at the end
+    pool[path] = entry
+    while len(pool) > settings.REPO_POOL_SIZE:
+        _close(pool.popitem(last=False)[1][0])
+    return entry[0]
+
+
+def release_repo(path):
+    """Close the repository of a path, if it is open in this thread."""
+    entry = _get_pool().pop(os.path.abspath(path), None)
+    if entry is not None:
+        _close(entry[0])
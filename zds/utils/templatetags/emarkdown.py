@@ -2,6 +2,7 @@
 
 from django import template
 from django.utils.safestring import mark_safe
+import threading
 import time
 import re
 
@@ -12,7 +13,7 @@ from zds.utils.templatetags.smileysDef import smileys
 
 
 # Markdowns customs extensions :
-def get_markdown_instance(Inline=False):
+def new_markdown_instance(Inline=False):
     zdsext = ZdsExtension({"inline": Inline, "emoticons": smileys})
     # Generate parser
     md = markdown.Markdown(extensions=(zdsext,),
@@ -36,6 +37,34 @@ def get_markdown_instance(Inline=False):
                            )
     return md
 
+
+# Building an engine (extensions, smileys) costs more than most of the
+# conversions, so each thread keeps its block and inline engines. Some
+# extensions (abbreviations) add processors to the engine for the text
+# they convert, which reset() doesn't remove: such an engine is replaced.
+_engines = threading.local()
+
+
+def _processors(md):
+    """Return the names of the processors of an engine."""
+    return tuple(tuple(registry.keys()) for registry in (
+        md.preprocessors, md.parser.blockprocessors, md.treeprocessors,
+        md.inlinePatterns, md.postprocessors))
+
+
+def get_markdown_instance(Inline=False):
+    """Return the markdown engine of the thread, reset for a new text."""
+    engines = getattr(_engines, 'engines', None)
+    if engines is None:
+        engines = _engines.engines = {}
+    md, processors = engines.get(Inline, (None, None))
+    if md is not None and _processors(md) == processors:
+        md.reset()
+    else:
+        md = new_markdown_instance(Inline)
+        engines[Inline] = (md, _processors(md))
+    return md
+
 register = template.Library()
 
 
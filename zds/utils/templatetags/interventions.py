@@ -7,10 +7,12 @@ from django import template
 from django.db.models import Q, F
 
 from zds.article.models import never_read as never_read_article, Validation as ArticleValidation, Reaction, Article, ArticleRead
-from zds.forum.models import TopicFollowed, never_read as never_read_topic, Post, Topic, TopicRead
+from zds.forum.models import TopicFollowed, never_read as never_read_topic, Post, Topic, TopicRead, \
+    load_read_state
 from zds.mp.models import PrivateTopic, never_privateread, PrivateTopicRead
 from zds.tutorial.models import never_read as never_read_tutorial, Validation as TutoValidation, Note, Tutorial, TutorialRead
 from zds.utils.models import Alert
+from zds.utils.read_markers import get_buffered_reads
 import collections
 
 
@@ -42,6 +44,7 @@ def followed_topics(user):
     # Number is use for index for sort map easily
     period = ((1, 0), (2, 1), (3, 7), (4, 30), (5, 360))
     topics = {}
+    load_read_state([tf.topic for tf in topicsfollowed], user)
     for tf in topicsfollowed:
         for p in period:
             if tf.topic.last_message.pubdate.date() >= (datetime.now() - timedelta(days=int(p[1]),\
@@ -97,15 +100,26 @@ def interventions_topics(user):
     
     posts_unread = []
 
+    # Markers not flushed yet
+    buffered_articles = get_buffered_reads('article', user.pk)
+    buffered_tutorials = get_buffered_reads('tutorial', user.pk)
+    buffered_topics = get_buffered_reads('topic', user.pk)
+
     for art in articles_never_read:
+        if buffered_articles.get(art.article_id) == art.article.last_reaction_id:
+            continue
         content = art.article.first_unread_reaction()
         posts_unread.append({'pubdate':content.pubdate, 'author':content.author, 'title':art.article.title, 'url':content.get_absolute_url()})
     
     for tuto in tutorials_never_read:
+        if buffered_tutorials.get(tuto.tutorial_id) == tuto.tutorial.last_note_id:
+            continue
         content = tuto.tutorial.first_unread_note()
         posts_unread.append({'pubdate':content.pubdate, 'author':content.author, 'title':tuto.tutorial.title, 'url':content.get_absolute_url()})
 
     for top in topics_never_read:
+        if buffered_topics.get(top.topic_id) == top.topic.last_message_id:
+            continue
         content = top.topic.first_unread_post()
         if content is None:
             content = top.topic.last_message
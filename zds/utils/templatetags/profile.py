@@ -5,7 +5,7 @@ from django import template
 from django.contrib.auth.models import User
 
 from zds.member.models import Profile
-from zds.utils.models import Comment, CommentLike, CommentDislike
+from zds.utils.models import CommentLike, CommentDislike
 
 
 register = template.Library()
@@ -57,14 +57,20 @@ def state(user):
 
 
 @register.filter('liked')
-def liked(user, comment_pk):
-    comment = Comment.objects.get(pk=comment_pk)
-    return CommentLike.objects.filter(comments=comment, user=user).count() > 0
+def liked(user, comment):
+    vote = getattr(comment, '_vote', None)
+    if vote is not None and vote[0] == user.pk:
+        return vote[1]
+    return CommentLike.objects.filter(
+        comments__pk=getattr(comment, 'pk', comment),
+        user__pk=user.pk).exists()
 
 
 @register.filter('disliked')
-def disliked(user, comment_pk):
-    comment = Comment.objects.get(pk=comment_pk)
+def disliked(user, comment):
+    vote = getattr(comment, '_vote', None)
+    if vote is not None and vote[0] == user.pk:
+        return vote[2]
     return CommentDislike.objects.filter(
-        comments=comment,
-        user=user).count() > 0
+        comments__pk=getattr(comment, 'pk', comment),
+        user__pk=user.pk).exists()
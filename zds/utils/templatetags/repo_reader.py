@@ -3,9 +3,9 @@
 from difflib import HtmlDiff
 from django import template
 
-from git import *
-
 from zds.utils import slugify
+from zds.utils.renders import render_markdown
+from zds.utils.repositories import get_repo
 
 
 register = template.Library()
@@ -18,7 +18,7 @@ def repo_tuto(tutorial, sha=None):
         return {'introduction': tutorial.get_introduction(),
                 'conclusion': tutorial.get_conclusion()}
     else:
-        repo = Repo(tutorial.get_path())
+        repo = get_repo(tutorial.get_path())
         bls = repo.commit(sha).tree.blobs
         for bl in bls:
             if bl.path == 'introduction.md':
@@ -37,7 +37,7 @@ def repo_part(part, sha=None):
         return {'introduction': part.get_introduction(),
                 'conclusion': part.get_conclusion()}
     else:
-        repo = Repo(part['path'])
+        repo = get_repo(part['path'])
         bls = repo.commit(sha).tree.blobs
         for bl in bls:
             if bl.path == 'introduction.md':
@@ -56,7 +56,7 @@ def repo_chapter(chapter, sha=None):
         return {'introduction': chapter.get_introduction(),
                 'conclusion': chapter.get_conclusion()}
     else:
-        repo = Repo(chapter['path'])
+        repo = get_repo(chapter['path'])
         if chapter['type'] == 'MINI':
             return {'introduction': None, 'conclusion': None}
         else:
@@ -76,7 +76,7 @@ def repo_extract(extract, sha=None):
     if sha is None:
         return {'text': extract.get_text()}
     else:
-        repo_e = Repo(extract['path'])
+        repo_e = get_repo(extract['path'])
         bls_e = repo_e.commit(sha).tree.blobs
 
         for bl in bls_e:
@@ -93,6 +93,12 @@ def repo_blob(blob):
     return contenu.decode('utf-8')
 
 
+@register.filter('repo_markdown')
+def repo_markdown(text):
+    """Render a markdown file of a repository, its HTML is cached."""
+    return render_markdown(text)
+
+
 @register.filter('diff_text')
 def diff_text(text1, text2="", title1="", title2=""):
     txt1 = text1.splitlines(1)
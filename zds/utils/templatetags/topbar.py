@@ -1,12 +1,10 @@
 # coding: utf-8
 
 from django import template
-from django.conf import settings
-from django.db.models import Count
-import itertools
-from zds.forum.models import Category as fCategory, Forum, Topic
+from zds.forum.models import Forum, get_readable_forums, get_top_tags, \
+    get_forum_menu_key
 from zds.tutorial.models import Tutorial
-from zds.utils.models import Category, SubCategory, CategorySubCategory, Tag
+from zds.utils.models import Category, SubCategory, CategorySubCategory
 
 
 register = template.Library()
@@ -16,15 +14,10 @@ register = template.Library()
 def top_categories(user):
     cats = {}
     
-    forums_pub = Forum.objects.filter(group__isnull=True).select_related("category").all()
-    if user and user.is_authenticated():
-        forums_prv = Forum\
-                    .objects\
-                    .filter(group__isnull=False, group__in=user.groups.all())\
-                    .select_related("category").all()
-        forums = list(forums_pub|forums_prv)
-    else :
-        forums = list(forums_pub)
+    forums = list(Forum.objects
+                  .filter(pk__in=get_readable_forums(user))
+                  .select_related("category", "last_post__topic")
+                  .order_by("position_in_category"))
     
     for forum in forums:
         key = forum.category.title
@@ -32,33 +25,16 @@ def top_categories(user):
             cats[key].append(forum)
         else:
             cats[key] = [forum]
-    
-    topics = Topic.objects.filter(forum__in=forums)
-    tgs = Topic.objects\
-        .values('tags', 'pk')\
-        .distinct()\
-        .filter(forum__in=forums, tags__isnull=False)
-    
-    #for tg in tgs:
-    #    print tg
-    cts = {}
-    for key, group in itertools.groupby(tgs, lambda item: item["tags"]):
-        for thing in group:
-            if key in cts: cts[key]+=1
-            else: cts[key]=1
 
-    cpt=0
-    top_tag =[]
-    sort_list = reversed(sorted(cts.iteritems(), key=lambda (k,v): (v,k)))
-    for key, value in sort_list:
-        top_tag.append(key)
-        cpt+=1
-        if cpt >=settings.TOP_TAG_MAX : break
-    
-    tags=Tag.objects.filter(pk__in=top_tag)
-    
+    tags = get_top_tags([forum.pk for forum in forums])
+
     return {"tags":tags, "categories":cats}
 
+
+@register.filter('forum_menu_key')
+def forum_menu_key(user):
+    return get_forum_menu_key(user)
+
 @register.filter('top_categories_tuto')
 def top_categories_tuto(user):
     
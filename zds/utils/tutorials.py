@@ -2,12 +2,19 @@
 
 from collections import OrderedDict
 from datetime import datetime
+import hashlib
 import os
+import shutil
+import subprocess
+import tempfile
+import time
+from django.conf import settings
+from django.db.models import F
 from django.template import Context
 from django.template.loader import get_template
+from django.utils import timezone
 from git import *
 
-from zds.utils import slugify
 
 # Export-to-dict functions
 def export_chapter(chapter, export_all=True):
@@ -89,43 +96,96 @@ def export_tutorial(tutorial):
     return dct
 
 
-def get_blob(tree, chemin):
-    for bl in tree.blobs:
-        try:
-            if os.path.abspath(bl.path) == os.path.abspath(chemin):
-                data = bl.data_stream.read()
-                return data.decode('utf-8')
-        except:
-            return ""
-    if len(tree.trees) > 0:
-        for tr in tree.trees:
-            result = get_blob(tr, chemin)
-            if result is not None:
-                return result
+def find_blob(tree, chemin):
+    """Return the blob at the given path of a tree, None if there is no
+    file at this path."""
+    try:
+        item = tree[os.path.normpath(chemin)]
+    except KeyError:
         return None
-    else:
+    if item.type != 'blob':
+        return None
+    return item
+
+
+def get_blob(tree, chemin):
+    """Return the content of the file at the given path of a tree."""
+    blob = find_blob(tree, chemin)
+    if blob is None:
         return None
+    try:
+        return blob.data_stream.read().decode('utf-8')
+    except:
+        return ""
+
+
+class CommitReader(object):
+
+    """Read the files of a commit.
+
+    The tree of the commit is resolved once, and `read_many()` fetches the
+    files of several paths with a single `git cat-file --batch` call
+    instead of one object lookup per file.
+    """
+
+    def __init__(self, repo, sha):
+        self.repo = repo
+        self.tree = repo.commit(sha).tree
+
+    def read(self, chemin):
+        return get_blob(self.tree, chemin)
+
+    def read_many(self, chemins):
+        """Return a dict mapping each path to the content of its file, or
+        to None if there is no file at this path."""
+        shas = {}
+        for chemin in chemins:
+            blob = find_blob(self.tree, chemin)
+            if blob is not None:
+                shas[chemin] = blob.hexsha
+        contents = self._cat_files(list(set(shas.values())))
+        return dict((chemin, contents.get(shas.get(chemin)))
+                    for chemin in chemins)
+
+    def _cat_files(self, hexshas):
+        if not hexshas:
+            return {}
+        process = subprocess.Popen(
+            ['git', '--git-dir', self.repo.git_dir, 'cat-file', '--batch'],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE)
+        output = process.communicate('\n'.join(hexshas) + '\n')[0]
+
+        # Each object is "<sha> <type> <size>\n<content>\n", in the order
+        # of the request
+        contents = {}
+        pos = 0
+        for hexsha in hexshas:
+            end = output.index('\n', pos)
+            header = output[pos:end].split()
+            pos = end + 1
+            if header[1] == 'missing':
+                continue
+            size = int(header[2])
+            try:
+                contents[hexsha] = output[pos:pos + size].decode('utf-8')
+            except UnicodeDecodeError:
+                contents[hexsha] = ""
+            pos += size + 1
+        return contents
 
 
 def export_tutorial_to_md(tutorial):
-    # Two variables to handle two distinct cases (large/small tutorial)
-    chapter = None
-    parts = None
-    tuto = OrderedDict()
+    from zds.tutorial.contents import build_tree, ProductionTexts
 
-    i = open(
-        os.path.join(
-            tutorial.get_prod_path(),
-            tutorial.introduction),
-        "r")
-    i_contenu = i.read()
-    i.close()
-    tuto['intro'] = i_contenu
+    # The tree of the public version, with the markdown files of the
+    # production directory
+    tree = build_tree(tutorial.load_json(online=True), tutorial.pk,
+                      ProductionTexts(tutorial.get_prod_path(), ""))
 
-    c = open(os.path.join(tutorial.get_prod_path(), tutorial.conclusion), "r")
-    c_contenu = c.read()
-    c.close()
-    tuto['conclu'] = c_contenu
+    tuto = OrderedDict()
+    tuto['intro'] = tree.intro
+    tuto['conclu'] = tree.conclu
 
     tuto['image'] = tutorial.image
     tuto['title'] = tutorial.title
@@ -137,103 +197,9 @@ def export_tutorial_to_md(tutorial):
     tuto['pk'] = tutorial.pk
     tuto['slug'] = tutorial.slug
 
-    # find the good manifest file
-    mandata = tutorial.load_json(online=True)
-
-    # If it's a small tutorial, fetch its chapter
-    if tutorial.type == 'MINI':
-        if 'chapter' in mandata:
-            chapter = mandata['chapter']
-            chapter['path'] = tutorial.get_prod_path()
-            chapter['type'] = 'MINI'
-            intro = open(
-                os.path.join(
-                    tutorial.get_prod_path(),
-                    mandata['introduction']),
-                "r")
-            chapter['intro'] = intro.read()
-            intro.close()
-            conclu = open(
-                os.path.join(
-                    tutorial.get_prod_path(),
-                    mandata['conclusion']),
-                "r")
-            chapter['conclu'] = conclu.read()
-            conclu.close()
-            cpt = 1
-            for ext in chapter['extracts']:
-                ext['position_in_chapter'] = cpt
-                ext['path'] = tutorial.get_prod_path()
-                text = open(
-                    os.path.join(
-                        tutorial.get_prod_path(),
-                        ext['text']),
-                    "r")
-                ext['txt'] = text.read()
-                text.close()
-                cpt += 1
-        else:
-            chapter = None
-    else:
-        parts = mandata['parts']
-        cpt_p = 1
-        for part in parts:
-            part['tutorial'] = tutorial
-            part['path'] = tutorial.get_path()
-            part['slug'] = slugify(part['title'])
-            part['position_in_tutorial'] = cpt_p
-            intro = open(
-                os.path.join(
-                    tutorial.get_prod_path(),
-                    part['introduction']),
-                "r")
-            part['intro'] = intro.read()
-            intro.close()
-            conclu = open(
-                os.path.join(
-                    tutorial.get_prod_path(),
-                    part['conclusion']),
-                "r")
-            part['conclu'] = conclu.read()
-            conclu.close()
-
-            cpt_c = 1
-            for chapter in part['chapters']:
-                chapter['part'] = part
-                chapter['path'] = tutorial.get_path()
-                chapter['slug'] = slugify(chapter['title'])
-                chapter['type'] = 'BIG'
-                chapter['position_in_part'] = cpt_c
-                chapter['position_in_tutorial'] = cpt_c * cpt_p
-                intro = open(
-                    os.path.join(
-                        tutorial.get_prod_path(),
-                        chapter['introduction']),
-                    "r")
-                chapter['intro'] = intro.read()
-                intro.close()
-                conclu = open(
-                    os.path.join(
-                        tutorial.get_prod_path(),
-                        chapter['conclusion']),
-                    "r")
-                chapter['conclu'] = conclu.read()
-                cpt_e = 1
-                for ext in chapter['extracts']:
-                    ext['chapter'] = chapter
-                    ext['position_in_chapter'] = cpt_e
-                    ext['path'] = tutorial.get_path()
-                    text = open(
-                        os.path.join(
-                            tutorial.get_prod_path(),
-                            ext['text']),
-                        "r")
-                    ext['txt'] = text.read()
-                    text.close()
-                    cpt_e += 1
-                cpt_c += 1
-
-            cpt_p += 1
+    # Two variables to handle two distinct cases (large/small tutorial)
+    chapter = tree.chapter if tutorial.type == 'MINI' else None
+    parts = tree.parts if tutorial.type != 'MINI' else None
 
     contenu_html = get_template('tutorial/export.md').render(
         Context({
@@ -290,3 +256,200 @@ def move(obj, new_pos, position_f, parent_f, children_fn):
     setattr(obj, position_f, new_pos)
 
 
+
+
+def get_pandoc_options(export_format):
+    """Return the options of pandoc for an export format."""
+    if export_format == "pdf":
+        template = os.path.join(settings.SITE_ROOT, "assets", "tex",
+                                "template.tex")
+        return ["--latex-engine=xelatex", "--template=" + template,
+                "-s", "-S", "-N", "--toc",
+                "-V", "documentclass=scrbook", "-V", "lang=francais",
+                "-V", "mainfont=Verdana", "-V", "monofont=Andale Mono",
+                "-V", "fontsize=12pt", "-V", "geometry:margin=1in"]
+    elif export_format == "html":
+        return ["--latex-engine=xelatex", "-s", "-S", "--toc"]
+    else:
+        return ["-s", "-S", "--toc"]
+
+
+def get_pandoc_command(job):
+    """Return the pandoc command building the export of a job."""
+    tutorial = job.tutorial
+    source = os.path.join(tutorial.get_prod_path(), tutorial.slug + ".md")
+    return [settings.PANDOC_LOC + "pandoc"] \
+        + get_pandoc_options(job.format) \
+        + [source, "-o", job.get_build_path()]
+
+
+def get_export_digest(md_text, export_format):
+    """Return the digest of an export: the same markdown, exported with the
+    same options and template, gives the same file."""
+    digest = hashlib.sha256()
+    digest.update(export_format + "\0")
+    for option in get_pandoc_options(export_format):
+        digest.update(option.encode("utf-8") + "\0")
+        if option.startswith("--template="):
+            with open(option[len("--template="):], "rb") as template:
+                digest.update(template.read())
+    if isinstance(md_text, unicode):
+        md_text = md_text.encode("utf-8")
+    digest.update(md_text)
+    return digest.hexdigest()
+
+
+def link_or_copy(source, target):
+    """Put a file at `target` at once, as a hard link to `source` or a copy
+    of it when it can't be linked."""
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(target), prefix=".")
+    os.close(fd)
+    os.remove(tmp_path)
+    try:
+        os.link(source, tmp_path)
+    except OSError:
+        shutil.copyfile(source, tmp_path)
+    os.rename(tmp_path, target)
+
+
+def store_export_artifact(job):
+    """Keep the export built by a job in the store of the exports."""
+    if not job.digest:
+        return
+    if not os.path.isdir(settings.EXPORT_ARTIFACTS_PATH):
+        os.makedirs(settings.EXPORT_ARTIFACTS_PATH)
+    link_or_copy(job.get_build_path(), job.get_artifact_path())
+
+
+def install_export_artifact(job):
+    """Put the stored export of the content of a job in the production
+    directory. Return False if this content was never exported."""
+    artifact_path = job.get_artifact_path()
+    if not job.digest or not os.path.isfile(artifact_path):
+        return False
+    # an export in use isn't collected by clean_export_artifacts()
+    os.utime(artifact_path, None)
+    link_or_copy(artifact_path, job.get_path())
+    return True
+
+
+def clean_export_artifacts(max_age=None):
+    """Remove the stored exports unused for `max_age` seconds, except the
+    ones of the published versions. Return the number of files removed."""
+    from zds.tutorial.models import ExportJob
+
+    if max_age is None:
+        max_age = settings.EXPORT_ARTIFACTS_MAX_AGE
+    if not os.path.isdir(settings.EXPORT_ARTIFACTS_PATH):
+        return 0
+    published = set(ExportJob.objects
+                    .filter(status="SUCCESS", sha=F("tutorial__sha_public"))
+                    .exclude(digest="")
+                    .values_list("digest", flat=True))
+    limit = time.time() - max_age
+    nb_removed = 0
+    for filename in os.listdir(settings.EXPORT_ARTIFACTS_PATH):
+        path = os.path.join(settings.EXPORT_ARTIFACTS_PATH, filename)
+        if filename.split(".")[0] in published \
+                or os.path.getmtime(path) > limit:
+            continue
+        os.remove(path)
+        nb_removed += 1
+    return nb_removed
+
+
+def finish_export_job(job, success, log):
+    """Move the export built by a job in the production directory, and
+    save the result of the job."""
+    if not job.get_claim().exists():
+        # another worker runs the job again, it's his
+        if os.path.isfile(job.get_build_path()):
+            os.remove(job.get_build_path())
+        return
+    if success and not os.path.isfile(job.get_build_path()):
+        success = False
+    job.status = "FAILURE"
+    if success:
+        try:
+            store_export_artifact(job)
+            if job.is_obsolete():
+                job.status = "CANCELED"
+            else:
+                os.rename(job.get_build_path(), job.get_path())
+                job.status = "SUCCESS"
+        except (IOError, OSError) as e:
+            # the production directory may have been removed meanwhile
+            log += u"\n" + unicode(e)
+    if job.status != "SUCCESS" and os.path.isfile(job.get_build_path()):
+        os.remove(job.get_build_path())
+
+    if settings.PANDOC_LOG_STATE:
+        with open(settings.PANDOC_LOG, "a") as pandoc_log:
+            pandoc_log.write(log.encode("utf-8"))
+    job.log = log[-settings.EXPORT_LOG_LENGTH:]
+    job.date_end = timezone.now()
+    job.get_claim().update(status=job.status, log=job.log,
+                           date_end=job.date_end)
+
+
+def run_export_jobs(limit=None):
+    """Run the pending export jobs, and the ones left running by a stopped
+    worker, with at most `EXPORT_MAX_PROCESSES` pandoc processes at once.
+    Return the number of jobs run."""
+    from zds.tutorial.models import ExportJob, claimable_export_jobs
+
+    jobs = ExportJob.objects\
+        .filter(claimable_export_jobs())\
+        .select_related("tutorial")\
+        .order_by("pk")
+    if limit is not None:
+        jobs = jobs[:limit]
+    pending = list(jobs)
+    running = []
+    nb_jobs = 0
+    while pending or running:
+        while pending and len(running) < settings.EXPORT_MAX_PROCESSES:
+            job = pending.pop(0)
+            if not job.claim():
+                continue
+            nb_jobs += 1
+
+            # the same content may have been exported since the job was asked
+            if not job.is_obsolete() and install_export_artifact(job):
+                job.status = "SUCCESS"
+                job.log = u"Export déjà généré pour ce contenu"
+                job.date_end = timezone.now()
+                job.save()
+                continue
+            output = tempfile.TemporaryFile()
+            try:
+                process = subprocess.Popen(get_pandoc_command(job),
+                                           cwd=job.tutorial.get_prod_path(),
+                                           stdout=output,
+                                           stderr=subprocess.STDOUT)
+            except OSError as e:
+                output.close()
+                finish_export_job(job, False, unicode(e))
+                continue
+            deadline = time.time() + settings.EXPORT_TIMEOUT
+            running.append((job, process, output, deadline))
+
+        for entry in list(running):
+            job, process, output, deadline = entry
+            if process.poll() is None and time.time() < deadline:
+                continue
+            running.remove(entry)
+            message = u""
+            if process.poll() is None:
+                process.kill()
+                process.wait()
+                message = u"\nInterrompu après {0} secondes".format(
+                    settings.EXPORT_TIMEOUT)
+            output.seek(0)
+            log = output.read().decode("utf-8", "replace") + message
+            output.close()
+            finish_export_job(job, process.returncode == 0 and not message,
+                              log)
+        if running:
+            time.sleep(0.1)
+    return nb_jobs